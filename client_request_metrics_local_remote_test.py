@@ -1,5 +1,5 @@
 from dtest import Tester, create_ks
-from tools.jmxutils import JolokiaAgent, make_mbean
+from tools.metrics import snapshot_family
 import pytest
 
 since = pytest.mark.since
@@ -11,12 +11,8 @@ class TestClientRequestMetricsLocalRemote(Tester):
     def test_write_and_read(self):
         session, node = setup_test(self)
 
-        read_metrics = ClientRequestMetricsContainer(node, 'Read')
-        write_metrics = ClientRequestMetricsContainer(node, 'Write')
-
         # Get initial results:
-        r1_r = ClientRequestMetricsSnapshot(read_metrics)
-        r1_w = ClientRequestMetricsSnapshot(write_metrics)
+        r1_r, r1_w = take_snapshots(self, node)
 
         # Run Write test:
         for i in murmur3_hashes.keys():
@@ -25,8 +21,7 @@ class TestClientRequestMetricsLocalRemote(Tester):
             )
 
         # Collect results:
-        r2_r = ClientRequestMetricsSnapshot(read_metrics)
-        r2_w = ClientRequestMetricsSnapshot(write_metrics)
+        r2_r, r2_w = take_snapshots(self, node)
 
         # Run Read test:
         for i in murmur3_hashes.keys():
@@ -35,8 +30,7 @@ class TestClientRequestMetricsLocalRemote(Tester):
             )
 
         # Collect results:
-        r3_r = ClientRequestMetricsSnapshot(read_metrics)
-        r3_w = ClientRequestMetricsSnapshot(write_metrics)
+        r3_r, r3_w = take_snapshots(self, node)
 
         assert 0 <= (r2_w.remote_requests - r1_w.remote_requests)
         assert 0 <= (r2_r.local_requests - r1_r.local_requests)
@@ -49,12 +43,8 @@ class TestClientRequestMetricsLocalRemote(Tester):
     def test_batch_and_slice(self):
         session, node = setup_test(self)
 
-        read_metrics = ClientRequestMetricsContainer(node, 'Read')
-        write_metrics = ClientRequestMetricsContainer(node, 'Write')
-
         # Get initial results:
-        r1_r = ClientRequestMetricsSnapshot(read_metrics)
-        r1_w = ClientRequestMetricsSnapshot(write_metrics)
+        r1_r, r1_w = take_snapshots(self, node)
 
         # Run batch test:
         query = 'BEGIN BATCH '
@@ -65,8 +55,7 @@ class TestClientRequestMetricsLocalRemote(Tester):
         session.execute(query)
 
         # Collect results:
-        r2_r = ClientRequestMetricsSnapshot(read_metrics)
-        r2_w = ClientRequestMetricsSnapshot(write_metrics)
+        r2_r, r2_w = take_snapshots(self, node)
 
         # Run read range test:
         for i in murmur3_hashes.keys():
@@ -77,8 +66,7 @@ class TestClientRequestMetricsLocalRemote(Tester):
                             AND ord < 100;
                             """.format(i))
         # Collect results:
-        r3_r = ClientRequestMetricsSnapshot(read_metrics)
-        r3_w = ClientRequestMetricsSnapshot(write_metrics)
+        r3_r, r3_w = take_snapshots(self, node)
 
         assert 0 <= (r2_w.remote_requests - r1_w.remote_requests)
         assert 0 <= (r2_r.local_requests - r1_r.local_requests)
@@ -91,12 +79,8 @@ class TestClientRequestMetricsLocalRemote(Tester):
     def test_paxos(self):
         session, node = setup_test(self)
 
-        read_metrics = ClientRequestMetricsContainer(node, 'Read')
-        write_metrics = ClientRequestMetricsContainer(node, 'Write')
-
         # Get initial results:
-        r1_r = ClientRequestMetricsSnapshot(read_metrics)
-        r1_w = ClientRequestMetricsSnapshot(write_metrics)
+        r1_r, r1_w = take_snapshots(self, node)
 
         # Run write test:
         for i in murmur3_hashes.keys():
@@ -105,8 +89,7 @@ class TestClientRequestMetricsLocalRemote(Tester):
             )
 
         # Collect results:
-        r2_r = ClientRequestMetricsSnapshot(read_metrics)
-        r2_w = ClientRequestMetricsSnapshot(write_metrics)
+        r2_r, r2_w = take_snapshots(self, node)
 
         assert 0 <= (r2_w.remote_requests - r1_w.remote_requests)
         assert 0 <= (r2_r.local_requests - r1_r.local_requests)
@@ -137,39 +120,19 @@ murmur3_hashes = {
 }
 
 
-class ClientRequestMetricsContainer:
-
-    def __init__(self, node, scope):
-        self.node = node
-
-        self.local_requests_mbean = make_mbean(
-            'metrics',
-            type='ClientRequest',
-            scope=scope,
-            name='LocalRequests'
-        )
-
-        self.remote_requests_mbean = make_mbean(
-            'metrics',
-            type='ClientRequest',
-            scope=scope,
-            name='RemoteRequests'
-        )
-
-    def get_local_requests(self):
-        with JolokiaAgent(self.node) as jmx:
-            return jmx.read_attribute(self.local_requests_mbean, 'Count')
-
-    def get_remote_requests(self):
-        with JolokiaAgent(self.node) as jmx:
-            return jmx.read_attribute(self.remote_requests_mbean, 'Count')
+class ClientRequestMetricsSnapshot:
 
+    def __init__(self, metrics, node, scope):
+        self.local_requests = metrics.value(node, scope, 'LocalRequests')
+        self.remote_requests = metrics.value(node, scope, 'RemoteRequests')
 
-class ClientRequestMetricsSnapshot:
 
-    def __init__(self, client_request_metrics):
-        self.local_requests = client_request_metrics.get_local_requests()
-        self.remote_requests = client_request_metrics.get_remote_requests()
+def take_snapshots(obj, node):
+    """
+    @return The read and write ClientRequestMetricsSnapshot of a node, from a single read of its metrics
+    """
+    metrics = snapshot_family(obj.cluster, 'ClientRequest', nodes=[node])
+    return ClientRequestMetricsSnapshot(metrics, node, 'Read'), ClientRequestMetricsSnapshot(metrics, node, 'Write')
 
 
 def setup_schema(session):
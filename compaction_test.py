@@ -11,6 +11,7 @@ import logging
 
 from dtest import Tester, create_ks
 from tools.assertions import assert_length_equal, assert_none, assert_one
+from tools.metrics import take_snapshot
 
 since = pytest.mark.since
 logger = logging.getLogger(__name__)
@@ -70,34 +71,21 @@ class TestCompaction(Tester):
         Insert data and check data size before and after a compaction.
         """
         cluster = self.cluster
-        cluster.populate(1).start()
+        cluster.populate(1)
         [node1] = cluster.nodelist()
 
-        stress_write(node1)
+        self.data_snapshots.restore_or_build(cluster, 'keyspace1.standard1', ('stress write', 100000),
+                                             lambda: stress_write(node1))
 
         node1.flush()
 
-        table_name = 'standard1'
-        output = node1.nodetool('cfstats').stdout
-        if output.find(table_name) != -1:
-            output = output[output.find(table_name):]
-            output = output[output.find("Space used (live)"):]
-            initialValue = int(output[output.find(":") + 1:output.find("\n")].strip())
-        else:
-            logger.debug("datasize not found")
-            logger.debug(output)
+        initialValue = take_snapshot(cluster, keyspace='keyspace1').table('node1', 'keyspace1', 'standard1').live_disk_space_used
 
         node1.flush()
         node1.compact()
         node1.wait_for_compactions()
 
-        output = node1.nodetool('cfstats').stdout
-        if output.find(table_name) != -1:
-            output = output[output.find(table_name):]
-            output = output[output.find("Space used (live)"):]
-            finalValue = int(output[output.find(":") + 1:output.find("\n")].strip())
-        else:
-            logger.debug("datasize not found")
+        finalValue = take_snapshot(cluster, keyspace='keyspace1').table('node1', 'keyspace1', 'standard1').live_disk_space_used
         # allow 5% size increase - if we have few sstables it is not impossible that live size increases *slightly* after compaction
         assert finalValue < initialValue * 1.05
 
@@ -122,14 +110,19 @@ class TestCompaction(Tester):
             min_bf_size = 100000
             max_bf_size = 150000
         cluster = self.cluster
-        cluster.populate(1).start()
+        cluster.populate(1)
         [node1] = cluster.nodelist()
 
-        for x in range(0, 5):
-            node1.stress(['write', 'n=100K', "no-warmup", "cl=ONE", "-rate",
-                          "threads=300", "-schema", "replication(factor=1)",
-                          "compaction({},enabled=false)".format(strategy_string)])
-            node1.flush()
+        def write_sstables():
+            for x in range(0, 5):
+                node1.stress(['write', 'n=100K', "no-warmup", "cl=ONE", "-rate",
+                              "threads=300", "-schema", "replication(factor=1)",
+                              "compaction({},enabled=false)".format(strategy_string)])
+                node1.flush()
+
+        # autocompaction is disabled in the schema, so the 5 sstables survive the restart of a restore
+        self.data_snapshots.restore_or_build(cluster, 'keyspace1.standard1 compaction({},enabled=false)'.format(strategy_string),
+                                             ('stress write flush', 5, 100000), write_sstables)
 
         node1.nodetool('enableautocompaction')
         node1.wait_for_compactions()
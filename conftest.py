@@ -6,25 +6,31 @@ except ImportError:
 import logging
 import os
 import platform
-import re
 import shutil
+import tempfile
 import time
 from datetime import datetime
 from distutils.version import LooseVersion
 # Python 3 imports
 from itertools import zip_longest
 
-import ccmlib.repository
 import netifaces as ni
 import pytest
-from ccmlib.common import validate_install_dir, is_win, get_version_from_build
+from ccmlib.common import validate_install_dir
 from netifaces import AF_INET
-from psutil import virtual_memory
 
 from dtest import running_in_docker, cleanup_docker_environment_before_test_execution
-from dtest_config import DTestConfig
+from dtest_cluster_pool import ClusterPool
+from dtest_config import get_dtest_config, resolve_version_from_build
+from dtest_parallel import (current_worker_slot, declared_test_resources, ResourceScheduler,
+                            RESOURCE_INTENSIVE_NODES, RESOURCE_INTENSIVE_MEMORY_GB_PER_NODE)
 from dtest_setup import DTestSetup
 from dtest_setup_overrides import DTestSetupOverrides
+from tools.datasnapshots import DataSnapshots
+from tools.logarchive import LogArchiver
+from tools.logscanner import filter_errors
+from tools.logwatch import close_log_buses
+from tools.management import close_management_clients
 from upgrade_tests import upgrade_manifest
 
 logger = logging.getLogger(__name__)
@@ -76,6 +82,12 @@ def pytest_addoption(parser):
                           "pull the required artifacts for this version.")
     parser.addoption("--delete-logs", action="store_true", default=False,
                      help="Delete all generated logs created by a test after the completion of a test.")
+    parser.addoption("--compress-logs", action="store_true", default=False,
+                     help="Compress the saved logs of every test in the background (with zstd if the zstandard "
+                          "module is installed, gzip otherwise)")
+    parser.addoption("--logs-max-size-mb", action="store", default=None,
+                     help="Size budget of the saved logs directory, the oldest saved logs are removed first when "
+                          "it is exceeded")
     parser.addoption("--execute-upgrade-tests", action="store_true", default=False,
                      help="Execute Cassandra Upgrade Tests (e.g. tests annotated with the upgrade_test mark)")
     parser.addoption("--execute-upgrade-tests-only", action="store_true", default=False,
@@ -90,12 +102,28 @@ def pytest_addoption(parser):
     parser.addoption("--keep-failed-test-dir", action="store_true", default=False,
                      help="Do not remove/cleanup the test ccm cluster directory and it's artifacts "
                           "after the test fails")
+    parser.addoption("--cache-cql-connections", action="store_true", default=False,
+                     help="Reuse the driver session of an earlier cql_connection/exclusive_cql_connection call "
+                          "(and their patient variants) to the same node with the same arguments, instead of "
+                          "connecting again every time")
+    parser.addoption("--copy-benchmark-history", action="store", default=None,
+                     help="Run the cqlsh COPY benchmarks, appending their throughput and peak memory to this JSON "
+                          "file, and fail those whose throughput regressed against the previous runs recorded in it")
+    parser.addoption("--copy-benchmark-regression-threshold", action="store", default="0.2",
+                     help="Fraction of the baseline throughput below which a COPY benchmark fails")
+    parser.addoption("--use-cluster-pool", action="store_true", default=False,
+                     help="Reuse already started clusters between tests marked with reusable_cluster instead of "
+                          "creating a new cluster for every test. A cluster is only reused by a test asking for the "
+                          "same shape and configuration, and only if the previous test passed")
     parser.addoption("--enable-jacoco-code-coverage", action="store_true", default=False,
                      help="Enable JaCoCo Code Coverage Support")
     parser.addoption("--upgrade-version-selection", action="store", default="indev",
                      help="Specify whether to run indev, releases, or both")
     parser.addoption("--upgrade-target-version-only", action="store_true", default=False,
                      help="When running upgrade tests, only run tests upgrading to the current version")
+    parser.addoption("--upgrade-staging-workers", action="store", default="4",
+                     help="Number of upgrade versions fetched and built at the same time before the upgrade tests "
+                          "start, 0 to leave fetching and building them to the tests")
     parser.addoption("--metatests", action="store_true", default=False,
                      help="Run only meta tests")
 
@@ -103,19 +131,36 @@ def pytest_addoption(parser):
 def pytest_configure(config):
     """Fail fast if arguments are invalid"""
     if not config.getoption("--help"):
-        dtest_config = DTestConfig()
-        dtest_config.setup(config)
+        dtest_config = get_dtest_config(config)
         upgrade_manifest.set_config(config)
         if dtest_config.metatests and config.args[0] == str(os.getcwd()):
             config.args = ['./meta_tests']
 
 
 def sufficient_system_resources_for_resource_intensive_tests():
-    mem = virtual_memory()
-    total_mem_gb = mem.total / 1024 / 1024 / 1024
-    logger.info("total available system memory is %dGB" % total_mem_gb)
-    # todo kjkj: do not hard code our bound.. for now just do 9 instances at 3gb a piece
-    return total_mem_gb >= 9 * 3
+    scheduler = ResourceScheduler(current_worker_slot())
+    logger.info("total available system memory is %dGB" % scheduler.capacity_gb)
+    return scheduler.can_ever_admit(RESOURCE_INTENSIVE_NODES * RESOURCE_INTENSIVE_MEMORY_GB_PER_NODE)
+
+
+@pytest.fixture(scope='session')
+def fixture_resource_scheduler():
+    """
+    :return: The ResourceScheduler deciding when this worker may start the cluster of its next test
+    """
+    return ResourceScheduler(current_worker_slot())
+
+
+@pytest.fixture(scope='function')
+def fixture_resource_admission(request, fixture_resource_scheduler):
+    """
+    When running tests in parallel, blocks until the machine has enough memory left for the
+    nodes the test declared (see the cluster_resources mark) and holds on to it until the test ends.
+    """
+    _, memory_gb = declared_test_resources(request.node)
+    fixture_resource_scheduler.acquire(memory_gb)
+    yield
+    fixture_resource_scheduler.release()
 
 
 @pytest.fixture(scope='function', autouse=True)
@@ -223,21 +268,17 @@ def fixture_log_test_name_and_date(request, fixture_logging_setup):
 
 def _filter_errors(dtest_setup, errors):
     """Filter errors, removing those that match ignore_log_patterns in the current DTestSetup"""
-    for e in errors:
-        e = repr(e)
-        for pattern in dtest_setup.ignore_log_patterns:
-            if re.search(pattern, e) or re.search(pattern, e.replace('\n', ' ')):
-                break
-        else:
-            yield e
+    return filter_errors((repr(e) for e in errors), dtest_setup.ignore_log_patterns)
 
 
 def check_logs_for_errors(dtest_setup):
     all_errors = []
+    # the log scanner only reads what was logged since its last scan (e.g. by active log watching)
+    errors_by_node = dtest_setup.log_scanner.errors()
     for node in dtest_setup.cluster.nodelist():
-        if not os.path.exists(node.logfilename()):
+        if node.name not in errors_by_node:
             continue
-        errors = list(_filter_errors(dtest_setup, ['\n'.join(msg) for msg in node.grep_log_for_errors()]))
+        errors = list(_filter_errors(dtest_setup, ['\n'.join(msg) for msg in errors_by_node[node.name]]))
         if len(errors) != 0:
             for error in errors:
                 if isinstance(error, (bytes, bytearray)):
@@ -250,11 +291,16 @@ def check_logs_for_errors(dtest_setup):
     return all_errors
 
 
-def copy_logs(request, cluster, directory=None, name=None):
-    """Copy the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'"""
-    log_saved_dir = "logs"
+def copy_logs(request, cluster, directory=None, name=None, archiver=None, allow_hardlink=False):
+    """
+    Save the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'.
+
+    Logs are linked rather than copied where possible, so allow_hardlink must only be set
+    when the cluster's logs won't be written to anymore (i.e. the cluster is about to be removed).
+    """
+    log_saved_dir = current_worker_slot().log_saved_dir
     try:
-        os.mkdir(log_saved_dir)
+        os.makedirs(log_saved_dir)
     except OSError:
         pass
 
@@ -268,31 +314,29 @@ def copy_logs(request, cluster, directory=None, name=None):
         os.mkdir(directory)
 
     basedir = str(int(time.time() * 1000)) + '_' + request.node.name
-    logdir = os.path.join(directory, basedir)
 
-    any_file = False
+    files = []
     for node in cluster.nodes.values():
         nodelogdir = node.log_directory()
         for f in os.listdir(nodelogdir):
             file = os.path.join(nodelogdir, f)
             if os.path.isfile(file):
-                if not any_file:
-                    os.mkdir(logdir)
-                    any_file = True
-
                 if f == 'system.log':
                     target_name = node.name + '.log'
                 elif f == 'gc.log.0.current':
                     target_name = node.name + '_gc.log'
                 else:
                     target_name = node.name + '_' + f
-                shutil.copyfile(file, os.path.join(logdir, target_name))
+                files.append((file, target_name))
 
-    if any_file:
-        if os.path.exists(name):
-            os.unlink(name)
-        if not is_win():
-            os.symlink(basedir, name)
+    if archiver is None:
+        archiver = LogArchiver(directory)
+        try:
+            archiver.archive(files, basedir, last_link=name, allow_hardlink=allow_hardlink)
+        finally:
+            archiver.close()
+    else:
+        archiver.archive(files, basedir, last_link=name, allow_hardlink=allow_hardlink, directory=directory)
 
 
 def reset_environment_vars(initial_environment):
@@ -319,13 +363,60 @@ def pytest_runtest_makereport(item, call):
     return rep
 
 
+@pytest.fixture(scope='session')
+def fixture_log_archiver(dtest_config):
+    """
+    :return: The LogArchiver saving the logs of every test, compressing them and evicting old
+             ones in the background when asked to
+    """
+    log_archiver = LogArchiver(current_worker_slot().log_saved_dir,
+                               compress=dtest_config.compress_logs,
+                               max_size_mb=dtest_config.logs_max_size_mb)
+    yield log_archiver
+    log_archiver.close()
+
+
+@pytest.fixture(scope='session')
+def fixture_cluster_pool(dtest_config):
+    """
+    :return: The ClusterPool shared by all tests marked with reusable_cluster, or None
+             if --use-cluster-pool was not given
+    """
+    if not dtest_config.use_cluster_pool:
+        yield None
+        return
+
+    cluster_pool = ClusterPool()
+    yield cluster_pool
+    logger.info("cluster pool finished with {hits} hits and {misses} misses".format(hits=cluster_pool.hits,
+                                                                                    misses=cluster_pool.misses))
+    cluster_pool.close()
+
+
+@pytest.fixture(scope='session')
+def fixture_data_snapshots():
+    """
+    :return: The DataSnapshots holding the baseline datasets written by the tests of this session
+    """
+    # next to the test clusters, so that sstables can be hardlinked between them
+    data_snapshots = DataSnapshots(tempfile.mkdtemp(prefix='dtest-data-snapshots-'))
+    yield data_snapshots
+    logger.info("data snapshots finished with {hits} hits and {misses} misses".format(hits=data_snapshots.hits,
+                                                                                      misses=data_snapshots.misses))
+    shutil.rmtree(data_snapshots.root, ignore_errors=True)
+
+
 @pytest.fixture(scope='function', autouse=False)
 def fixture_dtest_setup(request,
                         dtest_config,
                         fixture_dtest_setup_overrides,
                         fixture_logging_setup,
                         fixture_dtest_cluster_name,
-                        fixture_dtest_create_cluster_func):
+                        fixture_dtest_create_cluster_func,
+                        fixture_cluster_pool,
+                        fixture_data_snapshots,
+                        fixture_resource_admission,
+                        fixture_log_archiver):
     if running_in_docker():
         cleanup_docker_environment_before_test_execution()
 
@@ -335,7 +426,14 @@ def fixture_dtest_setup(request,
     dtest_setup = DTestSetup(dtest_config=dtest_config,
                              setup_overrides=fixture_dtest_setup_overrides,
                              cluster_name=fixture_dtest_cluster_name)
-    dtest_setup.initialize_cluster(fixture_dtest_create_cluster_func)
+    dtest_setup.data_snapshots = fixture_data_snapshots
+
+    reusable_cluster = request.node.get_closest_marker('reusable_cluster')
+    if fixture_cluster_pool is not None and reusable_cluster is not None:
+        fixture_cluster_pool.acquire(dtest_setup, fixture_dtest_create_cluster_func,
+                                     nodes=reusable_cluster.kwargs.get('nodes', 1))
+    else:
+        dtest_setup.initialize_cluster(fixture_dtest_create_cluster_func)
 
     if not dtest_config.disable_active_log_watching:
         dtest_setup.begin_active_log_watch()
@@ -350,9 +448,7 @@ def fixture_dtest_setup(request,
     reset_environment_vars(initial_environment)
     dtest_setup.jvm_args = []
 
-    for con in dtest_setup.connections:
-        con.cluster.shutdown()
-    dtest_setup.connections = []
+    dtest_setup.shutdown_connections()
 
     failed = False
     try:
@@ -366,11 +462,20 @@ def fixture_dtest_setup(request,
         try:
             # save the logs for inspection
             if failed or not dtest_config.delete_logs:
-                copy_logs(request, dtest_setup.cluster)
+                # pooled clusters keep running and get their logs truncated, so they can't be hardlinked
+                copy_logs(request, dtest_setup.cluster, archiver=fixture_log_archiver,
+                          allow_hardlink=dtest_setup.pooled_cluster is None)
         except Exception as e:
             logger.error("Error saving log:", str(e))
         finally:
-            dtest_setup.cleanup_cluster(request, failed)
+            test_failed = failed or (hasattr(request.node, 'rep_call') and request.node.rep_call.failed)
+            if fixture_cluster_pool is not None and fixture_cluster_pool.release(dtest_setup, test_failed):
+                if dtest_setup.log_watch_thread:
+                    dtest_setup.stop_active_log_watch()
+            else:
+                dtest_setup.cleanup_cluster(request, failed)
+            close_log_buses()
+            close_management_clients()
 
 
 # Based on https://bugs.python.org/file25808/14894.patch
@@ -445,13 +550,11 @@ def fixture_since(request, fixture_dtest_setup):
                 skip_msg = _skip_msg(LooseVersion(upgrade_path.upgrade_meta.family), since, max_version)
                 if skip_msg:
                     pytest.skip(skip_msg)
-            ccm_repo_cache_dir, _ = ccmlib.repository.setup(upgrade_path.starting_meta.version)
-            starting_version = get_version_from_build(ccm_repo_cache_dir)
+            starting_version = resolve_version_from_build(cassandra_version=upgrade_path.starting_meta.version)
             skip_msg = _skip_msg(starting_version, since, max_version)
             if skip_msg:
                 pytest.skip(skip_msg)
-            ccm_repo_cache_dir, _ = ccmlib.repository.setup(upgrade_path.upgrade_meta.version)
-            ending_version = get_version_from_build(ccm_repo_cache_dir)
+            ending_version = resolve_version_from_build(cassandra_version=upgrade_path.upgrade_meta.version)
             skip_msg = _skip_msg(ending_version, since, max_version)
             if skip_msg:
                 pytest.skip(skip_msg)
@@ -498,13 +601,11 @@ def fixture_ported_to_in_jvm(request, fixture_dtest_setup):
                 skip_msg = _skip_ported_msg(LooseVersion(upgrade_path.upgrade_meta.family), ported_from_version)
                 if skip_msg:
                     pytest.skip(skip_msg)
-            ccm_repo_cache_dir, _ = ccmlib.repository.setup(upgrade_path.starting_meta.version)
-            starting_version = get_version_from_build(ccm_repo_cache_dir)
+            starting_version = resolve_version_from_build(cassandra_version=upgrade_path.starting_meta.version)
             skip_msg = _skip_ported_msg(starting_version, ported_from_version)
             if skip_msg:
                 pytest.skip(skip_msg)
-            ccm_repo_cache_dir, _ = ccmlib.repository.setup(upgrade_path.upgrade_meta.version)
-            ending_version = get_version_from_build(ccm_repo_cache_dir)
+            ending_version = resolve_version_from_build(cassandra_version=upgrade_path.upgrade_meta.version)
             skip_msg = _skip_ported_msg(ending_version, ported_from_version)
             if skip_msg:
                 pytest.skip(skip_msg)
@@ -541,8 +642,7 @@ def install_debugging_signal_handler():
 
 @pytest.fixture(scope='session')
 def dtest_config(request):
-    dtest_config = DTestConfig()
-    dtest_config.setup(request.config)
+    dtest_config = get_dtest_config(request.config)
 
     # if we're on mac, check that we have the required loopback interfaces before doing anything!
     check_required_loopback_interfaces_available()
@@ -618,8 +718,7 @@ def pytest_collection_modifyitems(items, config):
     This function is called upon during the pytest test collection phase and allows for modification
     of the test items within the list
     """
-    dtest_config = DTestConfig()
-    dtest_config.setup(config)
+    dtest_config = get_dtest_config(config)
 
     selected_items = []
     deselected_items = []
@@ -1,7 +1,3 @@
-import queue
-import sys
-import threading
-import time
 import pytest
 import logging
 from collections import OrderedDict, namedtuple
@@ -12,9 +8,10 @@ from cassandra.query import BatchStatement, BatchType, SimpleStatement
 
 from tools.assertions import (assert_all, assert_length_equal, assert_none,
                               assert_unavailable)
-from dtest import MultiError, Tester, create_ks, create_cf
+from dtest import Tester, create_ks, create_cf
 from tools.data import (create_c1c2_table, insert_c1c2, insert_columns,
                         query_c1c2, rows_to_list)
+from tools.matrix import concurrency_for, run_matrix
 
 since = pytest.mark.since
 ported_to_in_jvm = pytest.mark.ported_to_in_jvm
@@ -23,6 +20,13 @@ logger = logging.getLogger(__name__)
 ExpectedConsistency = namedtuple('ExpectedConsistency', ('num_write_nodes', 'num_read_nodes', 'is_strong'))
 
 
+def describe_combination(combination):
+    """
+    @return The names of the write, read and serial consistency levels of a combination, e.g. QUORUM/ONE/None
+    """
+    return '/'.join(consistency_value_to_name(cl) for cl in (tuple(combination[:3]) + (None,) * 3)[:3])
+
+
 class TestHelper(Tester):
 
     def _is_local(self, cl):
@@ -182,11 +186,13 @@ class TestHelper(Tester):
         else:
             return " speculative_retry =  'NONE'"
 
-    def insert_user(self, session, userid, age, consistency, serial_consistency=None):
+    def _insert_user_statement(self, userid, age, consistency, serial_consistency):
         text = "INSERT INTO users (userid, firstname, lastname, age) VALUES ({}, 'first{}', 'last{}', {}) {}"\
             .format(userid, userid, userid, age, "IF NOT EXISTS" if serial_consistency else "")
-        statement = SimpleStatement(text, consistency_level=consistency, serial_consistency_level=serial_consistency)
-        session.execute(statement)
+        return SimpleStatement(text, consistency_level=consistency, serial_consistency_level=serial_consistency)
+
+    def insert_user(self, session, userid, age, consistency, serial_consistency=None):
+        session.execute(self._insert_user_statement(userid, age, consistency, serial_consistency))
 
     def update_user(self, session, userid, age, consistency, serial_consistency=None, prev_age=None):
         text = "UPDATE users SET age = {} WHERE userid = {}".format(age, userid)
@@ -199,15 +205,49 @@ class TestHelper(Tester):
         statement = SimpleStatement("DELETE FROM users where userid = {}".format(userid), consistency_level=consistency)
         session.execute(statement)
 
-    def query_user(self, session, userid, age, consistency, check_ret=True):
-        statement = SimpleStatement("SELECT userid, age FROM users where userid = {}".format(userid), consistency_level=consistency)
-        res = session.execute(statement)
+    def insert_users(self, session, userids, age, consistency, serial_consistency=None):
+        """
+        Insert several users at once, waiting for all the inserts to complete
+        """
+        futures = [session.execute_async(self._insert_user_statement(userid, age, consistency, serial_consistency))
+                   for userid in userids]
+        for future in futures:
+            future.result()
+
+    def _user_statement(self, userid, consistency):
+        return SimpleStatement("SELECT userid, age FROM users where userid = {}".format(userid), consistency_level=consistency)
+
+    def _check_user(self, session, res, userid, age, consistency, check_ret):
         expected = [[userid, age]] if age else []
         ret = rows_to_list(res) == expected
         if check_ret:
             assert ret, "Got {} from {}, expected {} at {}".format(rows_to_list(res), session.cluster.contact_points, expected, consistency_value_to_name(consistency))
         return ret
 
+    def query_user(self, session, userid, age, consistency, check_ret=True):
+        res = session.execute(self._user_statement(userid, consistency))
+        return self._check_user(session, res, userid, age, consistency, check_ret)
+
+    def query_users(self, session, userids, age, consistency, check_ret=True):
+        """
+        Query several users at once through the same session
+
+        @return Whether each user was read back with the expected age
+        """
+        futures = [session.execute_async(self._user_statement(userid, consistency)) for userid in userids]
+        return [self._check_user(session, future.result(), userid, age, consistency, check_ret)
+                for userid, future in zip(userids, futures)]
+
+    def query_user_from_sessions(self, sessions, userid, age, consistency, check_ret=True):
+        """
+        Query the same user through every session at once
+
+        @return Whether each session read the user back with the expected age
+        """
+        futures = [session.execute_async(self._user_statement(userid, consistency)) for session in sessions]
+        return [self._check_user(session, future.result(), userid, age, consistency, check_ret)
+                for session, future in zip(sessions, futures)]
+
     def create_counters_table(self, session, requires_local_reads):
         create_cmd = """
             CREATE TABLE counters (
@@ -226,9 +266,25 @@ class TestHelper(Tester):
         session.execute(statement)
         return statement
 
+    def _counter_statement(self, id, consistency):
+        return SimpleStatement("SELECT * from counters WHERE id = {}".format(id), consistency_level=consistency)
+
     def query_counter(self, session, id, val, consistency, check_ret=True):
-        statement = SimpleStatement("SELECT * from counters WHERE id = {}".format(id), consistency_level=consistency)
-        ret = rows_to_list(session.execute(statement))
+        return self._check_counter(session, session.execute(self._counter_statement(id, consistency)), val,
+                                   consistency, check_ret)
+
+    def query_counter_from_sessions(self, sessions, id, val, consistency, check_ret=True):
+        """
+        Query the same counter through every session at once
+
+        @return The value of the counter read through each session
+        """
+        futures = [session.execute_async(self._counter_statement(id, consistency)) for session in sessions]
+        return [self._check_counter(session, future.result(), val, consistency, check_ret)
+                for session, future in zip(sessions, futures)]
+
+    def _check_counter(self, session, res, val, consistency, check_ret):
+        ret = rows_to_list(res)
         if check_ret:
             assert ret[0][1] == val, "Got {} from {}, expected {} at {}".format(ret[0][1],
                                                                                         session.cluster.contact_points,
@@ -255,8 +311,7 @@ class TestAvailability(TestHelper):
         for node in range(nodes):
             logger.debug('Testing node {} in single dc with {} nodes alive'.format(node, num_alive))
             session = self.patient_exclusive_cql_connection(cluster.nodelist()[node], self.ksname)
-            for combination in combinations:
-                self._test_insert_query_from_node(session, 0, [rf], [num_alive], *combination)
+            self._test_combinations_from_node(session, 0, [rf], [num_alive], combinations)
 
             self.cluster.nodelist()[node].stop()
             num_alive -= 1
@@ -279,32 +334,38 @@ class TestAvailability(TestHelper):
                 logger.debug('Testing node {} in dc {} with {} nodes alive'.format(n, i, nodes_alive))
                 node = n + sum(nodes[:i])
                 session = self.patient_exclusive_cql_connection(cluster.nodelist()[node], self.ksname)
-                for combination in combinations:
-                    self._test_insert_query_from_node(session, i, rf_factors, nodes_alive, *combination)
+                self._test_combinations_from_node(session, i, rf_factors, nodes_alive, combinations)
 
                 self.cluster.nodelist()[node].stop(wait_other_notice=True)
                 nodes_alive[i] -= 1
 
-    def _test_insert_query_from_node(self, session, dc_idx, rf_factors, num_nodes_alive, write_cl, read_cl, serial_cl=None, check_ret=True):
+    def _test_combinations_from_node(self, session, dc_idx, rf_factors, num_nodes_alive, combinations):
         """
-        Test availability for read and write via the session passed in as a parameter.
+        Invoke _test_insert_query_from_node() for every combination at the same time, each on its own keys
+        so that the lightweight transactions of different combinations don't contend with each other.
+        """
+        num_keys = 100
+        cases = [(i * num_keys, (i + 1) * num_keys) + tuple(combination) for i, combination in enumerate(combinations)]
+        run_matrix(cases, lambda case: self._test_insert_query_from_node(session, dc_idx, rf_factors, num_nodes_alive, *case),
+                   max_workers=concurrency_for(self.cluster.nodelist()), describe=lambda case: describe_combination(case[2:]),
+                   name='availability-{}'.format(num_nodes_alive))
+
+    def _test_insert_query_from_node(self, session, dc_idx, rf_factors, num_nodes_alive, start, end, write_cl, read_cl, serial_cl=None, check_ret=True):
+        """
+        Test availability for read and write of the keys from start to end via the session passed in as a parameter.
         """
         logger.debug("Connected to %s for %s/%s/%s" %
                  (session.cluster.contact_points, consistency_value_to_name(write_cl), consistency_value_to_name(read_cl), consistency_value_to_name(serial_cl)))
 
-        start = 0
-        end = 100
         age = 30
 
         if self._should_succeed(write_cl, rf_factors, num_nodes_alive, dc_idx):
-            for n in range(start, end):
-                self.insert_user(session, n, age, write_cl, serial_cl)
+            self.insert_users(session, range(start, end), age, write_cl, serial_cl)
         else:
             assert_unavailable(self.insert_user, session, end, age, write_cl, serial_cl)
 
         if self._should_succeed(read_cl, rf_factors, num_nodes_alive, dc_idx):
-            for n in range(start, end):
-                self.query_user(session, n, age, read_cl, check_ret)
+            self.query_users(session, list(range(start, end)), age, read_cl, check_ret)
         else:
             assert_unavailable(self.query_user, session, end, age, read_cl, check_ret)
 
@@ -452,10 +513,8 @@ class TestAccuracy(TestHelper):
 
             def check_all_sessions(idx, n, val):
                 expected_consistency = self.get_expected_consistency(idx)
-                num = 0
-                for s in sessions:
-                    if outer.query_user(s, n, val, read_cl, check_ret=expected_consistency.is_strong):
-                        num += 1
+                num = outer.query_user_from_sessions(sessions, n, val, read_cl,
+                                                     check_ret=expected_consistency.is_strong).count(True)
                 assert num >= expected_consistency.num_write_nodes, "Failed to read value from sufficient number of nodes," + \
                                      " required {} but got {} - [{}, {}]".format(expected_consistency.num_write_nodes, num, n, val)
 
@@ -490,9 +549,8 @@ class TestAccuracy(TestHelper):
 
             def check_all_sessions(idx, n, val):
                 expected_consistency = self.get_expected_consistency(idx)
-                results = []
-                for s in sessions:
-                    results.append(outer.query_counter(s, n, val, read_cl, check_ret=expected_consistency.is_strong))
+                results = outer.query_counter_from_sessions(sessions, n, val, read_cl,
+                                                            check_ret=expected_consistency.is_strong)
 
                 assert results.count(val) >= expected_consistency.num_write_nodes, "Failed to read value from sufficient number of nodes, required {} nodes to have a" + \
                                      " counter value of {} at key {}, instead got these values: {}".format(expected_consistency.num_write_nodes, val, n, results)
@@ -527,41 +585,17 @@ class TestAccuracy(TestHelper):
 
         self._start_cluster(save_sessions=True, requires_local_reads=requires_local_reads)
 
-        input_queue = queue.Queue()
-        exceptions_queue = queue.Queue()
-
-        def run():
-            while not input_queue.empty():
-                try:
-                    v = TestAccuracy.Validation(self, self.sessions, nodes, rf_factors, *input_queue.get(block=False))
-                    valid_fcn(v)
-                except queue.Empty:
-                    pass
-                except Exception:
-                    exceptions_queue.put(sys.exc_info())
-
         start = 0
         num_keys = 50
+        cases = []
         for combination in combinations:
-            input_queue.put((start, start + num_keys) + combination)
+            cases.append((start, start + num_keys) + combination)
             start += num_keys
 
-        threads = []
-        for n in range(0, 8):
-            t = threading.Thread(target=run)
-            t.setDaemon(True)
-            t.start()
-            threads.append(t)
-
-        logger.debug("Waiting for workers to complete")
-        while exceptions_queue.empty():
-            time.sleep(0.1)
-            if len([t for t in threads if t.is_alive()]) == 0:
-                break
-
-        if not exceptions_queue.empty():
-            _, exceptions, tracebacks = list(zip(*exceptions_queue.queue))
-            raise MultiError(exceptions=exceptions, tracebacks=tracebacks)
+        logger.debug("Running {} combinations on {} workers".format(len(cases), concurrency_for(self.cluster.nodelist())))
+        run_matrix(cases, lambda case: valid_fcn(TestAccuracy.Validation(self, self.sessions, nodes, rf_factors, *case)),
+                   max_workers=concurrency_for(self.cluster.nodelist()), describe=lambda case: describe_combination(case[2:]),
+                   name=valid_fcn.__name__)
 
     @pytest.mark.resource_intensive
     def test_simple_strategy_users(self):
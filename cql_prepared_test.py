@@ -9,12 +9,14 @@ logger = logging.getLogger(__name__)
 
 
 @since("1.2")
+@pytest.mark.reusable_cluster(nodes=1)
 class TestCQL(Tester):
 
     def prepare(self):
         cluster = self.cluster
 
-        cluster.populate(1).start()
+        if not cluster.nodelist():
+            cluster.populate(1).start()
         node1 = cluster.nodelist()[0]
         time.sleep(0.2)
 
@@ -0,0 +1,185 @@
+"""
+Throughput tracking of cqlsh COPY TO and COPY FROM.
+
+Each benchmark configuration runs a bulk round trip (COPY TO, COPY FROM, COPY TO) of a
+schema, measuring the rows per second and the peak resident memory of the cqlsh process
+tree of every COPY. Results are appended to a JSON history file shared by successive runs,
+and a run fails when its throughput falls below the recent history of the same
+configuration on the same Cassandra version by more than a threshold.
+"""
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import namedtuple
+
+import psutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# number of most recent runs whose median is the baseline of the next one
+BASELINE_RUNS = 5
+
+COPY_TO = 'COPY TO'
+COPY_FROM = 'COPY FROM'
+
+BenchmarkConfig = namedtuple('BenchmarkConfig', ['name', 'schema', 'num_operations', 'copy_to_options',
+                                                 'copy_from_options'])
+
+
+class CopyMeasurement(namedtuple('CopyMeasurement', ['operation', 'rows', 'seconds', 'peak_rss'])):
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else float(self.rows)
+
+
+def _benchmark_configs():
+    """
+    @return Every schema at two sizes with the default options, and the standard1 stress
+            table with each COPY option varied on its own
+    """
+    configs = []
+    for schema in ('standard1', 'blogposts', 'all_datatypes'):
+        for num_operations in (10000, 100000):
+            configs.append(BenchmarkConfig('{}-{}-defaults'.format(schema, num_operations), schema, num_operations,
+                                           {}, {}))
+    sweep = [
+        ('numprocesses_1', {'NUMPROCESSES': 1}, {'NUMPROCESSES': 1}),
+        ('numprocesses_8', {'NUMPROCESSES': 8}, {'NUMPROCESSES': 8}),
+        ('pagesize_100', {'PAGESIZE': 100}, {}),
+        ('pagesize_5000', {'PAGESIZE': 5000}, {}),
+        ('chunksize_500', {}, {'CHUNKSIZE': 500}),
+        ('chunksize_10000', {}, {'CHUNKSIZE': 10000}),
+        ('maxbatchsize_5', {}, {'MAXBATCHSIZE': 5}),
+        ('maxbatchsize_50', {}, {'MAXBATCHSIZE': 50}),
+        ('ingestrate_10000', {}, {'INGESTRATE': 10000}),
+        ('ingestrate_1000000', {}, {'INGESTRATE': 1000000}),
+    ]
+    for name, copy_to_options, copy_from_options in sweep:
+        configs.append(BenchmarkConfig('standard1-100000-{}'.format(name), 'standard1', 100000,
+                                       copy_to_options, copy_from_options))
+    return configs
+
+
+BENCHMARK_CONFIGS = _benchmark_configs()
+
+
+class PeakRssSampler(object):
+    """
+    Samples, in a background thread, the total resident memory of the descendants of this
+    process whose command line mentions cqlsh (cqlsh itself and its COPY worker processes),
+    and keeps the highest total seen.
+    """
+
+    def __init__(self, interval=0.1, pattern='cqlsh'):
+        self.interval = interval
+        self.pattern = pattern
+        self.peak = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='peak-rss-sampler', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        me = psutil.Process()
+        while not self._stopped.is_set():
+            total = 0
+            for process in me.children(recursive=True):
+                try:
+                    if any(self.pattern in arg for arg in process.cmdline()):
+                        total += process.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+            self.peak = max(self.peak, total)
+            self._stopped.wait(self.interval)
+
+
+def summarize(measurements):
+    """
+    @return A dict of the rows per second and peak RSS of each COPY operation of a round trip
+    """
+    summary = {}
+    for operation in (COPY_TO, COPY_FROM):
+        ms = [m for m in measurements if m.operation == operation]
+        if not ms:
+            continue
+        prefix = operation.lower().replace(' ', '_')
+        seconds = sum(m.seconds for m in ms)
+        summary[prefix + '_rows_per_second'] = sum(m.rows for m in ms) / seconds if seconds > 0 else 0.0
+        summary[prefix + '_peak_rss'] = max(m.peak_rss for m in ms)
+    return summary
+
+
+class BenchmarkHistory(object):
+    """
+    The JSON file of the results of earlier runs, keyed by benchmark configuration and
+    Cassandra version:
+
+        {"standard1-100000-defaults@4.1.3": [{"timestamp": ..., "copy_to_rows_per_second": ...,
+                                              "copy_to_peak_rss": ..., ...}, ...]}
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def key(config, version):
+        return '{}@{}'.format(config.name, version)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def runs(self, key):
+        return self._load().get(key, [])
+
+    def regressions(self, key, summary, threshold):
+        """
+        @return A message for each throughput of summary lower than the median of the last
+                BASELINE_RUNS runs of key by more than threshold (a fraction, e.g. 0.2 for 20%)
+        """
+        runs = self.runs(key)[-BASELINE_RUNS:]
+        messages = []
+        for metric, value in sorted(summary.items()):
+            if not metric.endswith('_rows_per_second'):
+                continue
+            previous = [run[metric] for run in runs if metric in run]
+            if not previous:
+                continue
+            baseline = statistics.median(previous)
+            if value < baseline * (1 - threshold):
+                messages.append('{} {}: {:.0f} rows/s is {:.0%} below the baseline of {:.0f} rows/s'.format(
+                    key, metric, value, 1 - value / baseline, baseline))
+        return messages
+
+    def record(self, key, summary):
+        """
+        Append a run to the history. The file is locked while it is rewritten, so that
+        concurrent test workers don't lose each other's runs.
+        """
+        run = dict(summary, timestamp=time.time())
+        with open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            history = self._load()
+            history.setdefault(key, []).append(run)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(history, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
@@ -1,13 +1,31 @@
 from __future__ import unicode_literals
 
 import csv
+import hashlib
+import os
 import random
+import shutil
+import struct
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 
 import cassandra
 
 from cassandra.cluster import ResultSet
 
+from tools.misc import canonical_row
+
+# memory the comparison of two multisets may use, whatever their size
+DEFAULT_COMPARE_MEMORY = 256 * 1024 * 1024
+# bytes of memory a Counter needs per byte of item it holds, roughly
+_COUNTER_OVERHEAD = 4
+_SPILL_PARTITIONS = 16
+_SUBPARTITIONS = 8
+_MAX_SPLIT_DEPTH = 4
+_LENGTH = struct.Struct('>I')
+
 
 class DummyColorMap(object):
 
@@ -27,13 +45,185 @@ def csv_rows(filename, delimiter=None):
             yield row
 
 
-def assert_csvs_items_equal(filename1, filename2):
-    with open(filename1, 'r') as x, open(filename2, 'r') as y:
-        list_x = list(x.readlines())
-        list_y = list(y.readlines())
-        list_x.sort()
-        list_y.sort()
-        assert list_x == list_y
+class SpilledMultiset(object):
+    """
+    A multiset of byte strings written to disk as it is built, hash partitioned into
+    files so that two of them can be compared one partition at a time.
+
+    Use as a context manager, or close() it, to remove its files.
+    """
+
+    def __init__(self, directory=None, partitions=_SPILL_PARTITIONS):
+        self.directory = tempfile.mkdtemp(prefix='dtest-multiset-', dir=directory)
+        self.partitions = partitions
+        self.paths = [os.path.join(self.directory, str(i)) for i in range(partitions)]
+        self._files = [open(path, 'wb') for path in self.paths]
+        self.count = 0
+        self.size = 0
+
+    def add(self, item):
+        self._files[_partition(item, 0, self.partitions)].write(_LENGTH.pack(len(item)) + item)
+        self.count += 1
+        self.size += len(item)
+
+    def add_all(self, items):
+        for item in items:
+            self.add(item)
+        return self
+
+    def flush(self):
+        for f in self._files:
+            f.flush()
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _partition(item, depth, partitions):
+    """
+    @return The partition of item at a split depth. The hash is salted with the depth, so the
+            items of a partition are spread independently of how they were partitioned before.
+    """
+    digest = hashlib.blake2b(item, digest_size=8, salt=depth.to_bytes(16, 'little')).digest()
+    return int.from_bytes(digest, 'little') % partitions
+
+
+def _read_items(path):
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_LENGTH.size)
+            if not header:
+                return
+            yield f.read(_LENGTH.unpack(header)[0])
+
+
+def _split(path, depth):
+    """
+    Split a partition file in _SUBPARTITIONS files, with a hash salted with depth.
+    """
+    paths = ['{}.{}'.format(path, i) for i in range(_SUBPARTITIONS)]
+    files = [open(p, 'wb') for p in paths]
+    try:
+        for item in _read_items(path):
+            files[_partition(item, depth, _SUBPARTITIONS)].write(_LENGTH.pack(len(item)) + item)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def _compare_partition(path1, path2, budget, max_reported, depth=0):
+    """
+    @return (missing, unexpected, missing examples, unexpected examples) where missing are
+            the items of path1 not in path2 and unexpected the items of path2 not in path1,
+            counting duplicates. A partition too large for budget is split and compared piecewise.
+    """
+    if (os.path.getsize(path1) + os.path.getsize(path2)) * _COUNTER_OVERHEAD > budget and depth < _MAX_SPLIT_DEPTH:
+        totals = [0, 0, [], []]
+        for sub1, sub2 in zip(_split(path1, depth + 1), _split(path2, depth + 1)):
+            missing, unexpected, missing_examples, unexpected_examples = \
+                _compare_partition(sub1, sub2, budget, max_reported, depth + 1)
+            os.unlink(sub1)
+            os.unlink(sub2)
+            totals[0] += missing
+            totals[1] += unexpected
+            totals[2].extend(missing_examples[:max_reported - len(totals[2])])
+            totals[3].extend(unexpected_examples[:max_reported - len(totals[3])])
+        return tuple(totals)
+
+    counts = Counter(_read_items(path1))
+    for item in _read_items(path2):
+        counts[item] -= 1
+    missing = [(item, n) for item, n in counts.items() if n > 0]
+    unexpected = [(item, -n) for item, n in counts.items() if n < 0]
+    return (sum(n for _, n in missing), sum(n for _, n in unexpected),
+            [item for item, _ in missing[:max_reported]], [item for item, _ in unexpected[:max_reported]])
+
+
+def assert_multisets_equal(expected, actual, max_memory=DEFAULT_COMPARE_MEMORY, workers=None, max_reported=10,
+                           describe=repr):
+    """
+    Assert two SpilledMultiset hold the same items the same number of times. Partitions are
+    compared in parallel processes when the multisets don't fit in max_memory at once, each
+    process using at most its share of max_memory.
+
+    @param describe Turns an item into the text shown when the multisets differ
+    """
+    assert expected.partitions == actual.partitions, "multisets must have the same number of partitions"
+    expected.flush()
+    actual.flush()
+    pairs = list(zip(expected.paths, actual.paths))
+    if (expected.size + actual.size) * _COUNTER_OVERHEAD <= max_memory:
+        results = [_compare_partition(p1, p2, max_memory, max_reported) for p1, p2 in pairs]
+    else:
+        workers = workers or min(len(pairs), os.cpu_count() or 1)
+        budget = max_memory // workers
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_compare_partition, *zip(*pairs), [budget] * len(pairs),
+                                        [max_reported] * len(pairs)))
+
+    missing = sum(r[0] for r in results)
+    unexpected = sum(r[1] for r in results)
+    if missing or unexpected:
+        missing_examples = [e for r in results for e in r[2]][:max_reported]
+        unexpected_examples = [e for r in results for e in r[3]][:max_reported]
+        raise AssertionError("{} of {} expected items missing, {} of {} actual items unexpected.\n"
+                             "Missing: {}\nUnexpected: {}".format(
+                                 missing, expected.count, unexpected, actual.count,
+                                 [describe(e) for e in missing_examples], [describe(e) for e in unexpected_examples]))
+
+
+def _csv_lines(filename):
+    with open(filename, 'r') as f:
+        for line in f:
+            yield line.encode('utf-8')
+
+
+def assert_csvs_items_equal(filename1, filename2, max_memory=DEFAULT_COMPARE_MEMORY):
+    """
+    Assert two csv files have the same lines, in any order, without loading them in memory.
+    """
+    with SpilledMultiset() as lines1, SpilledMultiset() as lines2:
+        lines1.add_all(_csv_lines(filename1))
+        lines2.add_all(_csv_lines(filename2))
+        assert_multisets_equal(lines1, lines2, max_memory=max_memory,
+                               describe=lambda line: line.decode('utf-8', 'replace'))
+
+
+def spill_rows(rows, directory=None):
+    """
+    Write query result rows to a new SpilledMultiset, as the repr of their canonical form
+    (see tools.misc.canonical_row). Rows are streamed, so a ResultSet is fetched page by page.
+
+    @param directory The directory the SpilledMultiset creates its own in, the system temporary directory by default
+    @return The SpilledMultiset
+    """
+    return SpilledMultiset(directory).add_all(repr(canonical_row(row)).encode('utf-8') for row in rows)
+
+
+def assert_rows_items_equal(expected, actual, max_memory=DEFAULT_COMPARE_MEMORY):
+    """
+    Assert query results hold the same rows, in any order, without loading them in memory.
+
+    @param expected Rows, or a SpilledMultiset from spill_rows (e.g. of a table before it was
+                    truncated), which is closed once compared
+    @param actual Rows
+    """
+    expected_rows = expected if isinstance(expected, SpilledMultiset) else spill_rows(expected)
+    try:
+        with spill_rows(actual, os.path.dirname(expected_rows.directory)) as actual_rows:
+            assert_multisets_equal(expected_rows, actual_rows, max_memory=max_memory,
+                                   describe=lambda row: row.decode('utf-8'))
+    finally:
+        expected_rows.close()
 
 
 def random_list(gen=None, n=None):
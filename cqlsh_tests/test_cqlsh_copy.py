@@ -24,12 +24,15 @@ from cassandra.util import SortedSet
 from ccmlib.common import is_win
 
 from dtest import (FlakyRetryPolicy, Tester, create_ks)
+from tools.bulkload import BulkLoader
 from tools.data import rows_to_list
 from . import util
+from .copy_benchmark import (BENCHMARK_CONFIGS, COPY_FROM, COPY_TO, BenchmarkHistory, CopyMeasurement,
+                             PeakRssSampler, summarize)
 from .cqlsh_test_types import (Address, Datetime, ImmutableDict,
                                ImmutableSet, Name, UTC, drop_microseconds)
-from .cqlsh_tools import (assert_csvs_items_equal,
-                          csv_rows, monkeypatch_driver, random_list,
+from .cqlsh_tools import (assert_csvs_items_equal, assert_rows_items_equal,
+                          csv_rows, monkeypatch_driver, random_list, spill_rows,
                           unmonkeypatch_driver, write_rows_to_csv)
 
 since = pytest.mark.since
@@ -234,7 +237,9 @@ class TestCqlshCopy(Tester):
 
     def all_datatypes_prepare(self):
         self.prepare()
+        self.create_all_datatypes_table()
 
+    def create_all_datatypes_table(self):
         self.session.execute('CREATE TYPE name_type (firstname text, lastname text)')
         self.session.execute('''
             CREATE TYPE address_type (name frozen<name_type>, number int, street text, phones set<text>)
@@ -2278,7 +2283,9 @@ class TestCqlshCopy(Tester):
         args = [(str(i), i, float(i) + 0.5, uuid4()) for i in range(num_records)]
         execute_concurrent_with_args(self.session, insert_statement, args)
 
-        results = list(self.session.execute("SELECT * FROM testcopyto"))
+        # spilled in the test directory so that they are removed even if the test fails
+        results = spill_rows(self.session.execute("SELECT * FROM testcopyto"),
+                             directory=self.fixture_dtest_setup.test_path)
 
         tempfile = self.get_temp_file()
         logger.debug('Exporting to csv file: {}'.format(tempfile.name))
@@ -2294,8 +2301,7 @@ class TestCqlshCopy(Tester):
         out, err, _ = self.run_cqlsh(cmds="COPY ks.testcopyto FROM '{}'".format(tempfile.name))
         logger.debug(out)
 
-        new_results = list(self.session.execute("SELECT * FROM testcopyto"))
-        assert sorted(results) == sorted(new_results)
+        assert_rows_items_equal(results, self.session.execute("SELECT * FROM testcopyto"))
 
     def test_round_trip_murmur3(self):
         self._test_round_trip(nodes=3, partitioner="murmur3")
@@ -2329,7 +2335,9 @@ class TestCqlshCopy(Tester):
         args = [(i, str(i), float(i) + 0.5, uuid4()) for i in range(1000)]
         execute_concurrent_with_args(self.session, insert_statement, args)
 
-        results = list(self.session.execute("SELECT * FROM testcopyto"))
+        # spilled in the test directory so that they are removed even if the test fails
+        results = spill_rows(self.session.execute("SELECT * FROM testcopyto"),
+                             directory=self.fixture_dtest_setup.test_path)
 
         tempfile = self.get_temp_file()
         logger.debug('Exporting to csv file: {name}'.format(name=tempfile.name))
@@ -2351,8 +2359,7 @@ class TestCqlshCopy(Tester):
             f.write("COPY ks.testcopyto FROM '{name}' WITH HEADER=false;".format(name=tempfile.name))
 
         self.run_cqlsh(cmds="SOURCE '{name}'".format(name=commandfile.name))
-        new_results = list(self.session.execute("SELECT * FROM testcopyto"))
-        assert sorted(results) == sorted(new_results)
+        assert_rows_items_equal(results, self.session.execute("SELECT * FROM testcopyto"))
 
     def _test_bulk_round_trip(self, nodes, partitioner,
                               num_operations, profile=None,
@@ -2360,7 +2367,9 @@ class TestCqlshCopy(Tester):
                               configuration_options=None,
                               skip_count_checks=False,
                               copy_to_options=None,
-                              copy_from_options=None):
+                              copy_from_options=None,
+                              populate=None,
+                              measurements=None):
         """
         Test exporting a large number of rows into a csv file.
 
@@ -2377,6 +2386,11 @@ class TestCqlshCopy(Tester):
 
         Therefore, 3 COPY operations are run in total. Return a list of tuples, containing stdout and stderr
         for all 3 copy operations.
+
+        If populate is given, it is called instead of cassandra-stress to create the records, and
+        must return their number. The records are restored from a data snapshot when an earlier
+        test of the session created the same ones. If measurements is a list, a CopyMeasurement of
+        each COPY operation is appended to it.
         """
         if configuration_options is None:
             configuration_options = {}
@@ -2393,6 +2407,8 @@ class TestCqlshCopy(Tester):
         ret = []
 
         def create_records():
+            if populate is not None:
+                return populate()
             if not profile:
                 logger.debug('Running stress without any user profile')
                 self.node1.stress(['write', 'n={} cl=ALL'.format(num_operations), 'no-warmup', '-rate', 'threads=50'])
@@ -2418,7 +2434,7 @@ class TestCqlshCopy(Tester):
             if copy_to_options:
                 copy_to_cmd += ' WITH ' + ' AND '.join('{} = {}'.format(k, v) for k, v in copy_to_options.items())
             logger.debug('Running {}'.format(copy_to_cmd))
-            result = self.run_cqlsh(cmds=copy_to_cmd)
+            result = run_measured(COPY_TO, copy_to_cmd)
             ret.append(result)
             logger.debug("COPY TO took {} to export {} records".format(datetime.datetime.now() - start, num_records))
 
@@ -2429,11 +2445,24 @@ class TestCqlshCopy(Tester):
             if copy_from_options:
                 copy_from_cmd += ' WITH ' + ' AND '.join('{} = {}'.format(k, v) for k, v in copy_from_options.items())
             logger.debug('Running {}'.format(copy_from_cmd))
-            result = self.run_cqlsh(cmds=copy_from_cmd)
+            result = run_measured(COPY_FROM, copy_from_cmd)
             ret.append(result)
             logger.debug("COPY FROM took {} to import {} records".format(datetime.datetime.now() - start, num_records))
 
-        num_records = create_records()
+        def run_measured(operation, cmd):
+            if measurements is None:
+                return self.run_cqlsh(cmds=cmd)
+            start = time.time()
+            with PeakRssSampler() as rss:
+                result = self.run_cqlsh(cmds=cmd)
+            measurements.append(CopyMeasurement(operation, num_records, time.time() - start, rss.peak))
+            return result
+
+        # tests sharing a dataset restore it once the first of them wrote it, which restarts the nodes
+        recipe = (profile, getattr(populate, '__qualname__', None), num_operations, skip_count_checks)
+        num_records = self.data_snapshots.restore_or_build(self.cluster, stress_table, recipe, create_records)
+        self.session = self.patient_cql_connection(self.node1)
+        self.session.execute('USE {}'.format(self.ks))
 
         # Copy to the first csv files
         tempfile1 = self.get_temp_file()
@@ -2452,8 +2481,8 @@ class TestCqlshCopy(Tester):
         tempfile2 = self.get_temp_file()
         run_copy_to(tempfile2)
 
-        # check the length of both files is the same to ensure all exported records were imported
-        assert sum(1 for _ in open(tempfile1.name)) == sum(1 for _ in open(tempfile2.name))
+        # check both files have the same records to ensure all exported records were imported
+        assert_csvs_items_equal(tempfile1.name, tempfile2.name)
 
         return ret
 
@@ -2553,6 +2582,50 @@ class TestCqlshCopy(Tester):
         self._test_bulk_round_trip(nodes=3, partitioner="murmur3", num_operations=250000,
                                    copy_from_options={'MAXINFLIGHTMESSAGES': 64, 'MAXPENDINGCHUNKS': 1})
 
+    @pytest.mark.resource_intensive
+    @pytest.mark.parametrize('config', BENCHMARK_CONFIGS, ids=[c.name for c in BENCHMARK_CONFIGS])
+    def test_copy_benchmark(self, config):
+        """
+        Measure the throughput and peak memory of a bulk round trip with a configuration of
+        BENCHMARK_CONFIGS, record them in the --copy-benchmark-history file and fail if the
+        throughput regressed by more than --copy-benchmark-regression-threshold against the
+        previous runs of the same configuration on the same version.
+        """
+        history_path = self.dtest_config.copy_benchmark_history
+        if history_path is None:
+            pytest.skip("COPY benchmarks only run with --copy-benchmark-history")
+
+        kwargs = {}
+        if config.schema == 'blogposts':
+            kwargs = dict(profile=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'blogposts.yaml'),
+                          stress_table='stresscql.blogposts',
+                          configuration_options={'batch_size_warn_threshold_in_kb': '10'})
+        elif config.schema == 'all_datatypes':
+            def populate():
+                self.create_all_datatypes_table()
+                insert = self.session.prepare("INSERT INTO testdatatype ({}) VALUES ({})".format(
+                    ', '.join(chr(ord('a') + i) for i in range(26)) + ', za', ', '.join('?' * 27)))
+                insert.consistency_level = ConsistencyLevel.ALL
+                BulkLoader(self.session).load(insert, (('ascii{}'.format(i),) + self.data[1:]
+                                                       for i in range(config.num_operations)))
+                return config.num_operations
+
+            kwargs = dict(populate=populate, stress_table='ks.testdatatype')
+
+        measurements = []
+        self._test_bulk_round_trip(nodes=3, partitioner="murmur3", num_operations=config.num_operations,
+                                   copy_to_options=dict(config.copy_to_options),
+                                   copy_from_options=dict(config.copy_from_options),
+                                   measurements=measurements, **kwargs)
+
+        summary = summarize(measurements)
+        logger.info("COPY benchmark {}: {}".format(config.name, summary))
+        history = BenchmarkHistory(history_path)
+        key = BenchmarkHistory.key(config, self.cluster.version())
+        regressions = history.regressions(key, summary, self.dtest_config.copy_benchmark_regression_threshold)
+        history.record(key, summary)
+        assert not regressions, '\n'.join(regressions)
+
     def prepare_copy_to_with_failures(self):
         """
         Create a cluster for testing COPY TO with failure injection, we need at least 3 token ranges
@@ -23,6 +23,8 @@ from cassandra.cluster import ExecutionProfile
 from cassandra.policies import RetryPolicy, RoundRobinPolicy
 from ccmlib.common import get_version_from_build
 from ccmlib.node import ToolError, TimeoutError
+from tools.logwatch import watch_log_for
+from tools.management import get_management_client
 from tools.misc import retry_till_success
 
 from upgrade_tests.upgrade_manifest import build_upgrade_pairs
@@ -274,14 +276,14 @@ class Tester(object):
 
     def assert_log_had_msg(self, node, msg, timeout=600, **kwargs):
         """
-        Wrapper for ccmlib.node.Node#watch_log_for to cause an assertion failure when a log message isn't found
+        Wrapper for tools.logwatch.watch_log_for to cause an assertion failure when a log message isn't found
         within the timeout.
         :param node: Node which logs we should watch
         :param msg: String message we expect to see in the logs.
         :param timeout: Seconds to wait for msg to appear
         """
         try:
-            node.watch_log_for(msg, timeout=timeout, **kwargs)
+            watch_log_for(node, msg, timeout=timeout, **kwargs)
         except TimeoutError:
             pytest.fail("Log message was not seen within timeout:\n{0}".format(msg))
 
@@ -404,31 +406,20 @@ def make_auth(user, password):
 def data_size(node, ks, cf):
     """
     Return the size in bytes for given table in a node.
-    This gets the size from nodetool cfstats output.
-    This might brake if the format of nodetool cfstats change
-    as it is looking for specific text "Space used (total)" in output.
+    This gets the size from the TotalDiskSpaceUsed metric of the table, the same
+    number nodetool cfstats reports as "Space used (total)".
     @param node: Node in which table size to be checked for
     @param ks: Keyspace name for the table
     @param cf: table name
     @return: data size in bytes
     """
     hack_legacy_parsing(node)
-    cfstats = node.nodetool("cfstats {}.{}".format(ks,cf))[0]
-    regex = re.compile(r'[\t]')
-    stats_lines = [regex.sub("", s) for s in cfstats.split('\n')
-                  if regex.sub("", s).startswith('Space used (total)')]
-    if not len(stats_lines) == 1:
-        msg = ('Expected output from `nodetool cfstats` to contain exactly 1 '
-               'line starting with "Space used (total)". Found:\n') + cfstats
-        raise RuntimeError(msg)
-    space_used_line = stats_lines[0].split()
-
-    if len(space_used_line) == 4:
-        return float(space_used_line[3])
-    else:
-        msg = ('Expected format for `Space used (total)` in nodetool cfstats is `Space used (total): <number>`.'
-               'Found:\n') + stats_lines[0]
+    metrics = get_management_client(node.cluster).table_metrics(node, ks, cf)
+    if metrics.get('TotalDiskSpaceUsed') is None:
+        msg = ('Expected the metrics of {}.{} to contain TotalDiskSpaceUsed (`Space used (total)` in nodetool '
+               'cfstats). Found:\n{}').format(ks, cf, metrics)
         raise RuntimeError(msg)
+    return float(metrics['TotalDiskSpaceUsed'])
 
 
 def get_port_from_node(node):
@@ -0,0 +1,221 @@
+import errno
+import hashlib
+import logging
+import os
+import pprint
+from collections import OrderedDict, namedtuple
+
+from tools.context import log_filter
+
+logger = logging.getLogger(__name__)
+
+# keyspaces which are owned by Cassandra itself and survive a pooled cluster reset
+SYSTEM_KEYSPACES = frozenset(['system', 'system_schema', 'system_auth', 'system_distributed',
+                              'system_traces', 'system_views', 'system_virtual_schema',
+                              'system_cluster_metadata'])
+
+# tables in the system keyspaces that accumulate state from a previous test and are safe to truncate
+TRUNCATABLE_SYSTEM_TABLES = ('system_traces.sessions',
+                             'system_traces.events',
+                             'system_distributed.repair_history',
+                             'system_distributed.parent_repair_history')
+
+
+class ClusterPoolKey(namedtuple('ClusterPoolKey', ['nodes', 'use_vnodes', 'config_hash'])):
+    """
+    Identifies the shape of a pooled cluster. Two tests can share a cluster only if
+    their node count/dc layout, vnode setting and configuration hash all match.
+    """
+
+    @staticmethod
+    def for_test(dtest_setup, nodes):
+        dtest_config = dtest_setup.dtest_config
+        overrides = dtest_setup.setup_overrides.cluster_options if dtest_setup.setup_overrides is not None else []
+        config = OrderedDict([
+            ('cluster_name', dtest_setup.cluster_name),
+            ('cassandra_dir', dtest_config.cassandra_dir),
+            ('cassandra_version', dtest_config.cassandra_version),
+            ('num_tokens', dtest_config.num_tokens),
+            ('data_dir_count', dtest_config.data_dir_count),
+            ('use_off_heap_memtables', dtest_config.use_off_heap_memtables),
+            ('cluster_options', sorted(dict(overrides).items()) if overrides else []),
+        ])
+        config_hash = hashlib.sha1(pprint.pformat(config).encode('utf-8')).hexdigest()
+        if isinstance(nodes, list):
+            nodes = tuple(nodes)
+        return ClusterPoolKey(nodes=nodes, use_vnodes=dtest_config.use_vnodes, config_hash=config_hash)
+
+
+class PooledCluster(object):
+
+    def __init__(self, key, cluster, test_path, create_cluster_func):
+        self.key = key
+        self.cluster = cluster
+        self.test_path = test_path
+        self.create_cluster_func = create_cluster_func
+        self.config_options = _config_options(cluster)
+        self.uses = 0
+
+
+def _config_options(cluster):
+    """
+    @return A copy of the cassandra.yaml options set on a ccm cluster, to tell whether a test changed them
+    """
+    return pprint.pformat(getattr(cluster, '_config_options', {}))
+
+
+class ClusterPool(object):
+    """
+    Keeps already started ccm clusters around between tests so that tests marked with
+    reusable_cluster don't pay for populate/start/stop every time they run.
+
+    A pooled cluster is handed out again only when the next test asks for the same
+    ClusterPoolKey, and the previous test passed and left every node running with the
+    configuration the cluster was started with. Before it is handed out, the cluster is
+    reset: non-system keyspaces are dropped, accumulated system tables are truncated,
+    snapshots (including those taken by auto_snapshot on drop) are cleared and all node
+    logs are emptied so log marks and error checks start from scratch.
+
+    Example usage in a test class:
+
+        @pytest.mark.reusable_cluster(nodes=3)
+        class TestSomething(Tester):
+
+            def test_something(self):
+                if not self.cluster.nodelist():
+                    self.cluster.populate(3).start()
+    """
+
+    def __init__(self, max_size=1):
+        self.max_size = max_size
+        self._idle = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, dtest_setup, create_cluster_func, nodes):
+        """
+        Attach a started cluster of the requested shape to dtest_setup, either taken
+        from the pool (after a reset) or freshly built.
+
+        @param dtest_setup The DTestSetup of the test about to run
+        @param create_cluster_func Function used to create a cluster when the pool has none to offer
+        @param nodes Node count, or a list of node counts per data center, as accepted by ccm populate
+        """
+        key = ClusterPoolKey.for_test(dtest_setup, nodes)
+        pooled = self._idle.pop(key, None)
+
+        if pooled is not None and not self._is_healthy(pooled):
+            logger.debug("pooled cluster at {} is no longer healthy, rebuilding it".format(pooled.test_path))
+            self._destroy(pooled)
+            pooled = None
+
+        if pooled is not None:
+            self.hits += 1
+            os.rmdir(dtest_setup.test_path)
+            dtest_setup.test_path = pooled.test_path
+            dtest_setup.cluster = pooled.cluster
+            dtest_setup.create_cluster_func = pooled.create_cluster_func
+            self._reset(dtest_setup)
+        else:
+            self.misses += 1
+            # only max_size clusters may be alive at once, make room before starting a new one
+            while len(self._idle) >= self.max_size:
+                _, evicted = self._idle.popitem(last=False)
+                self._destroy(evicted)
+            dtest_setup.initialize_cluster(create_cluster_func)
+            dtest_setup.cluster.populate(list(nodes) if isinstance(nodes, tuple) else nodes)
+            dtest_setup.cluster.start(wait_for_binary_proto=True)
+            pooled = PooledCluster(key, dtest_setup.cluster, dtest_setup.test_path, create_cluster_func)
+
+        pooled.uses += 1
+        dtest_setup.pooled_cluster = pooled
+        logger.debug("cluster pool: {hits} hits, {misses} misses".format(hits=self.hits, misses=self.misses))
+
+    def release(self, dtest_setup, failed):
+        """
+        Return the cluster of a finished test to the pool. Clusters of failed tests, and
+        clusters that were replaced, reshaped or reconfigured by the test, are not reused.
+
+        @return True if the cluster was kept, False if the caller must clean it up as usual
+        """
+        pooled = dtest_setup.pooled_cluster
+        dtest_setup.pooled_cluster = None
+        if pooled is None:
+            return False
+
+        if failed or pooled.cluster is not dtest_setup.cluster or not self._is_healthy(pooled) or \
+                _config_options(pooled.cluster) != pooled.config_options:
+            logger.debug("not returning cluster at {} to the pool".format(pooled.test_path))
+            return False
+
+        self._idle[pooled.key] = pooled
+        return True
+
+    def close(self):
+        """
+        Remove every idle cluster. Called once at the end of the session.
+        """
+        while self._idle:
+            _, pooled = self._idle.popitem(last=False)
+            self._destroy(pooled)
+
+    @staticmethod
+    def _is_healthy(pooled):
+        nodes = pooled.cluster.nodelist()
+        if isinstance(pooled.key.nodes, tuple):
+            expected_nodes = sum(pooled.key.nodes)
+        else:
+            expected_nodes = pooled.key.nodes
+        return len(nodes) == expected_nodes and all(node.is_running() for node in nodes)
+
+    @staticmethod
+    def _reset(dtest_setup):
+        cluster = dtest_setup.cluster
+        node1 = cluster.nodelist()[0]
+        session = dtest_setup.patient_cql_connection(node1)
+        try:
+            if cluster.version() >= '3.0':
+                keyspaces = session.execute("SELECT keyspace_name FROM system_schema.keyspaces")
+            else:
+                keyspaces = session.execute("SELECT keyspace_name FROM system.schema_keyspaces")
+            for row in keyspaces:
+                if row.keyspace_name not in SYSTEM_KEYSPACES:
+                    session.execute('DROP KEYSPACE "{}"'.format(row.keyspace_name), timeout=120)
+
+            for table in TRUNCATABLE_SYSTEM_TABLES:
+                keyspace, table_name = table.split('.')
+                if keyspace in session.cluster.metadata.keyspaces and \
+                        table_name in session.cluster.metadata.keyspaces[keyspace].tables:
+                    session.execute('TRUNCATE {}'.format(table), timeout=120)
+        finally:
+            dtest_setup.connections.remove(session)
+            session.cluster.shutdown()
+
+        # dropping a keyspace snapshots its tables unless auto_snapshot is disabled
+        clearsnapshot = 'clearsnapshot --all' if cluster.version() >= '4.0' else 'clearsnapshot'
+        for node in cluster.nodelist():
+            node.nodetool(clearsnapshot)
+
+        # Cassandra appends to its logs, so truncating them in place resets every log
+        # mark taken by the next test without having to restart the nodes
+        for node in cluster.nodelist():
+            log_directory = node.log_directory()
+            for log in os.listdir(log_directory):
+                path = os.path.join(log_directory, log)
+                if os.path.isfile(path):
+                    with open(path, 'w'):
+                        pass
+
+    @staticmethod
+    def _destroy(pooled):
+        logger.debug("removing pooled ccm cluster {name} at: {path}".format(name=pooled.cluster.name,
+                                                                            path=pooled.test_path))
+        with log_filter('cassandra'):
+            pooled.cluster.remove()
+        for filename in ('keystore.jks', 'truststore.jks', 'ccm_node.cer'):
+            try:
+                os.remove(os.path.join(pooled.test_path, filename))
+            except OSError as e:
+                # ENOENT = no such file or directory
+                assert e.errno == errno.ENOENT
+        os.rmdir(pooled.test_path)
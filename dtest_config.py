@@ -1,13 +1,25 @@
+import functools
+import json
+import re
 import subprocess
 import os
 import ccmlib.repository
 import logging
 
-from ccmlib.common import is_win, get_version_from_build
+from distutils.version import LooseVersion
+
+from ccmlib.common import is_win, get_version_from_build, get_default_path
 from pytest import UsageError
 
+from upgrade_tests.artifacts import staged_version_from_build
+
 logger = logging.getLogger(__name__)
 
+# versions resolved by earlier sessions, see resolve_version_from_build
+VERSION_CACHE_FILE = 'dtest-versions.json'
+# version slugs naming a release, whose code never changes, unlike branches
+RELEASE_SLUG = re.compile(r'^(binary:|source:)?\d+\.\d+\.\d+(-[\w.]+)?$')
+
 
 class DTestConfig:
     def __init__(self):
@@ -22,12 +34,18 @@ class DTestConfig:
         self.cassandra_version = None
         self.cassandra_version_from_build = None
         self.delete_logs = False
+        self.compress_logs = False
+        self.logs_max_size_mb = None
         self.execute_upgrade_tests = False
         self.execute_upgrade_tests_only = False
         self.disable_active_log_watching = False
         self.keep_test_dir = False
         self.keep_failed_test_dir = False
         self.enable_jacoco_code_coverage = False
+        self.use_cluster_pool = False
+        self.cache_cql_connections = False
+        self.copy_benchmark_history = None
+        self.copy_benchmark_regression_threshold = 0.2
         self.jemalloc_path = find_libjemalloc()
         self.metatests = False
 
@@ -65,12 +83,28 @@ class DTestConfig:
             raise UsageError("The Cassandra directory %s does not seem to be valid: %s" % (self.cassandra_dir, fnfe))
 
         self.delete_logs = config.getoption("--delete-logs")
+        self.compress_logs = config.getoption("--compress-logs")
+        logs_max_size_mb = config.getoption("--logs-max-size-mb")
+        self.logs_max_size_mb = int(logs_max_size_mb) if logs_max_size_mb else None
         self.execute_upgrade_tests = config.getoption("--execute-upgrade-tests")
         self.execute_upgrade_tests_only = config.getoption("--execute-upgrade-tests-only")
         self.disable_active_log_watching = config.getoption("--disable-active-log-watching")
         self.keep_test_dir = config.getoption("--keep-test-dir")
         self.keep_failed_test_dir = config.getoption("--keep-failed-test-dir")
         self.enable_jacoco_code_coverage = config.getoption("--enable-jacoco-code-coverage")
+        self.use_cluster_pool = config.getoption("--use-cluster-pool")
+        self.cache_cql_connections = config.getoption("--cache-cql-connections")
+        copy_benchmark_history = config.getoption("--copy-benchmark-history")
+        self.copy_benchmark_history = os.path.abspath(os.path.expanduser(copy_benchmark_history)) \
+            if copy_benchmark_history else None
+        copy_benchmark_regression_threshold = config.getoption("--copy-benchmark-regression-threshold")
+        if copy_benchmark_regression_threshold is not None:
+            try:
+                self.copy_benchmark_regression_threshold = float(copy_benchmark_regression_threshold)
+            except ValueError:
+                self.copy_benchmark_regression_threshold = None
+            if self.copy_benchmark_regression_threshold is None or not 0 <= self.copy_benchmark_regression_threshold < 1:
+                raise UsageError("--copy-benchmark-regression-threshold must be a number between 0 and 1")
 
         if self.cassandra_version is None and self.cassandra_version_from_build is None:
             raise UsageError("Required dtest arguments were missing! You must provide either --cassandra-dir "
@@ -79,6 +113,10 @@ class DTestConfig:
 
         version = self.cassandra_version or self.cassandra_version_from_build
 
+        if self.use_cluster_pool and (self.keep_test_dir or self.enable_jacoco_code_coverage):
+            raise UsageError("--use-cluster-pool cannot be combined with --keep-test-dir or "
+                             "--enable-jacoco-code-coverage, as both need every test to own its cluster.")
+
         if self.skip_resource_intensive_tests and \
                 (self.only_resource_intensive_tests or self.force_execution_of_resource_intensive_tests):
             raise UsageError("--skip-resource-intensive-tests does not make any sense with either "
@@ -96,16 +134,111 @@ class DTestConfig:
         # test method could use any version it wants for self.cluster. However, we can
         # get the version from build.xml in the C* repository specified by
         # CASSANDRA_VERSION or CASSANDRA_DIR.
-        if self.cassandra_version is not None:
-            ccm_repo_cache_dir, _ = ccmlib.repository.setup(self.cassandra_version)
-            return get_version_from_build(ccm_repo_cache_dir)
-        elif self.cassandra_dir is not None:
-            return get_version_from_build(self.cassandra_dir)
+        return resolve_version_from_build(cassandra_dir=self.cassandra_dir, cassandra_version=self.cassandra_version)
+
+
+def get_dtest_config(config):
+    """
+    The DTestConfig of a pytest session, set up on first use and then shared by the hooks,
+    the fixtures and the upgrade manifest, instead of each of them reading the options and
+    resolving the Cassandra version again.
+
+    @param config The pytest config of the session
+    @return The DTestConfig of the session
+    @throws UsageError If the configuration is invalid
+    """
+    dtest_config = getattr(config, '_dtest_config', None)
+    if dtest_config is None:
+        dtest_config = DTestConfig()
+        dtest_config.setup(config)
+        config._dtest_config = dtest_config
+    return dtest_config
+
+
+def _version_cache_path():
+    return os.path.join(get_default_path(), VERSION_CACHE_FILE)
+
+
+def _load_version_cache():
+    try:
+        with open(_version_cache_path(), 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        # missing or corrupt, it is only ever a cache
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _store_version_cache(key, entry):
+    cache = _load_version_cache()
+    cache[key] = entry
+    path = _version_cache_path()
+    tmp = '{}.{}'.format(path, os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.debug("Failed to store the resolved Cassandra versions in {}: {}".format(path, e))
+
+
+def _build_stamp(install_dir):
+    """
+    @return The modification times of the files the version of an install directory is read
+            from, None if the directory doesn't exist
+    """
+    if not os.path.isdir(install_dir):
+        return None
+    # a list rather than a tuple, to compare equal to the stamp read back from the cache
+    return [os.path.getmtime(os.path.join(install_dir, f)) if os.path.exists(os.path.join(install_dir, f)) else None
+            for f in ('', 'build.xml', '0.version.txt')]
+
+
+def resolve_version_from_build(cassandra_dir=None, cassandra_version=None):
+    """
+    get_version_from_build() of a Cassandra directory, or of the ccm repository directory of a
+    version slug (fetched with ccmlib.repository.setup). Slugs staged for upgrade tests are
+    resolved from the build staged by upgrade_tests.artifacts. Directories and release slugs are
+    memoized on disk across sessions and test workers, and resolved again whenever the build
+    files of their directory change. Other slugs, e.g. git: or github: branches, name code
+    which moves without the checkout changing, so they are set up and resolved every time.
+
+    @return The version from build, None if neither a directory nor a slug is given
+    """
+    if cassandra_version is not None:
+        staged = staged_version_from_build(cassandra_version)
+        if staged is not None:
+            return staged
+        memoize = RELEASE_SLUG.match(cassandra_version) is not None
+        key = 'version:{}'.format(cassandra_version)
+        cached = _load_version_cache().get(key) if memoize else None
+        if cached is not None:
+            install_dir, stamp, version = cached
+            if _build_stamp(install_dir) == stamp:
+                return LooseVersion(version)
+        install_dir, _ = ccmlib.repository.setup(cassandra_version)
+    elif cassandra_dir is not None:
+        memoize = True
+        install_dir = os.path.realpath(cassandra_dir)
+        key = 'dir:{}'.format(install_dir)
+        cached = _load_version_cache().get(key)
+        if cached is not None and _build_stamp(install_dir) == cached[1]:
+            return LooseVersion(cached[2])
+    else:
+        return None
+
+    version = get_version_from_build(install_dir)
+    stamp = _build_stamp(install_dir)
+    if memoize and stamp is not None:
+        _store_version_cache(key, [install_dir, stamp, str(version)])
+    return version
 
 
 # Determine the location of the libjemalloc jar so that we can specify it
 # through environment variables when start Cassandra.  This reduces startup
-# time, making the dtests run faster.
+# time, making the dtests run faster. The location doesn't change within a session,
+# so the script only runs once.
+@functools.lru_cache(maxsize=None)
 def find_libjemalloc():
     if is_win():
         # let the normal bat script handle finding libjemalloc
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import namedtuple
+
+from ccmlib.cluster import Cluster
+from psutil import virtual_memory
+
+try:
+    import fcntl
+except ImportError:
+    # not available on windows, where dtests are never run in parallel
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# the memory a node is assumed to need when a test doesn't declare anything else
+DEFAULT_MEMORY_GB_PER_NODE = 1
+# the footprint a test is assumed to have when it doesn't declare anything else
+DEFAULT_NODES = 3
+# resource intensive tests historically assumed 9 instances at 3gb a piece
+RESOURCE_INTENSIVE_NODES = 9
+RESOURCE_INTENSIVE_MEMORY_GB_PER_NODE = 3
+# ccm spaces per-node ports 100 apart (e.g. jmx 7100, 7200, ...), which leaves room for this many workers
+MAX_WORKERS = 100
+
+
+class WorkerSlot(namedtuple('WorkerSlot', ['worker_id', 'index', 'run_id'])):
+    """
+    The slice of the machine owned by one dtest worker process when tests are executed
+    in parallel (pytest -n / run_dtests.py --dtest-parallel-workers).
+
+    Each worker gets its own loopback network (127.<index>.0.x), its own offset for the
+    ports ccm binds on 127.0.0.1 only (jmx, remote debug and byteman) and its own log and
+    last_test_dir locations, so several clusters can run side by side without colliding.
+    Worker 0, and every non parallel run, keeps the historical 127.0.0.x addresses and
+    default ports.
+    """
+
+    @property
+    def parallel(self):
+        return self.worker_id is not None
+
+    @property
+    def ipprefix(self):
+        return '127.{}.0.'.format(self.index)
+
+    def shift_port(self, port):
+        """
+        @param port A port as chosen by ccm, either an int or a str
+        @return The port this worker should use instead, of the same type as the one given
+        """
+        if not port or int(port) == 0:
+            return port
+        shifted = int(port) + self.index
+        return str(shifted) if isinstance(port, str) else shifted
+
+    @property
+    def log_saved_dir(self):
+        return os.path.join('logs', self.worker_id) if self.parallel else 'logs'
+
+    @property
+    def last_test_dir(self):
+        return 'last_test_dir_{}'.format(self.worker_id) if self.parallel else 'last_test_dir'
+
+
+def current_worker_slot():
+    """
+    @return The WorkerSlot of this process, as assigned by pytest-xdist through the environment
+    """
+    worker_id = os.environ.get('PYTEST_XDIST_WORKER')
+    if worker_id is None:
+        return WorkerSlot(worker_id=None, index=0, run_id=None)
+
+    # xdist names its workers gw0, gw1, ...
+    index = int(worker_id.lstrip('gw'))
+    if index >= MAX_WORKERS:
+        raise RuntimeError("At most {} parallel dtest workers are supported, got worker {}".format(MAX_WORKERS, worker_id))
+    return WorkerSlot(worker_id=worker_id, index=index, run_id=os.environ.get('PYTEST_XDIST_TESTRUNUID'))
+
+
+class PartitionedCluster(Cluster):
+    """
+    A ccm Cluster which keeps its nodes inside the addresses and ports of a WorkerSlot.
+    """
+
+    def __init__(self, path, name, worker_slot, **kwargs):
+        self.worker_slot = worker_slot
+        super(PartitionedCluster, self).__init__(path, name, **kwargs)
+
+    def populate(self, nodes, *args, **kwargs):
+        if kwargs.get('ipprefix') is None and kwargs.get('ipformat') is None:
+            kwargs['ipprefix'] = self.worker_slot.ipprefix
+        return super(PartitionedCluster, self).populate(nodes, *args, **kwargs)
+
+    def create_node(self, name, auto_bootstrap, thrift_interface, storage_interface, jmx_port, remote_debug_port,
+                    initial_token, *args, **kwargs):
+        if 'byteman_port' in kwargs:
+            kwargs['byteman_port'] = self.worker_slot.shift_port(kwargs['byteman_port'])
+        return super(PartitionedCluster, self).create_node(name, auto_bootstrap, thrift_interface, storage_interface,
+                                                           self.worker_slot.shift_port(jmx_port),
+                                                           self.worker_slot.shift_port(remote_debug_port),
+                                                           initial_token, *args, **kwargs)
+
+
+def total_memory_gb():
+    return virtual_memory().total / 1024 / 1024 / 1024
+
+
+def declared_test_resources(item):
+    """
+    The resources a test declared with the cluster_resources mark, e.g.
+    @pytest.mark.cluster_resources(nodes=6, memory_gb_per_node=2)
+
+    @return (nodes, memory_gb) needed by the test
+    """
+    if item.get_closest_marker('resource_intensive') is not None:
+        nodes, memory_gb_per_node = RESOURCE_INTENSIVE_NODES, RESOURCE_INTENSIVE_MEMORY_GB_PER_NODE
+    else:
+        nodes, memory_gb_per_node = DEFAULT_NODES, DEFAULT_MEMORY_GB_PER_NODE
+
+    marker = item.get_closest_marker('cluster_resources')
+    if marker is not None:
+        nodes = marker.kwargs.get('nodes', nodes)
+        memory_gb_per_node = marker.kwargs.get('memory_gb_per_node', memory_gb_per_node)
+    return nodes, nodes * memory_gb_per_node
+
+
+class ResourceScheduler(object):
+    """
+    Admits tests to run based on the memory their clusters need, so parallel workers
+    don't start more nodes than the machine can hold.
+
+    Workers of the same run coordinate through a small json ledger, guarded by an
+    exclusive file lock, which maps each worker to the memory it currently holds. A
+    test which needs more than what's left waits until other workers release enough;
+    a test is always admitted when nothing else is running so oversized tests can't
+    starve.
+    """
+
+    def __init__(self, worker_slot, capacity_gb=None, poll_interval=1):
+        self.worker_slot = worker_slot
+        self.capacity_gb = total_memory_gb() if capacity_gb is None else capacity_gb
+        self.poll_interval = poll_interval
+        ledger_name = 'dtest-resources-{}.json'.format(worker_slot.run_id or os.getpid())
+        self.ledger_path = os.path.join(tempfile.gettempdir(), ledger_name)
+
+    def can_ever_admit(self, memory_gb):
+        return memory_gb <= self.capacity_gb
+
+    def acquire(self, memory_gb, timeout=3600):
+        if not self.worker_slot.parallel or fcntl is None:
+            return
+
+        deadline = time.time() + timeout
+        waited = False
+        while True:
+            with self._locked_ledger() as ledger:
+                held_by_others = sum(v for k, v in ledger.items() if k != self.worker_slot.worker_id)
+                if held_by_others == 0 or held_by_others + memory_gb <= self.capacity_gb:
+                    ledger[self.worker_slot.worker_id] = memory_gb
+                    return
+            if time.time() > deadline:
+                raise RuntimeError("Waited {}s for {}GB of memory to run a test, but other workers still hold {}GB"
+                                   .format(timeout, memory_gb, held_by_others))
+            if not waited:
+                logger.info("Worker {} waiting for {}GB of memory, {}GB of {}GB held by other workers"
+                            .format(self.worker_slot.worker_id, memory_gb, held_by_others, self.capacity_gb))
+                waited = True
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        if not self.worker_slot.parallel or fcntl is None:
+            return
+
+        with self._locked_ledger() as ledger:
+            ledger.pop(self.worker_slot.worker_id, None)
+
+    def _locked_ledger(self):
+        return _LockedLedger(self.ledger_path)
+
+
+class _LockedLedger(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.ledger = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        content = os.read(self.fd, 1024 * 1024)
+        self.ledger = json.loads(content.decode('utf-8')) if content else {}
+        return self.ledger
+
+    def __exit__(self, exc_type, value, traceback):
+        try:
+            if exc_type is None:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.ftruncate(self.fd, 0)
+                os.write(self.fd, json.dumps(self.ledger).encode('utf-8'))
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
@@ -1,10 +1,8 @@
 import pytest
 import glob
 import os
-import shutil
 import time
 import logging
-import re
 import tempfile
 import subprocess
 import sys
@@ -19,12 +17,15 @@ from cassandra.policies import WhiteListRoundRobinPolicy
 from ccmlib.common import is_win
 from ccmlib.cluster import Cluster
 
+from dtest_parallel import current_worker_slot, PartitionedCluster
 from dtest import (get_ip_from_node, make_execution_profile, get_auth_provider, get_port_from_node,
                    get_eager_protocol_version, hack_legacy_parsing)
 from distutils.version import LooseVersion
 
 from tools.context import log_filter
+from tools.files import link_or_copy
 from tools.funcutils import merge_dicts
+from tools.logscanner import ClusterLogScanner, filter_errors
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +58,104 @@ def default_ignore_log_patterns():
             ]
 
 
+# settings of a session, and of its execution profiles, which callers change on the session they are given
+SESSION_DEFAULTS = ('row_factory', 'default_timeout', 'default_fetch_size')
+PROFILE_DEFAULTS = ('row_factory', 'request_timeout', 'consistency_level', 'serial_consistency_level')
+
+
+def _session_defaults(session):
+    profiles = session.cluster.profile_manager.profiles
+    return ({attr: getattr(session, attr) for attr in SESSION_DEFAULTS},
+            {name: {attr: getattr(profile, attr) for attr in PROFILE_DEFAULTS} for name, profile in profiles.items()})
+
+
+def _restore_session_defaults(session, defaults):
+    session_defaults, profile_defaults = defaults
+    for attr, value in session_defaults.items():
+        # the legacy settings can't even be set when execution profiles are used, only restore what changed
+        if getattr(session, attr) != value:
+            setattr(session, attr, value)
+    profiles = session.cluster.profile_manager.profiles
+    for name in list(profiles):
+        if name not in profile_defaults:
+            del profiles[name]
+    for name, attrs in profile_defaults.items():
+        for attr, value in attrs.items():
+            setattr(profiles[name], attr, value)
+
+
+class CqlSessionCache(object):
+    """
+    Keeps the driver sessions created by cql_connection and friends so that asking again for a
+    connection to the same node, with the same keyspace, credentials, protocol version,
+    load balancing and execution profile, reuses the session instead of paying for a new
+    control connection, schema fetch and pool warm-up.
+
+    A cached session is dropped when it was shut down, when its keyspace was changed, when
+    its node was stopped or restarted since the session was created, or when it is asked for
+    from a process forked after it was created (the driver's threads don't survive a fork).
+    Settings the previous caller changed on the session (e.g. default_fetch_size, or the
+    row_factory and timeout of its execution profiles) are reset to the ones it was
+    created with before it is handed out again.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(node, keyspace, user, password, compression, protocol_version, port, ssl_opts, whitelist,
+            execution_profiles, profile_kwargs):
+        """
+        @return The cache key for these connection arguments, or None if they can't be cached
+        """
+        if execution_profiles:
+            return None
+        try:
+            profile = tuple(sorted(profile_kwargs.items()))
+            ssl = tuple(sorted(ssl_opts.items())) if ssl_opts else None
+            key = (node.name, keyspace, user, password, compression, protocol_version, port, ssl, whitelist, profile)
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key, node):
+        if key is None:
+            return None
+        entry = self._sessions.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        session, pid, owner, defaults = entry
+        keyspace = key[1]
+        if owner != os.getpid() or session.is_shutdown or session.cluster.is_shutdown \
+                or session.keyspace != keyspace or not node.is_running() or node.pid != pid:
+            del self._sessions[key]
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        _restore_session_defaults(session, defaults)
+        self.hits += 1
+        return session
+
+    def put(self, key, node, session):
+        if key is not None:
+            self._sessions[key] = (session, node.pid, os.getpid(), _session_defaults(session))
+
+    def clear(self):
+        self._sessions = {}
+
+    def __repr__(self):
+        return '{cls}(size={size}, hits={hits}, misses={misses}, invalidations={invalidations})'.format(
+            cls=self.__class__.__name__, size=len(self._sessions), hits=self.hits, misses=self.misses,
+            invalidations=self.invalidations)
+
+
 class DTestSetup(object):
     def __init__(self, dtest_config=None, setup_overrides=None, cluster_name="test"):
         self.dtest_config = dtest_config
@@ -68,10 +167,12 @@ class DTestSetup(object):
         self.replacement_node = None
         self.allow_log_errors = False
         self.connections = []
+        self.connection_cache = CqlSessionCache() if dtest_config is not None and dtest_config.cache_cql_connections else None
+        self.worker_slot = current_worker_slot()
 
-        self.log_saved_dir = "logs"
+        self.log_saved_dir = self.worker_slot.log_saved_dir
         try:
-            os.mkdir(self.log_saved_dir)
+            os.makedirs(self.log_saved_dir)
         except OSError:
             pass
 
@@ -79,10 +180,13 @@ class DTestSetup(object):
         self.test_path = self.get_test_path()
         self.subprocs = []
         self.log_watch_thread = None
-        self.last_test_dir = "last_test_dir"
+        self._log_scanner = None
+        self.last_test_dir = self.worker_slot.last_test_dir
         self.jvm_args = []
         self.create_cluster_func = None
         self.iterations = 0
+        self.pooled_cluster = None
+        self.data_snapshots = None
 
     def install_legacy_parsing(self, node):
         hack_legacy_parsing(node)
@@ -133,16 +237,28 @@ class DTestSetup(object):
                 result.extend(glob.glob(ks_dir))
         return result
 
+    @property
+    def log_scanner(self):
+        """
+        The ClusterLogScanner of the current cluster. It tracks how far every node log was
+        read, so checking the logs for errors only reads what was logged since the last check.
+        """
+        if self._log_scanner is None or self._log_scanner.cluster is not self.cluster:
+            if self._log_scanner is not None:
+                self._log_scanner.close()
+            self._log_scanner = ClusterLogScanner(self.cluster)
+        return self._log_scanner
+
     def begin_active_log_watch(self):
         """
-        Calls into ccm to start actively watching logs.
+        Starts actively watching logs through the cluster's log scanner.
 
-        In the event that errors are seen in logs, ccm will call back to _log_error_handler.
+        In the event that errors are seen in logs, the scanner will call back to _log_error_handler.
 
         When the cluster is no longer in use, stop_active_log_watch should be called to end log watching.
         (otherwise a 'daemon' thread will (needlessly) run until the process exits).
         """
-        self.log_watch_thread = self.cluster.actively_watch_logs_for_error(self._log_error_handler, interval=0.25)
+        self.log_watch_thread = self.log_scanner.start(self._log_error_handler, interval=0.25)
 
     def _log_error_handler(self, errordata):
         """
@@ -193,19 +309,20 @@ class DTestSetup(object):
             basedir = str(int(time.time() * 1000)) + '_' + str(id(self))
             logdir = os.path.join(directory, basedir)
             os.mkdir(logdir)
+            # the cluster is still running, so its logs can be reflinked or copied but never hardlinked
             for n, log, debuglog, gclog, compactionlog in logs:
                 if os.path.exists(log):
                     assert os.path.getsize(log) >= 0
-                    shutil.copyfile(log, os.path.join(logdir, n + ".log"))
+                    link_or_copy(log, os.path.join(logdir, n + ".log"), allow_hardlink=False)
                 if os.path.exists(debuglog):
                     assert os.path.getsize(debuglog) >= 0
-                    shutil.copyfile(debuglog, os.path.join(logdir, n + "_debug.log"))
+                    link_or_copy(debuglog, os.path.join(logdir, n + "_debug.log"), allow_hardlink=False)
                 if os.path.exists(gclog):
                     assert os.path.getsize(gclog) >= 0
-                    shutil.copyfile(gclog, os.path.join(logdir, n + "_gc.log"))
+                    link_or_copy(gclog, os.path.join(logdir, n + "_gc.log"), allow_hardlink=False)
                 if os.path.exists(compactionlog):
                     assert os.path.getsize(compactionlog) >= 0
-                    shutil.copyfile(compactionlog, os.path.join(logdir, n + "_compaction.log"))
+                    link_or_copy(compactionlog, os.path.join(logdir, n + "_compaction.log"), allow_hardlink=False)
             if os.path.exists(name):
                 os.unlink(name)
             if not is_win():
@@ -221,15 +338,12 @@ class DTestSetup(object):
                                  password=None, compression=True, protocol_version=None, port=None, ssl_opts=None,
                                  **kwargs):
 
-        node_ip = get_ip_from_node(node)
-        wlrr = WhiteListRoundRobinPolicy([node_ip])
-
         return self._create_session(node, keyspace, user, password, compression,
-                                    protocol_version, port=port, ssl_opts=ssl_opts, load_balancing_policy=wlrr,
+                                    protocol_version, port=port, ssl_opts=ssl_opts, whitelist=True,
                                     **kwargs)
 
     def _create_session(self, node, keyspace, user, password, compression, protocol_version,
-                        port=None, ssl_opts=None, execution_profiles=None, **kwargs):
+                        port=None, ssl_opts=None, execution_profiles=None, whitelist=False, **kwargs):
         node_ip = get_ip_from_node(node)
         if not port:
             port = get_port_from_node(node)
@@ -237,6 +351,17 @@ class DTestSetup(object):
         if protocol_version is None:
             protocol_version = get_eager_protocol_version(node.cluster.version())
 
+        cache_key = None
+        if self.connection_cache is not None:
+            cache_key = CqlSessionCache.key(node, keyspace, user, password, compression, protocol_version, port,
+                                            ssl_opts, whitelist, execution_profiles, kwargs)
+            session = self.connection_cache.get(cache_key, node)
+            if session is not None:
+                return session
+
+        if whitelist:
+            kwargs['load_balancing_policy'] = WhiteListRoundRobinPolicy([node_ip])
+
         if user is not None:
             auth_provider = get_auth_provider(user=user, password=password)
         else:
@@ -260,8 +385,21 @@ class DTestSetup(object):
             session.set_keyspace(keyspace)
 
         self.connections.append(session)
+        if self.connection_cache is not None:
+            self.connection_cache.put(cache_key, node, session)
         return session
 
+    def shutdown_connections(self):
+        """
+        Shut down every driver session created through this DTestSetup.
+        """
+        for con in self.connections:
+            con.cluster.shutdown()
+        self.connections = []
+        if self.connection_cache is not None:
+            logger.debug("cql connection cache: {}".format(self.connection_cache))
+            self.connection_cache.clear()
+
     def patient_cql_connection(self, node, keyspace=None,
                                user=None, password=None, timeout=30, compression=True,
                                protocol_version=None, port=None, ssl_opts=None, **kwargs):
@@ -320,9 +458,10 @@ class DTestSetup(object):
         )
 
     def check_logs_for_errors(self):
+        all_errors = self.log_scanner.errors()
         for node in self.cluster.nodelist():
             errors = list(self.__filter_errors(
-                ['\n'.join(msg) for msg in node.grep_log_for_errors()]))
+                ['\n'.join(msg) for msg in all_errors.get(node.name, [])]))
             if len(errors) != 0:
                 for error in errors:
                     print("Unexpected error in {node_name} log, error: \n{error}".format(node_name=node.name, error=error))
@@ -330,12 +469,7 @@ class DTestSetup(object):
 
     def __filter_errors(self, errors):
         """Filter errors, removing those that match self.ignore_log_patterns"""
-        for e in errors:
-            for pattern in self.ignore_log_patterns:
-                if re.search(pattern, e) or re.search(pattern, e.replace('\n', ' ')):
-                    break
-            else:
-                yield e
+        return filter_errors(errors, self.ignore_log_patterns)
 
     def get_jfr_jvm_args(self):
         """
@@ -401,6 +535,8 @@ class DTestSetup(object):
                 try:
                     if self.log_watch_thread:
                         self.stop_active_log_watch()
+                    if self._log_scanner is not None:
+                        self._log_scanner.close()
                 finally:
                     logger.debug("removing ccm cluster {name} at: {path}".format(name=self.cluster.name,
                                                                                  path=self.test_path))
@@ -418,9 +554,7 @@ class DTestSetup(object):
                     self.cleanup_last_test_dir()
 
     def cleanup_and_replace_cluster(self):
-        for con in self.connections:
-            con.cluster.shutdown()
-        self.connections = []
+        self.shutdown_connections()
 
         self.cleanup_cluster()
         self.test_path = self.get_test_path()
@@ -504,9 +638,15 @@ class DTestSetup(object):
         version = dtest_setup.dtest_config.cassandra_version
 
         if version:
-            cluster = Cluster(dtest_setup.test_path, dtest_setup.cluster_name, cassandra_version=version)
+            install = {'cassandra_version': version}
+        else:
+            install = {'cassandra_dir': dtest_setup.dtest_config.cassandra_dir}
+
+        if dtest_setup.worker_slot.parallel:
+            # keep this worker's nodes off the addresses and ports of the other workers
+            cluster = PartitionedCluster(dtest_setup.test_path, dtest_setup.cluster_name, dtest_setup.worker_slot, **install)
         else:
-            cluster = Cluster(dtest_setup.test_path, dtest_setup.cluster_name, cassandra_dir=dtest_setup.dtest_config.cassandra_dir)
+            cluster = Cluster(dtest_setup.test_path, dtest_setup.cluster_name, **install)
 
         cluster.set_datadir_count(dtest_setup.dtest_config.data_dir_count)
         cluster.set_environment_variable('CASSANDRA_LIBJEMALLOC', dtest_setup.dtest_config.jemalloc_path)
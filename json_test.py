@@ -35,7 +35,9 @@ def build_doc_context(tester, test_name, prepare=True, connection=None, nodes=No
         if connection or nodes:
             raise RuntimeError("Cannot auto prepare doctest context when connection or nodes are provided.")
 
-        tester.cluster.populate(1).start()
+        # a cluster handed out by the cluster pool is already started
+        if not tester.cluster.nodelist():
+            tester.cluster.populate(1).start()
         nodes = tester.cluster.nodelist()
         connection = tester.patient_cql_connection(nodes[0])
         connection.execute("CREATE KEYSPACE {} WITH REPLICATION = {{'class': 'SimpleStrategy', 'replication_factor': 1}};".format(default_ks_name))
@@ -198,6 +200,7 @@ def run_func_docstring(tester, test_func, globs=None, verbose=False, compileflag
 
 
 @since('2.2')
+@pytest.mark.reusable_cluster(nodes=1)
 class TestToJsonSelect(Tester):
     """
     Tests using toJson with a SELECT statement
@@ -458,6 +461,7 @@ class TestToJsonSelect(Tester):
 
 
 @since('2.2')
+@pytest.mark.reusable_cluster(nodes=1)
 class TestFromJsonUpdate(Tester):
     """
     Tests using fromJson within UPDATE statements.
@@ -759,6 +763,7 @@ class TestFromJsonUpdate(Tester):
 
 
 @since('2.2')
+@pytest.mark.reusable_cluster(nodes=1)
 class TestFromJsonSelect(Tester):
     """
     Tests using fromJson in conjunction with a SELECT statement
@@ -841,6 +846,7 @@ class TestFromJsonSelect(Tester):
 
 
 @since('2.2')
+@pytest.mark.reusable_cluster(nodes=1)
 class TestFromJsonInsert(Tester):
     """
     Tests using fromJson within INSERT statements.
@@ -1064,6 +1070,7 @@ class TestFromJsonInsert(Tester):
 
 
 @since('2.2')
+@pytest.mark.reusable_cluster(nodes=1)
 class TestFromJsonDelete(Tester):
     """
     Tests using fromJson within DELETE statements.
@@ -1128,6 +1135,7 @@ class TestFromJsonDelete(Tester):
 
 
 @since('2.2')
+@pytest.mark.reusable_cluster(nodes=1)
 class TestJsonFullRowInsertSelect(Tester):
     """
     Tests for creating full rows from json documents, selecting full rows back as json documents, and related functionality.
@@ -27,6 +27,7 @@ from tools.assertions import (assert_all, assert_crc_check_chance_equal,
 from tools.data import rows_to_list
 from tools.misc import new_node
 from tools.jmxutils import (JolokiaAgent, make_mbean)
+from tools.management import get_management_client
 
 since = pytest.mark.since
 logger = logging.getLogger(__name__)
@@ -91,24 +92,18 @@ class TestMaterializedViews(Tester):
 
     def _settle_nodes(self):
         logger.debug("Settling all nodes")
-        stage_match = re.compile(r"(?P<name>\S+)\s+(?P<active>\d+)\s+(?P<pending>\d+)\s+(?P<completed>\d+)\s+(?P<blocked>\d+)\s+(?P<alltimeblocked>\d+)")
+        client = get_management_client(self.cluster)
 
         def _settled_stages(node):
-            (stdout, stderr, rc) = node.nodetool("tpstats")
-            lines = re.split("\n+", stdout)
-            for line in lines:
-                match = stage_match.match(line)
-                if match is not None:
-                    active = int(match.group('active'))
-                    pending = int(match.group('pending'))
-                    if active != 0 or pending != 0:
-                        logger.debug("%s - pool %s still has %d active and %d pending" % (node.name, match.group("name"), active, pending))
-                        return False
+            for name, stats in client.tpstats(node).items():
+                if stats.active != 0 or stats.pending != 0:
+                    logger.debug("%s - pool %s still has %d active and %d pending" % (node.name, name, stats.active, stats.pending))
+                    return False
             return True
 
         for node in self.cluster.nodelist():
             if node.is_running():
-                node.nodetool("replaybatchlog")
+                client.replay_batchlog(node)
                 attempts = 50  # 100 milliseconds per attempt, so 5 seconds total
                 while attempts > 0 and not _settled_stages(node):
                     time.sleep(0.1)
@@ -6,8 +6,10 @@ from mock import Mock
 
 from tools.assertions import (assert_all, assert_almost_equal, assert_exception,
                               assert_invalid, assert_length_equal, assert_none,
-                              assert_one, assert_row_count, assert_stderr_clean,
-                              assert_unauthorized, assert_unavailable)
+                              assert_lists_equal_ignoring_order, assert_one, assert_row_count,
+                              assert_rows_equal_ignoring_order,
+                              assert_stderr_clean, assert_unauthorized, assert_unavailable)
+from tools.paging import PageAssertionMixin
 import pytest
 
 class TestAssertStderrClean(TestCase):
@@ -113,3 +115,35 @@ class TestAssertionMethods(TestCase):
     def test_almost_equal_expect_failure(self):
         with pytest.raises(AssertionError):
             assert_almost_equal(1, 1.3, error=.1)
+
+    def test_rows_equal_ignoring_order_canonicalizes_driver_types(self):
+        assert_rows_equal_ignoring_order([[0, {10: 11}, {1, 2}], [1, None, set()]],
+                                         [(1, None, frozenset()), [0, [10, 11], {2, 1}]])
+
+    def test_rows_equal_ignoring_order_counts_duplicates(self):
+        with pytest.raises(AssertionError) as e:
+            assert_rows_equal_ignoring_order([[1, 1], [1, 1], [2, 2]], [[1, 1], [2, 2], [3, 3]], "for test")
+        message = str(e.value)
+        assert message.startswith("for test")
+        assert "1 missing row(s):\n    [3, 3]" in message
+        assert "1 unexpected row(s):\n    [1, 1]" in message
+
+    def test_rows_equal_ignoring_order_bounds_the_diff(self):
+        with pytest.raises(AssertionError) as e:
+            assert_rows_equal_ignoring_order([[i] for i in range(100)], [])
+        assert "... and 90 more" in str(e.value)
+
+    def test_lists_equal_ignoring_order_compares_dicts(self):
+        assert_lists_equal_ignoring_order([{'id': 2, 'value': 'b'}, {'id': 1, 'value': 'a'}],
+                                          [{'id': 1, 'value': 'a'}, {'value': 'b', 'id': 2}])
+        with pytest.raises(AssertionError):
+            assert_lists_equal_ignoring_order([{'id': 1, 'value': 'a'}], [{'id': 1, 'value': 'b'}])
+
+    def test_page_assertions_ignore_order(self):
+        assertions = PageAssertionMixin()
+        assertions.assertEqualIgnoreOrder([(1, {10: 11}), (0, None)], [[0, None], [1, [10, 11]]])
+        # distinct rows are compared, and dict rows by their column names, as they always were
+        assertions.assertEqualIgnoreOrder([[1, 1], [1, 1]], [[1, 1]])
+        assertions.assertEqualIgnoreOrder([{'id': 1}], [{'id': 2}])
+        with pytest.raises(AssertionError):
+            assertions.assertEqualIgnoreOrder([[1, 1]], [[1, 2]])
@@ -0,0 +1,172 @@
+import os
+import shutil
+import tempfile
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from mock import Mock
+
+from dtest_cluster_pool import ClusterPool, ClusterPoolKey
+
+
+class FakeNode(object):
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.running = False
+        self.nodetool_calls = []
+        os.makedirs(self.log_directory())
+
+    def log_directory(self):
+        return os.path.join(self.path, 'logs')
+
+    def is_running(self):
+        return self.running
+
+    def nodetool(self, cmd):
+        self.nodetool_calls.append(cmd)
+
+
+class FakeCluster(object):
+
+    def __init__(self, test_path):
+        self.name = 'test'
+        self.path = os.path.join(test_path, self.name)
+        self.nodes = []
+        self._config_options = {}
+        self.removed = False
+
+    def populate(self, nodes):
+        self.nodes = [FakeNode('node{}'.format(i + 1), os.path.join(self.path, 'node{}'.format(i + 1)))
+                      for i in range(nodes)]
+        return self
+
+    def start(self, **kwargs):
+        for node in self.nodes:
+            node.running = True
+
+    def nodelist(self):
+        return self.nodes
+
+    def version(self):
+        return '4.1'
+
+    def set_configuration_options(self, values):
+        self._config_options.update(values)
+
+    def remove(self):
+        shutil.rmtree(self.path)
+        self.removed = True
+
+
+class FakeSession(object):
+
+    def __init__(self, keyspaces):
+        self.keyspaces = keyspaces
+        self.statements = []
+        metadata = Mock()
+        metadata.keyspaces = {'system_traces': Mock(tables={'sessions': None, 'events': None})}
+        self.cluster = Mock(metadata=metadata)
+
+    def execute(self, statement, timeout=None):
+        self.statements.append(statement)
+        if statement.startswith('SELECT keyspace_name'):
+            return [Mock(keyspace_name=ks) for ks in self.keyspaces]
+        return []
+
+
+class FakeDTestSetup(object):
+
+    def __init__(self, root, keyspaces=('system', 'system_schema')):
+        self.dtest_config = Mock(cassandra_dir='/cassandra', cassandra_version=None, num_tokens=None,
+                                 data_dir_count=1, use_off_heap_memtables=False, use_vnodes=False)
+        self.setup_overrides = None
+        self.cluster_name = 'test'
+        self.test_path = tempfile.mkdtemp(dir=root)
+        self.cluster = None
+        self.create_cluster_func = None
+        self.pooled_cluster = None
+        self.connections = []
+        self.session = FakeSession(keyspaces)
+
+    def initialize_cluster(self, create_cluster_func):
+        self.create_cluster_func = create_cluster_func
+        self.cluster = create_cluster_func(self.test_path)
+
+    def patient_cql_connection(self, node):
+        self.connections.append(self.session)
+        return self.session
+
+
+class TestClusterPool(TestCase):
+
+    def test_key(self):
+        with TemporaryDirectory() as tmp:
+            dtest_setup = FakeDTestSetup(tmp)
+            assert ClusterPoolKey.for_test(dtest_setup, [2, 2]) == ClusterPoolKey.for_test(FakeDTestSetup(tmp), (2, 2))
+            assert ClusterPoolKey.for_test(dtest_setup, 3) != ClusterPoolKey.for_test(dtest_setup, [3])
+            other_dir = FakeDTestSetup(tmp)
+            other_dir.dtest_config.cassandra_dir = '/other'
+            assert ClusterPoolKey.for_test(dtest_setup, 3) != ClusterPoolKey.for_test(other_dir, 3)
+
+    def test_reuse_and_reset(self):
+        with TemporaryDirectory() as tmp:
+            pool = ClusterPool()
+            first = FakeDTestSetup(tmp)
+            pool.acquire(first, FakeCluster, nodes=2)
+            cluster = first.cluster
+            assert [n.is_running() for n in cluster.nodelist()] == [True, True]
+            log = os.path.join(cluster.nodelist()[0].log_directory(), 'system.log')
+            with open(log, 'w') as f:
+                f.write('ERROR from the first test')
+            assert pool.release(first, failed=False)
+
+            second = FakeDTestSetup(tmp, keyspaces=('system', 'ks', 'system_auth'))
+            second_path = second.test_path
+            pool.acquire(second, FakeCluster, nodes=2)
+            assert second.cluster is cluster
+            assert second.test_path == first.test_path
+            assert not os.path.exists(second_path)
+            assert (pool.hits, pool.misses) == (1, 1)
+
+            statements = second.session.statements
+            assert 'DROP KEYSPACE "ks"' in statements
+            assert not any('system' in s for s in statements if s.startswith('DROP'))
+            assert 'TRUNCATE system_traces.sessions' in statements
+            assert not any('repair_history' in s for s in statements)
+            assert second.connections == []
+            assert all(n.nodetool_calls == ['clearsnapshot --all'] for n in cluster.nodelist())
+            assert os.path.getsize(log) == 0
+
+            # another shape doesn't get the cluster, which is evicted to make room
+            third = FakeDTestSetup(tmp)
+            pool.release(second, failed=False)
+            pool.acquire(third, FakeCluster, nodes=3)
+            assert third.cluster is not cluster
+            assert cluster.removed
+            assert not os.path.exists(first.test_path)
+            pool.release(third, failed=False)
+            pool.close()
+            assert third.cluster.removed
+
+    def test_not_reused(self):
+        with TemporaryDirectory() as tmp:
+            pool = ClusterPool()
+
+            failed = FakeDTestSetup(tmp)
+            pool.acquire(failed, FakeCluster, nodes=1)
+            assert not pool.release(failed, failed=True)
+
+            stopped = FakeDTestSetup(tmp)
+            pool.acquire(stopped, FakeCluster, nodes=1)
+            stopped.cluster.nodelist()[0].running = False
+            assert not pool.release(stopped, failed=False)
+
+            reconfigured = FakeDTestSetup(tmp)
+            pool.acquire(reconfigured, FakeCluster, nodes=1)
+            reconfigured.cluster.set_configuration_options({'hinted_handoff_enabled': False})
+            assert not pool.release(reconfigured, failed=False)
+
+            assert not pool.release(FakeDTestSetup(tmp), failed=False)
+            assert (pool.hits, pool.misses) == (0, 3)
@@ -0,0 +1,63 @@
+import os
+from unittest import TestCase
+
+from mock import Mock
+
+from dtest_setup import CqlSessionCache
+
+
+def _mock_session(keyspace=None):
+    profile = Mock(row_factory='named_tuple_factory', request_timeout=10.0, consistency_level=1,
+                   serial_consistency_level=None)
+    session = Mock(keyspace=keyspace, is_shutdown=False, row_factory='named_tuple_factory', default_timeout=10.0,
+                   default_fetch_size=5000)
+    session.cluster.is_shutdown = False
+    session.cluster.profile_manager.profiles = {'default': profile}
+    return session
+
+
+def _key(node, keyspace=None, **profile_kwargs):
+    return CqlSessionCache.key(node, keyspace, None, None, True, 4, 9042, None, False, None, profile_kwargs)
+
+
+class TestCqlSessionCache(TestCase):
+
+    def test_reuse(self):
+        cache = CqlSessionCache()
+        node = Mock(pid=100)
+        node.name = 'node1'
+        node.is_running.return_value = True
+        session = _mock_session()
+
+        assert cache.get(_key(node), node) is None
+        cache.put(_key(node), node, session)
+        assert cache.get(_key(node), node) is session
+        assert cache.get(_key(node, keyspace='ks'), node) is None
+        assert cache.get(_key(node, request_timeout=60), node) is None
+        assert CqlSessionCache.key(node, None, None, None, True, 4, 9042, None, False, {'other': None}, {}) is None
+
+        # restarted node
+        node.pid = 101
+        assert cache.get(_key(node), node) is None
+        assert (cache.hits, cache.misses, cache.invalidations) == (1, 4, 1)
+
+    def test_settings_are_reset(self):
+        cache = CqlSessionCache()
+        node = Mock(pid=os.getpid())
+        node.name = 'node1'
+        session = _mock_session()
+        cache.put(_key(node), node, session)
+
+        # what a previous caller did to the session it was given
+        session.default_fetch_size = 2
+        profile = session.cluster.profile_manager.profiles['default']
+        profile.row_factory = 'dict_factory'
+        profile.request_timeout = 120
+        session.cluster.profile_manager.profiles['added'] = Mock()
+
+        assert cache.get(_key(node), node) is session
+        assert session.default_fetch_size == 5000
+        assert session.row_factory == 'named_tuple_factory'
+        assert (profile.row_factory, profile.request_timeout, profile.consistency_level) == \
+            ('named_tuple_factory', 10.0, 1)
+        assert list(session.cluster.profile_manager.profiles) == ['default']
@@ -0,0 +1,62 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from pytest import raises
+
+from cqlsh_tests import cqlsh_tools
+from cqlsh_tests.cqlsh_tools import SpilledMultiset, assert_multisets_equal
+
+
+def _items(n, prefix=b'row'):
+    # items of the same length, the case a hash seeded by the depth doesn't spread
+    return [prefix + b'%06d' % i for i in range(n)]
+
+
+class TestSpilledMultiset(TestCase):
+
+    def test_equal_in_any_order(self):
+        with TemporaryDirectory() as tmp:
+            with SpilledMultiset(tmp) as expected, SpilledMultiset(tmp) as actual:
+                expected.add_all(_items(1000) + [b'dup', b'dup'])
+                actual.add_all(reversed(_items(1000) + [b'dup', b'dup']))
+                assert (expected.count, expected.size) == (1002, 9006)
+                assert_multisets_equal(expected, actual)
+            assert os.listdir(tmp) == []
+
+    def test_differences_are_counted_and_shown(self):
+        with SpilledMultiset() as expected, SpilledMultiset() as actual:
+            expected.add_all([b'a', b'b', b'b', b'c'])
+            actual.add_all([b'a', b'b', b'd', b'd', b'd'])
+            with raises(AssertionError) as e:
+                assert_multisets_equal(expected, actual, describe=lambda item: item.decode())
+            message = str(e.value)
+            assert message.startswith("2 of 4 expected items missing, 3 of 5 actual items unexpected.")
+            assert "Missing: ['b', 'c']" in message or "Missing: ['c', 'b']" in message
+            assert "Unexpected: ['d']" in message
+
+    def test_splits_spread_items(self):
+        with TemporaryDirectory() as tmp:
+            with SpilledMultiset(tmp) as items:
+                items.add_all(_items(3200))
+                items.flush()
+                partition = items.paths[0]
+                for depth in (1, 2):
+                    # the items of a partition, not just all the items, are spread by every split
+                    sizes = []
+                    for path in cqlsh_tools._split(partition, depth):
+                        sizes.append(len(list(cqlsh_tools._read_items(path))))
+                        os.unlink(path)
+                    assert sum(sizes) == len(list(cqlsh_tools._read_items(partition)))
+                    assert max(sizes) < sum(sizes) / 2, sizes
+
+    def test_compared_piecewise_within_budget(self):
+        with SpilledMultiset(partitions=2) as expected, SpilledMultiset(partitions=2) as actual:
+            expected.add_all(_items(2000))
+            actual.add_all(_items(1999) + [b'other'])
+            # far less than the partitions need, so they are split and compared in parallel processes
+            with raises(AssertionError) as e:
+                assert_multisets_equal(expected, actual, max_memory=16 * 1024, workers=2,
+                                       describe=lambda item: item.decode())
+            assert str(e.value).startswith("1 of 2000 expected items missing, 1 of 2000 actual items unexpected.")
+            assert "Missing: ['row001999']\nUnexpected: ['other']" in str(e.value)
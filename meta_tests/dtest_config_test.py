@@ -1,12 +1,18 @@
+import json
 import os
+from distutils.version import LooseVersion
 from re import search
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
-from dtest_config import DTestConfig
+import dtest_config
+from dtest_config import DTestConfig, get_dtest_config, resolve_version_from_build
 from mock import Mock, patch
 from pytest import UsageError, raises
 import ccmlib.repository
 import ccmlib.common
+from upgrade_tests import artifacts
+from upgrade_tests.artifacts import StagedVersion
 
 
 def _mock_responses(responses, default_response=None):
@@ -51,6 +57,13 @@ class DTestConfigTest(TestCase):
             assert c.cassandra_version == '3.2'
             assert search("^3.2", str(c.cassandra_version_from_build))
 
+    def test_copy_benchmark_regression_threshold(self):
+        assert _check_with_params({}).copy_benchmark_regression_threshold == 0.2
+        assert _check_with_params({'--copy-benchmark-regression-threshold': '0.5'}).copy_benchmark_regression_threshold == 0.5
+        _check_with_params_expect({
+            '--copy-benchmark-regression-threshold': '1.5'
+        }, "must be a number between 0 and 1")
+
     def test_valid_cass_dir_no_version(self):
         c = _check_with_params({
         })
@@ -119,3 +132,45 @@ class DTestConfigTest(TestCase):
             '--use-off-heap-memtables': True
         })
         assert c.use_off_heap_memtables
+
+    def test_dtest_config_is_set_up_once(self):
+        config = Mock(spec=['getoption', 'getini'])
+        config.getoption.side_effect = _mock_responses({})
+        config.getini.side_effect = _mock_responses({})
+        c = get_dtest_config(config)
+        calls = config.getoption.call_count
+        assert get_dtest_config(config) is c
+        assert config.getoption.call_count == calls
+
+    def test_version_from_build_is_memoized(self):
+        cassandra_dir = "%s/meta_tests/cassandra-dir-4.0-beta" % os.getcwd()
+        with TemporaryDirectory() as ccm_dir, \
+                patch.object(dtest_config, "get_default_path", return_value=ccm_dir), \
+                patch.object(dtest_config, "get_version_from_build", wraps=ccmlib.common.get_version_from_build) as resolve:
+            version = resolve_version_from_build(cassandra_dir=cassandra_dir)
+            assert resolve_version_from_build(cassandra_dir=cassandra_dir) == version
+            assert resolve.call_count == 1
+
+    def test_only_releases_are_memoized(self):
+        install_dir = "%s/meta_tests/cassandra-dir-3.2" % os.getcwd()
+        with TemporaryDirectory() as ccm_dir, \
+                patch.object(dtest_config, "get_default_path", return_value=ccm_dir), \
+                patch.object(ccmlib.repository, "setup", return_value=(install_dir, '3.2.0')) as setup:
+            version = resolve_version_from_build(cassandra_version='3.2.0')
+            assert resolve_version_from_build(cassandra_version='3.2.0') == version
+            assert setup.call_count == 1
+            with open(os.path.join(ccm_dir, dtest_config.VERSION_CACHE_FILE)) as f:
+                assert json.load(f)['version:3.2.0'][2] == str(version)
+
+            # a branch can move on without its checkout changing
+            for _ in range(2):
+                assert resolve_version_from_build(cassandra_version='github:apache/cassandra-3.2') == version
+            assert setup.call_count == 3
+
+    def test_staged_versions_are_not_set_up_again(self):
+        staged = StagedVersion(version='github:apache/cassandra-4.1', address='github-apache-0123', install_dir='/staged',
+                               commit='0123', version_from_build=LooseVersion('4.1.3-SNAPSHOT'))
+        with patch.dict(artifacts._staged, {staged.version: staged}), \
+                patch.object(ccmlib.repository, "setup") as setup:
+            assert resolve_version_from_build(cassandra_version='github:apache/cassandra-4.1') == '4.1.3-SNAPSHOT'
+            assert not setup.called
@@ -0,0 +1,59 @@
+import os
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from dtest_parallel import current_worker_slot, declared_test_resources, ResourceScheduler, WorkerSlot
+
+
+def _mock_markers(markers):
+    item = Mock()
+    item.get_closest_marker.side_effect = lambda name: markers.get(name)
+    return item
+
+
+class TestWorkerSlot(TestCase):
+
+    def test_not_parallel_keeps_defaults(self):
+        with patch.dict(os.environ, clear=True):
+            slot = current_worker_slot()
+        assert not slot.parallel
+        assert slot.ipprefix == '127.0.0.'
+        assert slot.shift_port('7100') == '7100'
+        assert slot.log_saved_dir == 'logs'
+        assert slot.last_test_dir == 'last_test_dir'
+
+    def test_workers_are_partitioned(self):
+        with patch.dict(os.environ, {'PYTEST_XDIST_WORKER': 'gw3', 'PYTEST_XDIST_TESTRUNUID': 'abc'}):
+            slot = current_worker_slot()
+        assert slot.parallel
+        assert slot.ipprefix == '127.3.0.'
+        assert slot.shift_port('7100') == '7103'
+        assert slot.shift_port(7200) == 7203
+        assert slot.shift_port('0') == '0'
+        assert slot.log_saved_dir == os.path.join('logs', 'gw3')
+        assert slot.last_test_dir == 'last_test_dir_gw3'
+
+
+class TestResourceScheduler(TestCase):
+
+    def test_declared_resources(self):
+        assert declared_test_resources(_mock_markers({})) == (3, 3)
+        assert declared_test_resources(_mock_markers({'resource_intensive': Mock()})) == (9, 27)
+        marker = Mock(kwargs={'nodes': 6, 'memory_gb_per_node': 2})
+        assert declared_test_resources(_mock_markers({'cluster_resources': marker})) == (6, 12)
+
+    def test_admission_is_bounded_by_capacity(self):
+        run_id = 'meta-{}'.format(os.getpid())
+        first = ResourceScheduler(WorkerSlot('gw0', 0, run_id), capacity_gb=10)
+        second = ResourceScheduler(WorkerSlot('gw1', 1, run_id), capacity_gb=10)
+        try:
+            first.acquire(8)
+            with self.assertRaises(RuntimeError):
+                second.acquire(4, timeout=0)
+            first.release()
+            second.acquire(4, timeout=0)
+        finally:
+            first.release()
+            second.release()
+            os.remove(first.ledger_path)
@@ -0,0 +1,42 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from mock import patch
+from pytest import raises
+
+from upgrade_tests import artifacts
+from upgrade_tests.artifacts import StagedVersion, StagingError, content_address, is_staged_version, stage_versions
+
+
+def _fake_stage(version, root):
+    if version == 'github:apache/broken':
+        raise StagingError("does not build")
+    return StagedVersion(version=version, address=content_address(version, 'abc'), install_dir='/staged/' + version,
+                         commit='abc', version_from_build=None)
+
+
+class UpgradeArtifactsTest(TestCase):
+
+    def test_content_address(self):
+        assert content_address('4.0.8') == 'release-4.0.8'
+        assert content_address('github:apache/cassandra-4.1', 'abc') == 'github-apache-abc'
+        assert content_address('git:cassandra-4.0', 'abc') == 'apache-abc'
+        assert is_staged_version('github:apache/trunk')
+        assert not is_staged_version('clone:/home/me/cassandra')
+
+    def test_stage_versions(self):
+        with TemporaryDirectory() as ccm_dir, \
+                patch.object(artifacts, "get_default_path", return_value=ccm_dir), \
+                patch.object(artifacts, "_staged", {}), \
+                patch.object(artifacts, "_stage", side_effect=_fake_stage) as stage:
+            staged = stage_versions(['4.0.8', 'github:apache/trunk', '4.0.8', 'clone:/somewhere'])
+            assert list(staged) == ['4.0.8', 'github:apache/trunk']
+            assert artifacts.staged_install_dir('github:apache/trunk') == '/staged/github:apache/trunk'
+            assert artifacts.staged_install_dir('clone:/somewhere') is None
+
+            with raises(StagingError, match='github:apache/broken'):
+                stage_versions(['4.0.8', '4.1.1', 'github:apache/broken'])
+            assert artifacts.staged_install_dir('4.1.1') == '/staged/4.1.1'
+            # every version is staged once per process
+            assert sorted(c[0][0] for c in stage.call_args_list) == \
+                ['4.0.8', '4.1.1', 'github:apache/broken', 'github:apache/trunk']
@@ -0,0 +1,106 @@
+import queue
+import threading
+from collections import Counter
+from unittest import TestCase
+
+from mock import Mock
+from pytest import raises
+
+from tools.bulkload import BulkLoader, formatted, random_ints, sequence
+
+
+class FakeStatement(object):
+
+    def __init__(self, key, keyspace='ks'):
+        self.key = key
+        self.routing_key = str(key).encode('utf-8')
+        self.keyspace = keyspace
+        self.consistency_level = None
+
+
+class FakeFuture(object):
+
+    def __init__(self, statement):
+        self.statement = statement
+
+    def add_callbacks(self, callback, errback, callback_args=(), errback_args=()):
+        self.callback = lambda result: callback(result, *callback_args)
+        self.errback = lambda error: errback(error, *errback_args)
+
+
+class FakeSession(object):
+    """
+    Completes the requests in the background, failing those of the keys in fail.
+    Replicas are 'even' or 'odd' hosts depending on the key.
+    """
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.executed = []
+        self.in_flight = Counter()
+        self.max_in_flight = Counter()
+        self.cluster = Mock()
+        self.cluster.metadata.get_replicas.side_effect = lambda ks, key: ['even' if int(key) % 2 == 0 else 'odd']
+        self._lock = threading.Lock()
+        self._futures = queue.Queue()
+        self._completer = threading.Thread(target=self._complete, daemon=True)
+        self._completer.start()
+
+    def _host(self, statement):
+        return 'even' if statement.key % 2 == 0 else 'odd'
+
+    def execute_async(self, statement):
+        with self._lock:
+            self.executed.append(statement)
+            host = self._host(statement)
+            self.in_flight[host] += 1
+            self.max_in_flight[host] = max(self.max_in_flight[host], self.in_flight[host])
+        future = FakeFuture(statement)
+        self._futures.put(future)
+        return future
+
+    def _complete(self):
+        while True:
+            future = self._futures.get()
+            # let requests pile up so that the window is what bounds them
+            threading.Event().wait(0.001)
+            with self._lock:
+                self.in_flight[self._host(future.statement)] -= 1
+            if future.statement.key in self.fail:
+                future.errback(Exception("write timeout on {}".format(future.statement.key)))
+            else:
+                future.callback(None)
+
+
+class TestBulkLoader(TestCase):
+
+    def test_generators(self):
+        assert list(sequence(3, 4)) == [3, 4, 5, 6]
+        assert list(random_ints(42, 5)) == list(random_ints(42, 5))
+        assert all(0 <= v < 10 for v in random_ints(1, 100, high=10))
+        assert list(formatted('k{}', sequence(0, 2))) == ['k0', 'k1']
+
+    def test_window_per_replica(self):
+        session = FakeSession()
+        stats = BulkLoader(session, in_flight_per_host=4, consistency_level=2).execute_all(
+            FakeStatement(key) for key in range(200))
+        assert stats.rows == 200
+        assert len(session.executed) == 200
+        assert all(statement.consistency_level == 2 for statement in session.executed)
+        assert set(session.max_in_flight) == {'even', 'odd'}
+        assert all(1 <= count <= 4 for count in session.max_in_flight.values())
+
+    def test_failures_release_the_window(self):
+        # every write of one replica fails: with a window of 2, a window that isn't released
+        # by the errback would block the load on the third of them forever
+        session = FakeSession(fail=range(1, 200, 2))
+        loader = BulkLoader(session, in_flight_per_host=2)
+        with raises(Exception, match='write timeout on 1'):
+            loader.execute_all(FakeStatement(key) for key in range(200))
+        # no more statements are sent once one failed
+        assert len(session.executed) < 200
+
+        # the windows are all free again for the next load
+        session.fail = set()
+        assert loader.execute_all(FakeStatement(key) for key in range(20)).rows == 20
+        assert all(window._value == 2 for window in loader._windows.values())
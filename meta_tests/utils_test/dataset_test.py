@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from tools.dataset import Dataset, MAX_TOKEN, MIN_TOKEN, token_ranges, _Verification
+
+
+class TestDataset(TestCase):
+
+    def test_values_are_a_function_of_seed_index_and_version(self):
+        dataset = Dataset(seed=1, count=10, key_format='k{}')
+        assert dataset.value(3) == Dataset(seed=1, count=10).value(3)
+        assert dataset.value(3) != Dataset(seed=2, count=10).value(3)
+        assert dataset.value(3) != dataset.value(4)
+
+        overwritten = dataset.overwrite(2, 4)
+        assert overwritten.value(3) != dataset.value(3)
+        assert overwritten.value(4) == dataset.value(4)
+        assert overwritten.overwrite(3, 5).value(3) != overwritten.value(3)
+
+    def test_keys_map_back_to_their_index(self):
+        dataset = Dataset(seed=1, count=10, key_format='k{}')
+        assert [k for k, _ in dataset.rows(8)] == ['k8', 'k9']
+        assert dataset.index('k7') == 7
+        assert dataset.index('k10') is None
+        assert dataset.index('x7') is None
+        assert Dataset(seed=1, count=10).index(7) == 7
+
+    def test_token_ranges_cover_the_ring(self):
+        ranges = token_ranges(5)
+        assert ranges[0][0] == MIN_TOKEN
+        assert ranges[-1][1] == MAX_TOKEN
+        assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+    def test_verification_reports_wrong_missing_and_unexpected_rows(self):
+        dataset = Dataset(seed=1, count=5, key_format='k{}')
+        verification = _Verification(dataset, max_reported=10)
+        rows = list(dataset.rows())
+        verification.check(rows[:2] + [('k3', 'wrong'), ('k9', 'extra')])
+        result = verification.result()
+        assert not result.ok
+        assert (result.rows_read, result.mismatched, result.missing, result.unexpected) == (4, 1, 2, 1)
+
+        verification = _Verification(dataset, max_reported=10)
+        verification.check(dataset.rows())
+        assert verification.result().ok
@@ -0,0 +1,115 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from tools.datasnapshots import DataSnapshots
+
+
+class FakeNode(object):
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.running = False
+        for directory in ('data0', 'data1', 'commitlogs', 'saved_caches'):
+            os.makedirs(os.path.join(path, directory))
+
+    def get_path(self):
+        return self.path
+
+    def data_directories(self):
+        return [os.path.join(self.path, 'data0'), os.path.join(self.path, 'data1')]
+
+    def is_running(self):
+        return self.running
+
+
+class FakeCluster(object):
+
+    def __init__(self, path):
+        self.name = 'test'
+        self.partitioner = 'org.apache.cassandra.dht.Murmur3Partitioner'
+        self.nodes = [FakeNode('node1', os.path.join(path, 'node1')), FakeNode('node2', os.path.join(path, 'node2'))]
+
+    def nodelist(self):
+        return self.nodes
+
+    def version(self):
+        return '4.1.3'
+
+    def start(self, **kwargs):
+        for node in self.nodes:
+            node.running = True
+
+    def stop(self, **kwargs):
+        for node in self.nodes:
+            node.running = False
+
+    def flush(self):
+        pass
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+class TestDataSnapshots(TestCase):
+
+    def test_restore_or_build(self):
+        with TemporaryDirectory() as tmp:
+            snapshots = DataSnapshots(os.path.join(tmp, 'snapshots'))
+            builds = []
+
+            def build(cluster):
+                def write():
+                    assert all(node.is_running() for node in cluster.nodelist())
+                    builds.append(cluster)
+                    for node in cluster.nodelist():
+                        _write(os.path.join(node.path, 'data1', 'ks', 'cf-1', 'nb-1-big-Data.db'), node.name)
+                        _write(os.path.join(node.path, 'data1', 'ks', 'cf-1', 'nb-1-big-Statistics.db'), 'stats')
+                        _write(os.path.join(node.path, 'commitlogs', 'CommitLog-7-1.log'), 'segment')
+                    return 42
+                return write
+
+            first = FakeCluster(os.path.join(tmp, 'first'))
+            assert snapshots.restore_or_build(first, 'ks.cf', ('insert', 10), build(first)) == 42
+            assert all(node.is_running() for node in first.nodelist())
+
+            second = FakeCluster(os.path.join(tmp, 'second'))
+            _write(os.path.join(second.nodes[0].path, 'data0', 'ks', 'cf-2', 'nb-9-big-Data.db'), 'stale')
+            second.start()
+            assert snapshots.restore_or_build(second, 'ks.cf', ('insert', 10), build(second)) == 42
+            assert builds == [first]
+            assert (snapshots.hits, snapshots.misses) == (1, 1)
+
+            node1 = second.nodes[0]
+            data = os.path.join(node1.path, 'data1', 'ks', 'cf-1', 'nb-1-big-Data.db')
+            statistics = os.path.join(node1.path, 'data1', 'ks', 'cf-1', 'nb-1-big-Statistics.db')
+            assert _read(data) == 'node1'
+            assert _read(os.path.join(node1.path, 'commitlogs', 'CommitLog-7-1.log')) == 'segment'
+            assert not os.path.exists(os.path.join(node1.path, 'data0', 'ks', 'cf-2'))
+            # components rewritten in place are never hardlinked to the snapshot
+            assert os.stat(statistics).st_nlink == 1
+
+            # another recipe is another baseline
+            third = FakeCluster(os.path.join(tmp, 'third'))
+            snapshots.restore_or_build(third, 'ks.cf', ('insert', 20), build(third))
+            assert builds == [first, third]
+
+            # and so is another configuration of the cluster, whatever order it was set in
+            configured = FakeCluster(os.path.join(tmp, 'configured'))
+            configured._config_options = {'hinted_handoff_enabled': False, 'commitlog_sync': 'batch'}
+            snapshots.restore_or_build(configured, 'ks.cf', ('insert', 10), build(configured), start=False)
+            assert builds == [first, third, configured]
+            assert not any(node.is_running() for node in configured.nodelist())
+            reconfigured = FakeCluster(os.path.join(tmp, 'reconfigured'))
+            reconfigured._config_options = {'commitlog_sync': 'batch', 'hinted_handoff_enabled': False}
+            snapshots.restore_or_build(reconfigured, 'ks.cf', ('insert', 10), build(reconfigured))
+            assert builds == [first, third, configured]
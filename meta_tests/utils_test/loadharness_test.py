@@ -0,0 +1,79 @@
+import queue
+import uuid
+from unittest import TestCase
+
+from cassandra import WriteTimeout
+from mock import Mock
+from pytest import raises
+
+from tools import loadharness
+from tools.loadharness import (COUNTERS_WORKLOAD, LATENCY_BUCKETS, READ, VALUES_WORKLOAD, WRITE, ContinuousLoad,
+                               IntervalStats, LoadError, LoadReport, RecordRing)
+
+
+class TestRecordRing(TestCase):
+
+    def test_records_come_out_in_order_and_the_ring_is_bounded(self):
+        ring = RecordRing(capacity=3, record_size=4)
+        for i in range(3):
+            assert ring.put_nowait(bytes([i] * 4))
+        assert not ring.put_nowait(b'full')
+        assert len(ring) == 3
+
+        assert ring.get_nowait() == bytes([0] * 4)
+        assert ring.put_nowait(b'wrap')
+        assert [ring.get_nowait() for _ in range(3)] == [bytes([1] * 4), bytes([2] * 4), b'wrap']
+        assert ring.get(timeout=0.01) is None
+
+    def test_workload_records_round_trip(self):
+        key = uuid.uuid4()
+        assert COUNTERS_WORKLOAD.decode(COUNTERS_WORKLOAD.encode(key, 42)) == (key, 42)
+
+
+class TestLoadReport(TestCase):
+
+    def test_summary_is_per_phase_and_operation(self):
+        def latencies(bucket, count):
+            histogram = [0] * len(LATENCY_BUCKETS)
+            histogram[bucket] = count
+            return histogram
+
+        report = LoadReport(['before', 'restart'], [
+            IntervalStats('w0', WRITE, 0, 100.0, 10, 0, latencies(1, 10), 0.0002),
+            IntervalStats('w1', WRITE, 0, 100.5, 10, 0, latencies(1, 10), 0.0002),
+            IntervalStats('w0', WRITE, 1, 101.0, 10, 5, latencies(8, 5), 0.02),
+            IntervalStats('c0', READ, 1, 101.0, 4, 0, latencies(2, 4), 0.0004),
+        ], mismatches=[], writes=25)
+
+        before, restart_writes, restart_reads = report.summary()
+        assert (before.phase, before.operation, before.count, before.errors) == ('before', WRITE, 20, 0)
+        assert before.p99 == LATENCY_BUCKETS[1]
+        assert (restart_writes.count, restart_writes.error_rate, restart_writes.p50) == (10, 0.5, LATENCY_BUCKETS[8])
+        assert restart_reads.operation == READ
+        assert report.series('before', WRITE) == [(100.0, 20, 0, LATENCY_BUCKETS[1])]
+
+
+class TestContinuousLoad(TestCase):
+
+    def test_only_timeouts_are_tolerated(self):
+        stats_queue = queue.Queue()
+        loadharness._check_error('load-writer-0', WriteTimeout("timed out"), stats_queue)
+        loadharness._check_error('load-writer-0', Exception("ID mismatch while trying to reprepare"), stats_queue)
+        assert stats_queue.empty()
+
+        with raises(RuntimeError):
+            loadharness._check_error('load-writer-0', RuntimeError("unconfigured table cf"), stats_queue)
+        assert stats_queue.get_nowait() == LoadError('load-writer-0', "RuntimeError('unconfigured table cf')")
+
+    def test_errors_are_reported_when_a_process_died(self):
+        load = ContinuousLoad(None, VALUES_WORKLOAD, phase='before upgrade')
+        assert load.phases == ['before upgrade']
+
+        load._stats_queue = queue.Queue()
+        load._stats_queue.put(LoadError('load-writer-0', "RuntimeError('unconfigured table cf')"))
+        dead = Mock(exitcode=1)
+        dead.name = 'load-writer-0'
+        dead.is_alive.return_value = False
+        load.processes = [dead]
+        with raises(RuntimeError, match=r"load-writer-0 \(exit code 1\)\nload-writer-0: RuntimeError"):
+            load.check_alive()
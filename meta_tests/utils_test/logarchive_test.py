@@ -0,0 +1,69 @@
+import os
+import threading
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from mock import patch
+from pytest import raises
+
+from tools import files, logarchive
+from tools.files import link_or_copy
+from tools.logarchive import LogArchiver
+
+
+def _write(path, size):
+    # random, so that compression doesn't bring it under the size budget
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+
+
+class TestLinkOrCopy(TestCase):
+
+    def test_no_partial_copy_left_behind(self):
+        with TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, 'system.log')
+            dst = os.path.join(tmp, 'archived.log')
+            _write(src, 1024)
+
+            def fail_halfway(source, target):
+                _write(target, 10)
+                raise OSError("No space left on device")
+            with patch.object(files, 'reflink', return_value=False), \
+                    patch.object(files.shutil, 'copyfile', side_effect=fail_halfway):
+                with raises(OSError):
+                    link_or_copy(src, dst, allow_hardlink=False)
+            assert not os.path.exists(dst)
+
+            assert link_or_copy(src, dst, allow_hardlink=False) in ('reflink', 'copy')
+            assert os.path.getsize(dst) == 1024
+
+
+class TestLogArchiver(TestCase):
+
+    def test_eviction_skips_archives_being_compressed(self):
+        with TemporaryDirectory() as tmp:
+            directory = os.path.join(tmp, 'logs')
+            os.makedirs(directory)
+            log = os.path.join(tmp, 'system.log')
+            _write(log, 600 * 1024)
+
+            release = threading.Event()
+            compress = logarchive._compress
+
+            def slow_compress(path):
+                release.wait(10)
+                return compress(path)
+
+            archiver = LogArchiver(directory, compress=True, max_size_mb=1, workers=1)
+            with patch.object(logarchive, '_compress', side_effect=slow_compress):
+                archiver.archive([(log, 'node1.log')], '1_test_one', allow_hardlink=False)
+                archiver.archive([(log, 'node1.log')], '2_test_two', allow_hardlink=False)
+                # over budget, but the oldest archive is still being compressed
+                archiver.evict(keep='2_test_two')
+                assert sorted(os.listdir(directory)) == ['1_test_one', '2_test_two']
+                release.set()
+                archiver.close()
+
+            # the eviction queued by the second archive ran once the first one was compressed
+            assert os.listdir(directory) == ['2_test_two']
+            assert os.listdir(os.path.join(directory, '2_test_two')) in (['node1.log.gz'], ['node1.log.zst'])
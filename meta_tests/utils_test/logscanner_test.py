@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock
+
+from tools.logscanner import filter_errors, is_ignored_error, ClusterLogScanner, LogErrorParser, LogTail
+
+
+class TestLogTail(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _append(self, text):
+        with open(self.path, 'a') as f:
+            f.write(text)
+
+    def test_reads_only_appended_lines(self):
+        tail = LogTail(self.path)
+        self._append("one\ntwo\n")
+        assert tail.read_lines() == ['one', 'two']
+        assert tail.read_lines() == []
+        self._append("three\n")
+        assert tail.read_lines() == ['three']
+        tail.close()
+
+    def test_incomplete_line_is_kept_for_next_read(self):
+        tail = LogTail(self.path)
+        self._append("one\ntw")
+        assert tail.read_lines() == ['one']
+        self._append("o\n")
+        assert tail.read_lines() == ['two']
+        tail.close()
+
+    def test_truncated_log_is_read_from_start(self):
+        tail = LogTail(self.path)
+        self._append("one\ntwo\n")
+        assert tail.read_lines() == ['one', 'two']
+        with open(self.path, 'w') as f:
+            f.write("three\n")
+        assert tail.read_lines() == ['three']
+        tail.close()
+
+    def test_missing_log(self):
+        tail = LogTail(self.path + '.missing')
+        assert tail.read_lines() == []
+
+
+class TestLogErrorParser(TestCase):
+
+    def test_errors_with_stack_traces(self):
+        parser = LogErrorParser()
+        errors = []
+        assert parser.parse(['INFO  [main] starting',
+                             'ERROR [main] boom',
+                             'java.lang.RuntimeException: boom',
+                             '\tat Foo.bar(Foo.java:1)'], errors) == 1
+        # a stack trace split between two reads stays part of the same error
+        assert parser.parse(['\tat Foo.baz(Foo.java:2)',
+                             'INFO  [main] still running'], errors) == 0
+        assert errors == [['ERROR [main] boom',
+                           'java.lang.RuntimeException: boom',
+                           '\tat Foo.bar(Foo.java:1)',
+                           '\tat Foo.baz(Foo.java:2)']]
+
+
+class FakeNode(object):
+
+    def __init__(self, name, directory):
+        self.name = name
+        self.directory = directory
+        self.error_mark = 0
+
+    def log_directory(self):
+        return self.directory
+
+    def mark_log_for_errors(self):
+        self.error_mark = os.path.getsize(os.path.join(self.directory, 'system.log'))
+
+
+class TestClusterLogScanner(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.node = FakeNode('node1', self.directory)
+        self.cluster = Mock()
+        self.cluster.nodelist.return_value = [self.node]
+        self.scanner = ClusterLogScanner(self.cluster)
+
+    def tearDown(self):
+        self.scanner.close()
+        shutil.rmtree(self.directory)
+
+    def _append(self, text, filename='system.log'):
+        with open(os.path.join(self.directory, filename), 'a') as f:
+            f.write(text)
+
+    def test_errors_before_the_error_mark_are_ignored(self):
+        self._append("ERROR [main] crashed on purpose\n\tat Foo.bar(Foo.java:1)\n")
+        self.node.mark_log_for_errors()
+        assert self.scanner.scan() == {}
+        assert self.scanner.errors() == {}
+
+        self._append("INFO  [main] restarted\nERROR [main] real failure\n")
+        assert self.scanner.errors() == {'node1': [['ERROR [main] real failure']]}
+
+    def test_errors_already_scanned_are_ignored_once_marked(self):
+        self._append("ERROR [main] crashed on purpose\n")
+        assert self.scanner.scan() == {'node1': [['ERROR [main] crashed on purpose']]}
+        self.node.mark_log_for_errors()
+        self._append("ERROR [main] real failure\n")
+        assert self.scanner.scan() == {'node1': [['ERROR [main] real failure']]}
+        assert self.scanner.errors() == {'node1': [['ERROR [main] real failure']]}
+
+    def test_errors_of_logs_rotated_before_the_error_mark_are_ignored(self):
+        self._append("ERROR [main] crashed on purpose\n")
+        self.scanner.scan()
+        os.rename(os.path.join(self.directory, 'system.log'), os.path.join(self.directory, 'system.log.1'))
+        self._append("INFO  [main] restarted\n")
+        self.scanner.scan()
+        self.node.mark_log_for_errors()
+        assert self.scanner.errors() == {}
+
+
+class TestIgnorePatterns(TestCase):
+
+    def test_combined_patterns(self):
+        patterns = ['Connection reset', r'protocol version \(5\)']
+        assert is_ignored_error('ERROR failed: Connection reset by peer', patterns)
+        assert is_ignored_error('ERROR Invalid protocol version (5)', patterns)
+        assert not is_ignored_error('ERROR something else', patterns)
+        assert not is_ignored_error('ERROR something else', [])
+
+    def test_newlines_are_matched_as_spaces(self):
+        assert is_ignored_error('ERROR first\nsecond', ['first second'])
+
+    def test_patterns_which_cannot_be_combined(self):
+        patterns = ['(?i)connection RESET', 'other']
+        assert list(filter_errors(['ERROR Connection reset', 'ERROR other', 'ERROR kept'], patterns)) == ['ERROR kept']
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ccmlib.node import TimeoutError
+from mock import patch
+from pytest import raises
+
+from tools import logwatch
+from tools.logwatch import NodeLogBus
+
+
+class FakeNode(object):
+
+    def __init__(self, path):
+        self.name = 'node1'
+        self.path = path
+
+    def log_directory(self):
+        return self.path
+
+
+def _append(path, text):
+    with open(path, 'a') as f:
+        f.write(text)
+
+
+class TestNodeLogBus(TestCase):
+
+    def _check_bus(self, bus, log):
+        _append(log, "INFO starting\nINFO Starting listening for CQL clients\n")
+        mark = os.path.getsize(log)
+        # waiters registered at the same time are fed by the same reader
+        flushed = bus.register("Completed flushing (.*)-Data.db", from_mark=mark)
+        compacted = bus.register(["Compacting", "Compacted"], from_mark=mark)
+
+        def write_later():
+            time.sleep(0.2)
+            _append(log, "INFO Compacting ks.tbl\nINFO Completed flushing nb-1-big-Data.db\nINFO Compac")
+            time.sleep(0.2)
+            _append(log, "ted 4 sstables\n")
+        writer = threading.Thread(target=write_later)
+        writer.start()
+
+        line, match = flushed.wait(timeout=10)
+        assert match.group(1) == 'nb-1-big'
+        assert [line for line, _ in compacted.wait(timeout=10)] == ["INFO Compacting ks.tbl", "INFO Compacted 4 sstables"]
+        writer.join()
+
+        # lines the reader already went past are matched from the mark
+        line, _ = bus.wait_for("listening for CQL", from_mark=0, timeout=1)
+        assert line == "INFO Starting listening for CQL clients"
+        with raises(TimeoutError, match='not found'):
+            bus.wait_for("listening for CQL", from_mark=mark, timeout=0.5)
+        assert bus._waiters == []
+
+    def test_inotify(self):
+        with TemporaryDirectory() as tmp:
+            log = os.path.join(tmp, 'system.log')
+            bus = NodeLogBus(FakeNode(tmp))
+            try:
+                if os.uname().sysname == 'Linux':
+                    assert bus._inotify.fd is not None
+                self._check_bus(bus, log)
+            finally:
+                bus.close()
+            assert bus._inotify.fd is None
+
+    def test_polling_without_inotify(self):
+        with TemporaryDirectory() as tmp, \
+                patch.object(logwatch.ctypes, 'CDLL', side_effect=OSError("no libc")):
+            log = os.path.join(tmp, 'system.log')
+            bus = NodeLogBus(FakeNode(tmp))
+            try:
+                assert bus._inotify.fd is None
+                self._check_bus(bus, log)
+            finally:
+                bus.close()
+
+    def test_dead_process(self):
+        with TemporaryDirectory() as tmp:
+            bus = NodeLogBus(FakeNode(tmp))
+            process = type('Process', (), {'returncode': 1, 'poll': lambda self: 1})()
+            try:
+                with raises(RuntimeError, match='process is dead'):
+                    bus.wait_for("Starting listening", timeout=10, process=process)
+            finally:
+                bus.close()
@@ -0,0 +1,112 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+from pytest import raises
+
+from tools import management
+from tools.management import ManagementClient, ThreadPoolStats
+
+TPSTATS = """Pool Name                         Active   Pending      Completed   Blocked  All time blocked
+MutationStage                          0         3           1024         0                 0
+ReadStage                              1         0             17         0                 0
+"""
+
+
+class FakeAgent(object):
+
+    def __init__(self, node):
+        self.node = node
+        self.shared = False
+        self.stopped = False
+        self.responses = node.responses
+
+    def start(self):
+        if self.node.attach_error is not None:
+            raise self.node.attach_error
+        self.node.attached += 1
+
+    def stop(self):
+        self.stopped = True
+
+    def read_pattern(self, pattern):
+        return self._respond()
+
+    def read_patterns(self, patterns):
+        return self._respond()
+
+    def _respond(self):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def _node(responses=(), attach_error=None):
+    node = Mock(pid=100, responses=list(responses), attach_error=attach_error, attached=0)
+    node.name = 'node1'
+    node.is_running.return_value = True
+    node.nodetool.return_value = (TPSTATS, '', 0)
+    return node
+
+
+def _pool_mbean(pool, metric):
+    return 'org.apache.cassandra.metrics:type=ThreadPools,path=request,scope={},name={}'.format(pool, metric)
+
+
+class TestManagementClient(TestCase):
+
+    def setUp(self):
+        patcher = patch.object(management, 'JolokiaAgent', FakeAgent)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_over_jmx(self):
+        node = _node([{_pool_mbean('MutationStage', 'PendingTasks'): {'Value': 3},
+                       _pool_mbean('MutationStage', 'CompletedTasks'): {'Count': 1024}}])
+        client = ManagementClient(Mock())
+        assert client.tpstats(node) == {'MutationStage': ThreadPoolStats(0, 3, 1024, 0, 0)}
+        assert not node.nodetool.called
+
+    def test_falls_back_to_cli(self):
+        stats = {'MutationStage': ThreadPoolStats(0, 3, 1024, 0, 0), 'ReadStage': ThreadPoolStats(1, 0, 17, 0, 0)}
+
+        # the request fails, then fails again through a reattached agent
+        node = _node([ConnectionError("agent stopped"), Exception("Jolokia agent returned non-200 status")])
+        client = ManagementClient(Mock())
+        assert client.tpstats(node) == stats
+        assert node.attached == 2
+
+        # a failure once is retried through a new agent
+        node = _node([ConnectionError("agent stopped"), {}])
+        assert ManagementClient(Mock()).tpstats(node) == {}
+        assert not node.nodetool.called
+
+        # an agent which can't be attached isn't tried again
+        node = _node(attach_error=Exception("no jdk"))
+        client = ManagementClient(Mock())
+        assert client.tpstats(node) == stats
+        assert client.tpstats(node) == stats
+        assert node.nodetool.call_count == 2
+
+    def test_read_patterns(self):
+        mbeans = {'org.apache.cassandra.db:type=StorageService': {'Keyspaces': ['ks']}}
+        node = _node([mbeans, Exception("failed"), Exception("failed again")])
+        client = ManagementClient(Mock())
+        assert client.read_patterns(node, ['org.apache.cassandra.db:type=StorageService']) == mbeans
+        with raises(RuntimeError, match="without a jolokia agent"):
+            client.read_patterns(node, ['org.apache.cassandra.db:type=StorageService'])
+        assert not node.nodetool.called
+
+    def test_close_detaches_agents(self):
+        running = _node([{}])
+        restarted = _node([{}])
+        restarted.name = 'node2'
+        client = ManagementClient(Mock())
+        client.tpstats(running)
+        client.tpstats(restarted)
+        agents = [agent for agent, _ in client._attached]
+        restarted.pid = 200
+
+        client.close()
+        assert [agent.stopped for agent in agents] == [True, False]
+        assert client._agents == {}
@@ -0,0 +1,37 @@
+import threading
+from unittest import TestCase
+
+import pytest
+
+from dtest import MultiError
+from tools.matrix import MatrixCaseError, concurrency_for, run_matrix
+
+
+class TestRunMatrix(TestCase):
+
+    def test_concurrency_is_sized_to_the_cluster(self):
+        assert concurrency_for(['node1', 'node2', 'node3']) == 12
+        assert concurrency_for(['node{}'.format(i) for i in range(20)]) == 32
+        assert concurrency_for([]) == 1
+
+    def test_cases_run_concurrently_and_are_reported_in_order(self):
+        barrier = threading.Barrier(3, timeout=10)
+        report = run_matrix([3, 1, 2], lambda case: barrier.wait(), max_workers=3)
+        assert [r.case for r in report.results] == [3, 1, 2]
+        assert not report.failures
+        assert report.slowest(1)[0].seconds >= 0
+
+    def test_every_case_runs_and_failures_are_collected(self):
+        ran = []
+
+        def func(case):
+            ran.append(case)
+            if case % 2:
+                raise ValueError(case)
+
+        with pytest.raises(MultiError) as e:
+            run_matrix(range(6), func, max_workers=2, describe=lambda case: 'case {}'.format(case))
+        assert sorted(ran) == list(range(6))
+        assert all(isinstance(exc, MatrixCaseError) for exc in e.value.exceptions)
+        assert sorted(exc.description for exc in e.value.exceptions) == ['case 1', 'case 3', 'case 5']
+        assert all('ValueError' in tb for tb in e.value.tracebacks)
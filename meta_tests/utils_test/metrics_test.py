@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+import pytest
+from mock import Mock, patch
+
+from tools import metrics
+from tools.jmxutils import JolokiaAgent
+from tools.metrics import COUNTER, METER, TIMER, FamilySnapshot, _family_key, take_snapshot
+
+LATENCY = {'Count': 0, 'Min': 0, 'Max': 0, 'Mean': None, 'StdDev': 0, '50thPercentile': 0, '75thPercentile': 0,
+           '95thPercentile': 0, '98thPercentile': 0, '99thPercentile': 0, '999thPercentile': 0,
+           'RecentValues': [0] * 128, 'DurationUnit': 'microseconds', 'OneMinuteRate': 0.0}
+FAILURES = {'Count': 0, 'MeanRate': 0.0, 'OneMinuteRate': 0.0, 'FiveMinuteRate': 0.0, 'FifteenMinuteRate': 0.0,
+            'RateUnit': 'events/second'}
+
+
+def snapshot(latency_count, failures_count, unit='microseconds'):
+    latency = dict(LATENCY, Count=latency_count, DurationUnit=unit, RecentValues=[latency_count] * 128)
+    return FamilySnapshot('ClientRequest', {
+        ('node1', 'Write', 'Latency'): latency,
+        ('node1', 'Write', 'Failures'): dict(FAILURES, Count=failures_count),
+        ('node1', 'Write-ONE', 'Latency'): dict(LATENCY),
+        ('node2', 'Write', 'Latency'): dict(LATENCY, Count=7),
+    }, taken_at=0)
+
+
+class TestFamilySnapshot(TestCase):
+
+    def test_mbean_names_map_to_node_scope_and_name(self):
+        assert _family_key('node1', 'org.apache.cassandra.metrics:type=ClientRequest,scope=Write-ONE,name=Latency') == \
+            ('node1', 'Write-ONE', 'Latency')
+        assert _family_key('node1', 'org.apache.cassandra.metrics:type=Table,keyspace=ks,scope=tbl,name=ReadLatency') == \
+            ('node1', 'ks.tbl', 'ReadLatency')
+        assert _family_key('node1', 'org.apache.cassandra.metrics:type=ReadRepair,name=SpeculatedRead') == \
+            ('node1', None, 'SpeculatedRead')
+
+    def test_diff_reports_changed_attributes_of_one_scope(self):
+        baseline, updated = snapshot(0, 0), snapshot(5, 2)
+        diff = updated.diff(baseline, 'node1', 'Write')
+        assert diff == {'Latency.Count': 5, 'Failures.Count': 2}
+        assert diff.scope == 'Write'
+        assert updated.diff(baseline, 'node1', 'Write-ONE') == {}
+        assert updated.total('Write', 'Latency') == 12
+        assert updated.value('node2', 'Write', 'Latency') == 7
+        assert updated.scopes('node1') == ['Write', 'Write-ONE']
+
+    def test_validate_checks_each_metric_by_kind(self):
+        metrics = {'Latency': TIMER, 'Failures': METER}
+        snapshot(0, 0).validate('node1', 'Write', metrics, '4.1')
+        with pytest.raises(AssertionError):
+            snapshot(0, 0, unit='milliseconds').validate('node1', 'Write', metrics, '4.1')
+        with pytest.raises(AssertionError):
+            snapshot(0, 0).validate('node1', 'Write', {'Missing': COUNTER}, '4.1')
+
+
+NOT_FOUND = {'status': 404, 'error_type': 'javax.management.InstanceNotFoundException'}
+TABLE_MBEAN = 'org.apache.cassandra.metrics:type=Table,keyspace=ks,scope=tbl,name=LiveSSTableCount'
+
+
+class TestMetricsSnapshot(TestCase):
+
+    def test_unmatched_patterns_are_skipped(self):
+        agent = JolokiaAgent(Mock(pid=1))
+        with patch.object(agent, '_post', return_value=NOT_FOUND):
+            assert agent.read_pattern('org.apache.cassandra.metrics:type=Table,keyspace=ks,*') == {}
+        with patch.object(agent, '_post', return_value=[NOT_FOUND, {'status': 200, 'value': {TABLE_MBEAN: {'Value': 2}}}]):
+            assert agent.read_patterns(['org.apache.cassandra.metrics:type=ClientRequest,*',
+                                        'org.apache.cassandra.metrics:type=Table,*']) == {TABLE_MBEAN: {'Value': 2}}
+        with patch.object(agent, '_post', return_value={'status': 500, 'error': 'boom'}):
+            with pytest.raises(Exception, match='non-200'):
+                agent.read_pattern('org.apache.cassandra.metrics:type=Table,*', verbose=False)
+
+    def test_take_snapshot(self):
+        node = Mock()
+        node.name = 'node1'
+        cluster = Mock()
+        cluster.version.return_value = '4.1'
+        client = Mock()
+        # a fresh table has no latency and no client request metrics yet
+        client.read_patterns.return_value = {
+            TABLE_MBEAN: {'Value': 2},
+            'org.apache.cassandra.metrics:type=ThreadPools,path=request,scope=ReadStage,name=PendingTasks': {'Value': 1},
+            'org.apache.cassandra.metrics:type=Compaction,name=PendingTasks': {'Value': 0},
+        }
+        with patch.object(metrics, 'get_management_client', return_value=client):
+            snapshot = take_snapshot(cluster, nodes=[node], keyspace='ks')
+        # every pattern is read with one request per node
+        assert client.read_patterns.call_count == 1
+        table = snapshot.table('node1', 'ks', 'tbl')
+        assert (table.live_sstable_count, table.read_latency) == (2, None)
+        assert snapshot.nodes['node1'].thread_pools['ReadStage'].pending == 1
+        assert snapshot.nodes['node1'].pending_compactions == 0
+        assert snapshot.nodes['node1'].read_latency is None
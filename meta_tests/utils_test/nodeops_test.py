@@ -0,0 +1,64 @@
+import threading
+from unittest import TestCase
+
+from pytest import raises
+
+from dtest import MultiError
+from tools import nodeops
+from tools.nodeops import NodeOperationError, run_on_nodes
+
+
+class FakeNode(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+
+    def nodetool(self, cmd):
+        self.calls.append(cmd)
+        return 'out ' + self.name, ''
+
+
+class TestRunOnNodes(TestCase):
+
+    def test_results_in_node_order(self):
+        nodes = [FakeNode('node{}'.format(i)) for i in range(1, 5)]
+        barrier = threading.Barrier(len(nodes), timeout=10)
+
+        def concurrently(node):
+            # only returns if every node is operated on at the same time
+            barrier.wait()
+            return node.name.upper()
+        assert list(run_on_nodes(nodes, concurrently).items()) == \
+            [('node1', 'NODE1'), ('node2', 'NODE2'), ('node3', 'NODE3'), ('node4', 'NODE4')]
+
+        order = []
+        run_on_nodes(reversed(nodes), lambda node: order.append(node.name), ordered=True)
+        assert order == ['node4', 'node3', 'node2', 'node1']
+
+    def test_every_failure_is_collected(self):
+        nodes = [FakeNode('node{}'.format(i)) for i in range(1, 5)]
+        attempted = []
+
+        def fail_on_even(node):
+            attempted.append(node.name)
+            if node.name in ('node2', 'node4'):
+                raise RuntimeError("{} is down".format(node.name))
+            return node.name
+
+        for ordered in (False, True):
+            del attempted[:]
+            with raises(MultiError) as e:
+                run_on_nodes(nodes, fail_on_even, ordered=ordered, description='repair')
+            assert sorted(attempted) == ['node1', 'node2', 'node3', 'node4']
+            errors = e.value.exceptions
+            assert [type(error) for error in errors] == [NodeOperationError, NodeOperationError]
+            assert [error.node.name for error in errors] == ['node2', 'node4']
+            assert [str(error.cause) for error in errors] == ['node2 is down', 'node4 is down']
+            assert 'repair failed on node2' in str(e.value)
+            assert len(e.value.tracebacks) == 2 and 'node4 is down' in e.value.tracebacks[1]
+
+    def test_nodetool(self):
+        nodes = [FakeNode('node1'), FakeNode('node2')]
+        assert nodeops.nodetool(nodes, 'flush ks') == {'node1': ('out node1', ''), 'node2': ('out node2', '')}
+        assert [node.calls for node in nodes] == [['flush ks'], ['flush ks']]
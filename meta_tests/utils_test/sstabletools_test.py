@@ -0,0 +1,59 @@
+import os
+import tempfile
+import uuid
+from unittest import TestCase
+
+from tools.sstabletools import levels, parse_sstablemetadata
+
+OUTPUT_40 = """SSTable: {dir}/nb-1-big
+Partitioner: org.apache.cassandra.dht.Murmur3Partitioner
+Bloom Filter FP chance: 0.01
+Minimum timestamp: 1580845497085001 (02/04/2020 20:24:57)
+Maximum timestamp: 1580845497097004 (02/04/2020 20:24:57)
+SSTable min local deletion time: 2147483647 (no tombstones)
+SSTable Level: 2
+Repaired at: 1580845500000 (02/04/2020 20:25:00)
+Pending repair: --
+Partition Size:
+   Size (bytes) Count
+   Minimum timestamp: 12
+SSTable: {dir}/nb-2-big
+Minimum timestamp: 1580845497085002
+Maximum timestamp: 1580845497085003
+SSTable Level: 0
+Repaired at: 0
+Pending repair: 5b8e8b90-4796-11ea-8c0f-0fb0e3b1bd25
+"""
+
+OUTPUT_30 = """SSTable: {dir}/ks-cf-ka-1-Data.db
+Minimum timestamp: 1
+Maximum timestamp: 2
+SSTable Level: 1
+Repaired at: 0
+"""
+
+
+class TestParseSSTableMetadata(TestCase):
+
+    def test_fields_of_every_sstable_are_parsed(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, 'nb-1-big-Data.db'), 'wb') as f:
+                f.write(b'x' * 100)
+            with open(os.path.join(d, 'nb-1-big-Index.db'), 'wb') as f:
+                f.write(b'x' * 20)
+            first, second = parse_sstablemetadata(OUTPUT_40.format(dir=d))
+
+        assert first.path == os.path.join(d, 'nb-1-big')
+        assert (first.level, first.repaired_at, first.pending_repair) == (2, 1580845500000, None)
+        assert (first.min_timestamp, first.max_timestamp) == (1580845497085001, 1580845497097004)
+        assert first.size == 120
+        assert first.properties['Bloom Filter FP chance'] == '0.01'
+        assert second.pending_repair == uuid.UUID('5b8e8b90-4796-11ea-8c0f-0fb0e3b1bd25')
+        assert second.size == 0
+        assert levels([first, second]) == [2, 0]
+
+    def test_older_output(self):
+        [sstable] = parse_sstablemetadata(OUTPUT_30.format(dir='/nowhere').encode('utf-8'))
+        assert sstable.path == '/nowhere/ks-cf-ka-1'
+        assert (sstable.level, sstable.repaired_at, sstable.pending_repair) == (1, 0, None)
+        assert parse_sstablemetadata('') == []
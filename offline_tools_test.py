@@ -10,6 +10,7 @@ from ccmlib import common
 from ccmlib.node import ToolError
 
 from dtest import Tester, create_ks
+from tools import sstabletools
 
 since = pytest.mark.since
 logger = logging.getLogger(__name__)
@@ -81,9 +82,9 @@ class TestOfflineTools(Tester):
         self.wait_for_compactions(node1)
         cluster.stop()
 
-        initial_levels = self.get_levels(node1.run_sstablemetadata(keyspace="keyspace1", column_families=["standard1"]))
+        initial_levels = self.get_levels(node1)
         _, error, rc = node1.run_sstablelevelreset("keyspace1", "standard1")
-        final_levels = self.get_levels(node1.run_sstablemetadata(keyspace="keyspace1", column_families=["standard1"]))
+        final_levels = self.get_levels(node1)
         self._check_stderr_error(error)
         assert rc == 0, str(rc)
 
@@ -99,9 +100,8 @@ class TestOfflineTools(Tester):
         # verify that the cluster can still start after messing with the sstables
         cluster.start()
 
-    def get_levels(self, data):
-        (out, err, rc) = data
-        return list(map(int, re.findall("SSTable Level: ([0-9])", out)))
+    def get_levels(self, node):
+        return sstabletools.levels(sstabletools.sstable_metadata([node], "keyspace1", ["standard1"])[node.name])
 
     def wait_for_compactions(self, node):
         pattern = re.compile("pending tasks: 0")
@@ -185,16 +185,14 @@ class TestOfflineTools(Tester):
 
         # Let's reset all sstables to L0
         logger.debug("Getting initial levels")
-        initial_levels = list(
-            self.get_levels(node1.run_sstablemetadata(keyspace="keyspace1", column_families=["standard1"])))
+        initial_levels = self.get_levels(node1)
         assert [] != initial_levels
         logger.debug('initial_levels:')
         logger.debug(initial_levels)
         logger.debug("Running sstablelevelreset")
         node1.run_sstablelevelreset("keyspace1", "standard1")
         logger.debug("Getting final levels")
-        final_levels = list(
-            self.get_levels(node1.run_sstablemetadata(keyspace="keyspace1", column_families=["standard1"])))
+        final_levels = self.get_levels(node1)
         assert [] != final_levels
         logger.debug('final levels:')
         logger.debug(final_levels)
@@ -206,11 +204,11 @@ class TestOfflineTools(Tester):
 
         # time to relevel sstables
         logger.debug("Getting initial levels")
-        initial_levels = self.get_levels(node1.run_sstablemetadata(keyspace="keyspace1", column_families=["standard1"]))
+        initial_levels = self.get_levels(node1)
         logger.debug("Running sstableofflinerelevel")
         output, error, _ = node1.run_sstableofflinerelevel("keyspace1", "standard1")
         logger.debug("Getting final levels")
-        final_levels = self.get_levels(node1.run_sstablemetadata(keyspace="keyspace1", column_families=["standard1"]))
+        final_levels = self.get_levels(node1)
 
         logger.debug(output)
         logger.debug(error)
@@ -5,6 +5,7 @@ import time
 import pytest
 import logging
 import subprocess
+from collections import namedtuple
 from uuid import uuid4
 
 from cassandra import ConsistencyLevel, WriteTimeout, ReadTimeout
@@ -16,6 +17,7 @@ from dtest import Tester, create_ks, mk_bman_path
 from tools.assertions import assert_one
 from tools.data import rows_to_list
 from tools.jmxutils import JolokiaAgent, make_mbean
+from tools.metrics import snapshot_family
 from tools.misc import retry_till_success
 
 since = pytest.mark.since
@@ -455,47 +457,36 @@ kcv = lambda k, c, v: [k, c, v]
 listify = lambda results: [list(r) for r in results]
 
 
+ReadRepairMetrics = namedtuple('ReadRepairMetrics', ['blocking_read_repair', 'speculated_rr_read',
+                                                     'speculated_rr_write'])
+
+
 class StorageProxy(object):
 
     def __init__(self, node):
         assert isinstance(node, Node)
         self.node = node
-        self.jmx = JolokiaAgent(node)
-
-    def start(self):
-        self.jmx.start()
-
-    def stop(self):
-        self.jmx.stop()
-
-    def _get_metric(self, metric):
-        mbean = make_mbean("metrics", type="ReadRepair", name=metric)
-        return self.jmx.read_attribute(mbean, "Count")
 
-    @property
-    def blocking_read_repair(self):
-        return self._get_metric("RepairedBlocking")
-
-    @property
-    def speculated_rr_read(self):
-        return self._get_metric("SpeculatedRead")
-
-    @property
-    def speculated_rr_write(self):
-        return self._get_metric("SpeculatedWrite")
+    def snapshot(self):
+        """
+        @return The ReadRepairMetrics of the node, read in a single request
+        """
+        metrics = snapshot_family(self.node.cluster, 'ReadRepair', nodes=[self.node])
+        return ReadRepairMetrics(*(metrics.value(self.node, None, name)
+                                   for name in ('RepairedBlocking', 'SpeculatedRead', 'SpeculatedWrite')))
 
     def get_table_metric(self, keyspace, table, metric, attr="Count"):
-        mbean = make_mbean("metrics", keyspace=keyspace, scope=table, type="Table", name=metric)
-        return self.jmx.read_attribute(mbean, attr)
+        metrics = snapshot_family(self.node.cluster, 'Table', nodes=[self.node], keyspace=keyspace, scope=table,
+                                  name=metric)
+        return metrics.value(self.node, '{}.{}'.format(keyspace, table), metric, attr)
 
     def __enter__(self):
         """ For contextmanager-style usage. """
-        self.start()
         return self
 
     def __exit__(self, exc_type, value, traceback):
         """ For contextmanager-style usage. """
-        self.stop()
+        pass
 
 
 class TestSpeculativeReadRepair(Tester):
@@ -542,16 +533,18 @@ class TestSpeculativeReadRepair(Tester):
         node2.byteman_submit([mk_bman_path('read_repair/sorted_live_endpoints.btm')])
         session = self.get_cql_connection(node2)
         with StorageProxy(node2) as storage_proxy:
-            assert storage_proxy.blocking_read_repair == 0
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write == 0
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 0
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write == 0
 
             with raises(ReadTimeout):
                 session.execute(quorum("SELECT * FROM ks.tbl WHERE k=1"))
 
-            assert storage_proxy.blocking_read_repair > 0
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write > 0
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair > 0
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write > 0
 
     @since('4.0')
     def test_normal_read_repair(self):
@@ -577,18 +570,20 @@ class TestSpeculativeReadRepair(Tester):
         # Stop reads on coordinator in order to make sure we do not go through
         # the messaging service for the local reads
         with StorageProxy(node2) as storage_proxy, stop_reads(coordinator):
-            assert storage_proxy.blocking_read_repair == 0
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write == 0
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 0
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write == 0
 
             session = self.get_cql_connection(coordinator)
             expected = [kcv(1, 0, 1), kcv(1, 1, 2)]
             results = session.execute(quorum("SELECT * FROM ks.tbl WHERE k=1"))
             assert listify(results) == expected
 
-            assert storage_proxy.blocking_read_repair == 1
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write == 0
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 1
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write == 0
 
     @since('4.0')
     def test_speculative_data_request(self):
@@ -617,9 +612,10 @@ class TestSpeculativeReadRepair(Tester):
             node1.byteman_submit([mk_bman_path('post4.0/request_verb_timing.btm')])
 
         with StorageProxy(node1) as storage_proxy:
-            assert storage_proxy.blocking_read_repair == 0
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write == 0
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 0
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write == 0
 
             session = self.get_cql_connection(node1)
             node2.byteman_submit([mk_bman_path('read_repair/stop_data_reads.btm')])
@@ -630,14 +626,15 @@ class TestSpeculativeReadRepair(Tester):
             repair_req_node2 = timing[node2.ip_addr].get('READ_REPAIR_REQ')
             assert listify(results) == [kcv(1, 0, 1), kcv(1, 1, 2)]
 
-            assert storage_proxy.blocking_read_repair == 1
-            assert storage_proxy.speculated_rr_read == 1
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 1
+            assert metrics.speculated_rr_read == 1
             
             # under normal circumstances we don't expect a speculated write here,
             # but the repair request to node 3 may timeout due to CPU contention and
             # then a speculated write is sent to node 2, so we just make sure that the
             # request to node 2 didn't happen before the request to node 3
-            assert storage_proxy.speculated_rr_write == 0 or repair_req_node2 > repair_req_node3
+            assert metrics.speculated_rr_write == 0 or repair_req_node2 > repair_req_node3
 
     @since('4.0')
     def test_speculative_write(self):
@@ -660,18 +657,20 @@ class TestSpeculativeReadRepair(Tester):
 
         node1.byteman_submit([mk_bman_path('read_repair/sorted_live_endpoints.btm')])
         with StorageProxy(node1) as storage_proxy:
-            assert storage_proxy.blocking_read_repair == 0
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write == 0
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 0
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write == 0
 
             session = self.get_cql_connection(node1)
             expected = [kcv(1, 0, 1), kcv(1, 1, 2)]
             results = session.execute(quorum("SELECT * FROM ks.tbl WHERE k=1"))
             assert listify(results) == expected
 
-            assert storage_proxy.blocking_read_repair == 1
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write == 1
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 1
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write == 1
 
     @since('4.0')
     def test_quorum_requirement(self):
@@ -704,9 +703,10 @@ class TestSpeculativeReadRepair(Tester):
 
         with StorageProxy(node1) as storage_proxy:
             assert storage_proxy.get_table_metric("ks", "tbl", "SpeculativeRetries") == 0
-            assert storage_proxy.blocking_read_repair == 0
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write == 0
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 0
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write == 0
 
             session = self.get_cql_connection(node1)
             expected = [kcv(1, 0, 1), kcv(1, 1, 2)]
@@ -714,9 +714,10 @@ class TestSpeculativeReadRepair(Tester):
             assert listify(results) == expected
 
             assert storage_proxy.get_table_metric("ks", "tbl", "SpeculativeRetries") == 0
-            assert storage_proxy.blocking_read_repair == 1
-            assert storage_proxy.speculated_rr_read == 1
-            assert storage_proxy.speculated_rr_write == 1
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 1
+            assert metrics.speculated_rr_read == 1
+            assert metrics.speculated_rr_write == 1
 
     @since('4.0')
     def test_quorum_requirement_on_speculated_read(self):
@@ -749,9 +750,10 @@ class TestSpeculativeReadRepair(Tester):
 
         with StorageProxy(node1) as storage_proxy:
             assert storage_proxy.get_table_metric("ks", "tbl", "SpeculativeRetries") == 0
-            assert storage_proxy.blocking_read_repair == 0
-            assert storage_proxy.speculated_rr_read == 0
-            assert storage_proxy.speculated_rr_write == 0
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 0
+            assert metrics.speculated_rr_read == 0
+            assert metrics.speculated_rr_write == 0
 
             session = self.get_cql_connection(node1)
             expected = [kcv(1, 0, 1), kcv(1, 1, 2)]
@@ -759,9 +761,10 @@ class TestSpeculativeReadRepair(Tester):
             assert listify(results) == expected
 
             assert storage_proxy.get_table_metric("ks", "tbl", "SpeculativeRetries") == 1
-            assert storage_proxy.blocking_read_repair == 1
-            assert storage_proxy.speculated_rr_read == 0  # there shouldn't be any replicas to speculate on
-            assert storage_proxy.speculated_rr_write == 1
+            metrics = storage_proxy.snapshot()
+            assert metrics.blocking_read_repair == 1
+            assert metrics.speculated_rr_read == 0  # there shouldn't be any replicas to speculate on
+            assert metrics.speculated_rr_write == 1
 
 
 @contextmanager
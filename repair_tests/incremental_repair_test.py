@@ -5,8 +5,8 @@ import logging
 
 from datetime import datetime
 from collections import Counter, namedtuple
-from re import findall, compile
-from uuid import UUID, uuid1
+from re import findall
+from uuid import uuid1
 
 from cassandra import ConsistencyLevel
 from cassandra.query import SimpleStatement
@@ -15,6 +15,7 @@ from ccmlib.common import is_win
 from ccmlib.node import Node, ToolError
 
 from dtest import Tester, create_ks, create_cf
+from tools import nodeops, sstabletools
 from tools.assertions import assert_almost_equal, assert_one
 from tools.data import create_c1c2_table, insert_c1c2
 from tools.misc import new_node, ImmutableMapping
@@ -53,26 +54,11 @@ class TestIncRepair(Tester):
 
     @classmethod
     def _get_repaired_data(cls, node, keyspace):
-        _sstable_name = compile('SSTable: (.+)')
-        _repaired_at = compile('Repaired at: (\d+)')
-        _pending_repair = compile('Pending repair: (\-\-|null|[a-f0-9\-]+)')
         _sstable_data = namedtuple('_sstabledata', ('name', 'repaired', 'pending_id'))
 
-        out = node.run_sstablemetadata(keyspace=keyspace).stdout
-
-        def matches(pattern):
-            return filter(None, [pattern.match(l) for l in out.split('\n')])
-        names = [m.group(1) for m in matches(_sstable_name)]
-        repaired_times = [int(m.group(1)) for m in matches(_repaired_at)]
-
-        def uuid_or_none(s):
-            return None if s == 'null' or s == '--' else UUID(s)
-        pending_repairs = [uuid_or_none(m.group(1)) for m in matches(_pending_repair)]
-        assert names
-        assert repaired_times
-        assert pending_repairs
-        assert len(names) == len(repaired_times) == len(pending_repairs)
-        return [_sstable_data(*a) for a in zip(names, repaired_times, pending_repairs)]
+        metadata = sstabletools.sstable_metadata([node], keyspace)[node.name]
+        assert metadata
+        return [_sstable_data(m.path, m.repaired_at, m.pending_repair) for m in metadata]
 
     def assertNoRepairedSSTables(self, node, keyspace):
         """ Checks that no sstables are marked repaired, and none are marked pending repair """
@@ -136,16 +122,15 @@ class TestIncRepair(Tester):
         node1.start(wait_for_binary_proto=True)
 
         # flush and check that no sstables are marked repaired
+        nodeops.flush(self.cluster.nodelist())
         for node in self.cluster.nodelist():
-            node.flush()
             self.assertNoRepairedSSTables(node, 'ks')
             session = self.patient_exclusive_cql_connection(node)
             results = list(session.execute("SELECT * FROM system.repairs"))
             assert len(results) == 0, str(results)
 
         # disable compaction so we can verify sstables are marked pending repair
-        for node in self.cluster.nodelist():
-            node.nodetool('disableautocompaction ks tbl')
+        nodeops.nodetool(self.cluster.nodelist(), 'disableautocompaction ks tbl')
 
         node1.repair(options=['ks'])
 
@@ -213,11 +198,10 @@ class TestIncRepair(Tester):
 
         if self.cluster.version() >= '4.0':
             # sstables are compacted out of pending repair by a compaction
-            for node in self.cluster.nodelist():
-                node.nodetool('compact keyspace1 standard1')
+            nodeops.nodetool(self.cluster.nodelist(), 'compact keyspace1 standard1')
 
-        for out in (node.run_sstablemetadata(keyspace='keyspace1').stdout for node in self.cluster.nodelist()):
-            assert 'Repaired at: 0' not in out
+        for metadata in sstabletools.sstable_metadata(self.cluster.nodelist(), 'keyspace1').values():
+            assert all(m.repaired_at != 0 for m in metadata), metadata
 
     def test_multiple_repair(self):
         """
@@ -356,8 +340,7 @@ class TestIncRepair(Tester):
 
         if self.cluster.version() >= '4.0':
             # sstables are compacted out of pending repair by a compaction
-            for node in self.cluster.nodelist():
-                node.nodetool('compact keyspace1 standard1')
+            nodeops.nodetool(self.cluster.nodelist(), 'compact keyspace1 standard1')
 
         finalOut1 = node1.run_sstablemetadata(keyspace='keyspace1').stdout
         if not isinstance(finalOut1, str):
@@ -540,8 +523,8 @@ class TestIncRepair(Tester):
             for node in cluster.nodelist():
                 node.nodetool('compact keyspace1 standard1')
 
-        for out in (node.run_sstablemetadata(keyspace='keyspace1').stdout for node in cluster.nodelist() if len(node.get_sstables('keyspace1', 'standard1')) > 0):
-            assert 'Repaired at: 0' not in out
+        for metadata in sstabletools.sstable_metadata(cluster.nodelist(), 'keyspace1', ['standard1']).values():
+            assert all(m.repaired_at != 0 for m in metadata), metadata
 
     @pytest.mark.no_vnodes
     @since('4.0')
@@ -769,8 +752,8 @@ class TestIncRepair(Tester):
         for i in range(10):
             session.execute(stmt, (i, i))
 
+        nodeops.flush(self.cluster.nodelist())
         for node in self.cluster.nodelist():
-            node.flush()
             self.assertNoRepairedSSTables(node, 'ks')
 
         # only repair the partition k=0
@@ -798,8 +781,8 @@ class TestIncRepair(Tester):
         for i in range(10):
             session.execute(stmt, (i, i, i))
 
+        nodeops.flush(self.cluster.nodelist())
         for node in self.cluster.nodelist():
-            node.flush()
             self.assertNoRepairedSSTables(node, 'ks')
 
         node1.repair(options=['ks'])
@@ -839,14 +822,13 @@ class TestIncRepair(Tester):
         for i in range(10):
             session.execute(stmt, (i, i, i))
 
-        for node in self.cluster.nodelist():
-            node.flush()
+        nodeops.flush(self.cluster.nodelist())
 
         for i in range(10,20):
             session.execute(stmt, (i, i, i))
 
+        nodeops.flush(self.cluster.nodelist())
         for node in self.cluster.nodelist():
-            node.flush()
             self.assertNoRepairedSSTables(node, 'ks')
 
         node1.repair(options=['ks'])
@@ -885,14 +867,13 @@ class TestIncRepair(Tester):
         for i in range(10):
             session.execute(stmt, (i, i, i))
 
-        for node in self.cluster.nodelist():
-            node.flush()
+        nodeops.flush(self.cluster.nodelist())
 
         for i in range(10,20):
             session.execute(stmt, (i, i, i))
 
+        nodeops.flush(self.cluster.nodelist())
         for node in self.cluster.nodelist():
-            node.flush()
             self.assertNoRepairedSSTables(node, 'ks')
 
         # stop node 2 and mark its sstables repaired
@@ -961,17 +942,16 @@ class TestIncRepair(Tester):
         unconfirmed_count = make_mbean('metrics', type='Table,keyspace=ks', name='RepairedDataInconsistenciesUnconfirmed,scope=tbl')
         confirmed_count = make_mbean('metrics', type='Table,keyspace=ks', name='RepairedDataInconsistenciesConfirmed,scope=tbl')
 
-        rr_before = self.get_attribute_count(jmx, rr_count)
-        uc_before = self.get_attribute_count(jmx, unconfirmed_count)
-        cc_before = self.get_attribute_count(jmx, confirmed_count)
+        counts = [(rr_count, 'Count'), (unconfirmed_count, 'Count'), (confirmed_count, 'Count')]
+        # the MBeans may not have been initialized, in which case Jolokia agent will return
+        # a 404 status for them. If we receive such, we know that the count can only be 0
+        rr_before, uc_before, cc_before = jmx.read_attributes(counts, default=0)
 
         stmt = SimpleStatement(query)
         stmt.consistency_level = ConsistencyLevel.ALL
         session.execute(stmt)
 
-        rr_after = self.get_attribute_count(jmx, rr_count)
-        uc_after = self.get_attribute_count(jmx, unconfirmed_count)
-        cc_after = self.get_attribute_count(jmx, confirmed_count)
+        rr_after, uc_after, cc_after = jmx.read_attributes(counts, default=0)
 
         logger.debug("Read Repair Count: {before}, {after}".format(before=rr_before, after=rr_after))
         logger.debug("Unconfirmed Inconsistency Count: {before}, {after}".format(before=uc_before, after=uc_after))
@@ -991,11 +971,3 @@ class TestIncRepair(Tester):
             assert cc_after > cc_before
         else:
             assert cc_after == cc_before
-
-    def get_attribute_count(self, jmx, bean):
-        # the MBean may not have been initialized, in which case Jolokia agent will return
-        # a HTTP 404 response. If we receive such, we know that the count can only be 0
-        if jmx.has_mbean(bean):
-            return jmx.read_attribute(bean, 'Count')
-        else:
-            return 0
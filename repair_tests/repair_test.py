@@ -2,7 +2,6 @@ import os
 import os.path
 import threading
 import time
-import re
 import pytest
 import logging
 
@@ -14,6 +13,7 @@ from cassandra.query import SimpleStatement
 from ccmlib.node import ToolError
 
 from dtest import FlakyRetryPolicy, Tester, create_ks, create_cf, mk_bman_path
+from tools import sstabletools
 from tools.data import insert_c1c2, query_c1c2
 from tools.jmxutils import JolokiaAgent, make_mbean
 from repair_tests.incremental_repair_test import assert_parent_repair_session_count
@@ -97,27 +97,31 @@ class BaseRepairTest(Tester):
         cluster.set_configuration_options(values={'hinted_handoff_enabled': False})
         cluster.set_batch_commitlog(enabled=True)
         logger.debug("Starting cluster..")
-        cluster.populate(3).start()
+        cluster.populate(3)
         node1, node2, node3 = cluster.nodelist()
-
-        session = self.patient_cql_connection(node1, retry_policy=FlakyRetryPolicy(max_retries=15))
-        create_ks(session, 'ks', 3)
-        if cluster.version() < '4.0':
-            create_cf(session, 'cf', read_repair=0.0, columns={'c1': 'text', 'c2': 'text'})
-        else:
-            create_cf(session, 'cf', columns={'c1': 'text', 'c2': 'text'})
-
-        # Insert 1000 keys, kill node 3, insert 1 key, restart node 3, insert 1000 more keys
-        logger.debug("Inserting data...")
-        insert_c1c2(session, n=1000, consistency=ConsistencyLevel.ALL, ks='ks')
         self.install_legacy_parsing(node3)
-        node3.flush()
-        node3.stop(wait_other_notice=True)
-        insert_c1c2(session, keys=(1000, ), consistency=ConsistencyLevel.TWO, ks='ks')
-        node3.start(wait_for_binary_proto=True)
-        insert_c1c2(session, keys=list(range(1001, 2001)), consistency=ConsistencyLevel.ALL, ks='ks')
 
-        cluster.flush()
+        def insert_data():
+            session = self.patient_cql_connection(node1, retry_policy=FlakyRetryPolicy(max_retries=15))
+            create_ks(session, 'ks', 3)
+            if cluster.version() < '4.0':
+                create_cf(session, 'cf', read_repair=0.0, columns={'c1': 'text', 'c2': 'text'})
+            else:
+                create_cf(session, 'cf', columns={'c1': 'text', 'c2': 'text'})
+
+            # Insert 1000 keys, kill node 3, insert 1 key, restart node 3, insert 1000 more keys
+            logger.debug("Inserting data...")
+            insert_c1c2(session, n=1000, consistency=ConsistencyLevel.ALL, ks='ks')
+            node3.flush()
+            node3.stop(wait_other_notice=True)
+            insert_c1c2(session, keys=(1000, ), consistency=ConsistencyLevel.TWO, ks='ks')
+            node3.start(wait_for_binary_proto=True)
+            insert_c1c2(session, keys=list(range(1001, 2001)), consistency=ConsistencyLevel.ALL, ks='ks')
+
+        # every test using this dataset writes the same keys, restore them when an earlier test already did
+        self.data_snapshots.restore_or_build(cluster, "ks(rf=3).cf(key text, c1 text, c2 text)",
+                                             ('insert_c1c2', 1000, 'node3 down for key 1000', 1000), insert_data,
+                                             start=start)
 
     def _repair_and_verify(self, sequential=True):
         cluster = self.cluster
@@ -288,21 +292,11 @@ class TestRepair(BaseRepairTest):
         """
         Based on incremental_repair_test.py:TestIncRepair implementation.
         """
-        _sstable_name = re.compile('SSTable: (.+)')
-        _repaired_at = re.compile(r'Repaired at: (\d+)')
         _sstable_data = namedtuple('_sstabledata', ('name', 'repaired'))
 
-        out = node.run_sstablemetadata(keyspace=keyspace).stdout
-
-        def matches(pattern):
-            return [_f for _f in [pattern.match(l) for l in out.split('\n')] if _f]
-
-        names = [m.group(1) for m in matches(_sstable_name)]
-        repaired_times = [int(m.group(1)) for m in matches(_repaired_at)]
-
-        assert names
-        assert repaired_times
-        return [_sstable_data(*a) for a in zip(names, repaired_times)]
+        metadata = sstabletools.sstable_metadata([node], keyspace)[node.name]
+        assert metadata
+        return [_sstable_data(m.path, m.repaired_at) for m in metadata]
 
     @since('2.2.10', max_version='4')
     def test_no_anticompaction_of_already_repaired(self):
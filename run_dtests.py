@@ -2,8 +2,11 @@
 """
 usage: run_dtests.py [-h] [--use-vnodes] [--use-off-heap-memtables] [--num-tokens=NUM_TOKENS] [--data-dir-count-per-instance=DATA_DIR_COUNT_PER_INSTANCE]
                      [--force-resource-intensive-tests] [--skip-resource-intensive-tests] [--cassandra-dir=CASSANDRA_DIR] [--cassandra-version=CASSANDRA_VERSION]
-                     [--delete-logs] [--execute-upgrade-tests] [--execute-upgrade-tests-only] [--disable-active-log-watching] [--keep-test-dir]
-                     [--enable-jacoco-code-coverage] [--dtest-enable-debug-logging] [--dtest-print-tests-only] [--dtest-print-tests-output=DTEST_PRINT_TESTS_OUTPUT]
+                     [--delete-logs] [--compress-logs] [--logs-max-size-mb=LOGS_MAX_SIZE_MB] [--execute-upgrade-tests] [--execute-upgrade-tests-only]
+                     [--disable-active-log-watching] [--keep-test-dir] [--use-cluster-pool] [--cache-cql-connections] [--copy-benchmark-history=COPY_BENCHMARK_HISTORY]
+                     [--copy-benchmark-regression-threshold=COPY_BENCHMARK_REGRESSION_THRESHOLD] [--enable-jacoco-code-coverage] [--dtest-enable-debug-logging]
+                     [--dtest-print-tests-only] [--dtest-print-tests-output=DTEST_PRINT_TESTS_OUTPUT]
+                     [--dtest-parallel-workers=DTEST_PARALLEL_WORKERS]
                      [--pytest-options=PYTEST_OPTIONS] [--dtest-tests=DTEST_TESTS]
 
 optional arguments:
@@ -17,15 +20,28 @@ optional arguments:
   --cassandra-dir=CASSANDRA_DIR
   --cassandra-version=CASSANDRA_VERSION
   --delete-logs
+  --compress-logs                                            Compress the saved logs of every test in the background (with zstd if the zstandard module is installed, gzip otherwise)
+                                                             (default: False)
+  --logs-max-size-mb=LOGS_MAX_SIZE_MB                        Size budget of the saved logs directory, the oldest saved logs are removed first when it is exceeded (default: None)
   --execute-upgrade-tests                                    Execute Cassandra Upgrade Tests (e.g. tests annotated with the upgrade_test mark) (default: False)
   --execute-upgrade-tests-only                               Execute Cassandra Upgrade Tests without running any other tests (e.g. tests annotated with the upgrade_test mark) (default: False)
   --disable-active-log-watching                              Disable ccm active log watching, which will cause dtests to check for errors in the logs in a single operation instead of semi-realtime
                                                              processing by consuming ccm _log_error_handler callbacks (default: False)
   --keep-test-dir                                            Do not remove/cleanup the test ccm cluster directory and it's artifacts after the test completes (default: False)
+  --use-cluster-pool                                         Reuse already started clusters between tests marked with reusable_cluster instead of creating a new cluster for every test
+                                                             (default: False)
+  --cache-cql-connections                                    Reuse driver sessions between connections to the same node with the same arguments within a test
+                                                             (default: False)
+  --copy-benchmark-history=COPY_BENCHMARK_HISTORY            Run the cqlsh COPY benchmarks, appending their throughput and peak memory to this JSON file, and fail those whose
+                                                             throughput regressed against the previous runs recorded in it (default: None)
+  --copy-benchmark-regression-threshold=COPY_BENCHMARK_REGRESSION_THRESHOLD
+                                                             Fraction of the baseline throughput below which a COPY benchmark fails (default: 0.2)
   --enable-jacoco-code-coverage                              Enable JaCoCo Code Coverage Support (default: False)
   --dtest-enable-debug-logging                               Enable debug logging (for this script, pytest, and during execution of test functions) (default: False)
   --dtest-print-tests-only                                   Print list of all tests found eligible for execution given the provided options. (default: False)
   --dtest-print-tests-output=DTEST_PRINT_TESTS_OUTPUT        Path to file where the output of --dtest-print-tests-only should be written to (default: False)
+  --dtest-parallel-workers=DTEST_PARALLEL_WORKERS            Number of worker processes to run tests with (requires pytest-xdist). Each worker gets its own loopback addresses,
+                                                             ports, logs directory and last_test_dir, so their clusters can run side by side. (default: None)
   --pytest-options=PYTEST_OPTIONS                            Additional command line arguments to proxy directly thru when invoking pytest. (default: None)
   --dtest-tests=DTEST_TESTS                                  Comma separated list of test files, test classes, or test methods to execute. (default: None)
 """
@@ -79,6 +95,10 @@ class RunDTests():
                             help="Print list of all tests found eligible for execution given the provided options.")
         parser.add_argument("--dtest-print-tests-output", action="store", default=False,
                             help="Path to file where the output of --dtest-print-tests-only should be written to")
+        parser.add_argument("--dtest-parallel-workers", action="store", default=None, type=int,
+                            help="Number of worker processes to run tests with (requires pytest-xdist). Each worker "
+                                 "gets its own loopback addresses, ports, logs directory and last_test_dir, so their "
+                                 "clusters can run side by side.")
         parser.add_argument("--pytest-options", action="store", default=None,
                             help="Additional command line arguments to proxy directly thru when invoking pytest.")
         parser.add_argument("--dtest-tests", action="store", default=None,
@@ -112,6 +132,12 @@ class RunDTests():
             args_to_invoke_pytest.append("'--collect-only'")
             args_to_invoke_pytest.append("'-q'")
 
+        if args.dtest_parallel_workers and not args.dtest_print_tests_only:
+            args_to_invoke_pytest.append("'-n'")
+            args_to_invoke_pytest.append("'{workers}'".format(workers=args.dtest_parallel_workers))
+            # keep the tests of a class on the same worker so they can share pooled clusters
+            args_to_invoke_pytest.append("'--dist=loadscope'")
+
         if args.dtest_tests:
             for test in args.dtest_tests.split(","):
                 args_to_invoke_pytest.append("'{test_name}'".format(test_name=test))
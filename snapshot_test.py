@@ -1,8 +1,6 @@
-import distutils.dir_util
 import glob
 import os
 import shutil
-import subprocess
 import time
 import pytest
 import logging
@@ -12,13 +10,18 @@ from cassandra.concurrent import execute_concurrent_with_args
 from dtest_setup_overrides import DTestSetupOverrides
 from dtest import Tester, create_ks
 from tools.assertions import assert_one
-from tools.files import replace_in_file, safe_mkdtemp
+from tools.files import link_tree, replace_in_file, safe_mkdtemp
 from tools.hacks import advance_to_next_cl_segment
+from tools.matrix import run_matrix
 from tools.misc import ImmutableMapping, get_current_test_name
+from tools.sstabletools import run_tool
 
 since = pytest.mark.since
 logger = logging.getLogger(__name__)
 
+# sstableloader invocations running at the same time, each streams from its own JVM
+LOADER_WORKERS = 4
+
 
 class SnapshotTester(Tester):
 
@@ -55,27 +58,57 @@ class SnapshotTester(Tester):
             logger.debug("snapshot_dir is : " + snapshot_dir)
             logger.debug("snapshot copy is : " + tmpdir)
 
-            # Copy files from the snapshot dir to existing temp dir
-            distutils.dir_util.copy_tree(str(snapshot_dir), os.path.join(tmpdir, str(x), ks, cf))
+            # Share the sstables of the snapshot with the copy instead of copying them
+            counts = link_tree(snapshot_dir, os.path.join(tmpdir, str(x), ks, cf))
+            logger.debug("snapshot copy of {} made with {}".format(snapshot_dir, dict(counts)))
             x += 1
 
         return tmpdir
 
-    def restore_snapshot(self, snapshot_dir, node, ks, cf):
-        logger.debug("Restoring snapshot....")
-        for x in range(0, self.cluster.data_dir_count):
-            snap_dir = os.path.join(snapshot_dir, str(x), ks, cf)
-            if os.path.exists(snap_dir):
-                ip = node.address()
+    def restore_snapshot(self, snapshot_dir, node, ks, cf, throttle=None):
+        """
+        Load a snapshot made by make_snapshot into a node with sstableloader.
 
-                args = [node.get_tool('sstableloader'), '-d', ip, snap_dir]
-                p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = p.communicate()
-                exit_status = p.wait()
+        @param throttle The maximum throughput of each sstableloader in MiB/s, unlimited by default
+        @return The number of bytes loaded per second
+        """
+        return self.restore_snapshots([(snapshot_dir, node)], ks, cf, throttle=throttle)
 
-                if exit_status != 0:
-                    raise Exception("sstableloader command '%s' failed; exit status: %d'; stdout: %s; stderr: %s" %
-                                    (" ".join(args), exit_status, stdout.decode("utf-8"), stderr.decode("utf-8")))
+    def restore_snapshots(self, snapshots, ks, cf, throttle=None, max_workers=LOADER_WORKERS):
+        """
+        Load snapshots made by make_snapshot with sstableloader, one invocation per data
+        directory of every snapshot, max_workers of them at the same time.
+
+        @param snapshots A list of (snapshot dir, node to load it through)
+        @param throttle The maximum throughput of each sstableloader in MiB/s, unlimited by default
+        @return The number of bytes loaded per second
+        """
+        logger.debug("Restoring snapshot....")
+        loads = []
+        for snapshot_dir, node in snapshots:
+            for x in range(0, self.cluster.data_dir_count):
+                snap_dir = os.path.join(snapshot_dir, str(x), ks, cf)
+                if os.path.exists(snap_dir):
+                    loads.append((node, snap_dir))
+        if not loads:
+            return 0.0
+
+        def load(case):
+            node, snap_dir = case
+            args = ['-d', node.address()]
+            if throttle:
+                # --throttle (in megabits) is replaced by --throttle-mib since 4.1
+                args += ['--throttle-mib', str(throttle)] if node.get_cassandra_version() >= '4.1' else \
+                    ['--throttle', str(int(throttle * 8.388608))]
+            run_tool(node, 'sstableloader', args + [snap_dir], fast_start=False)
+
+        size = sum(os.path.getsize(os.path.join(snap_dir, f)) for _, snap_dir in loads for f in os.listdir(snap_dir)
+                   if os.path.isfile(os.path.join(snap_dir, f)))
+        report = run_matrix(loads, load, max_workers=max_workers, name='sstableloader',
+                            describe=lambda case: 'sstableloader of {} through {}'.format(case[1], case[0].name))
+        rate = size / report.seconds if report.seconds > 0 else float(size)
+        logger.info("Restored {} bytes of {}.{} in {:.1f}s ({:.0f} bytes/s)".format(size, ks, cf, report.seconds, rate))
+        return rate
 
     def restore_snapshot_schema(self, snapshot_dir, node, ks, cf):
         logger.debug("Restoring snapshot schema....")
@@ -214,8 +247,10 @@ class TestArchiveCommitlog(SnapshotTester):
         for x in range(0, data_dir_count):
             tmpdir = os.path.join(base_tmpdir, str(x))
             os.mkdir(tmpdir)
-            # Copy files from the snapshot dir to existing temp dir
-            distutils.dir_util.copy_tree(os.path.join(node.get_path(), 'data{0}'.format(x), ks), tmpdir)
+            # Only the snapshot is restored, keep it and share its sstables with the copy
+            ks_dir = os.path.join(node.get_path(), 'data{0}'.format(x), ks)
+            for snapshot_dir in glob.glob(os.path.join(ks_dir, '{cf}-*'.format(cf=cf), 'snapshots', name)):
+                link_tree(snapshot_dir, os.path.join(tmpdir, os.path.relpath(snapshot_dir, ks_dir)))
             tmpdirs.append(tmpdir)
 
         return tmpdirs
@@ -235,7 +270,7 @@ class TestArchiveCommitlog(SnapshotTester):
                 os.mkdir(os.path.join(data_dir, ks, cf_id))
 
                 logger.debug("snapshot_dir is : " + snapshot_dir)
-                distutils.dir_util.copy_tree(snapshot_dir, os.path.join(data_dir, ks, cf_id))
+                link_tree(snapshot_dir, os.path.join(data_dir, ks, cf_id))
 
     def test_archive_commitlog(self):
         self.run_archive_commitlog(restore_point_in_time=False)
@@ -1,6 +1,6 @@
 import re
 from time import sleep
-from tools.misc import list_to_hashed_dict
+from tools.misc import row_counts
 
 from cassandra import (InvalidRequest, ReadFailure, ReadTimeout, Unauthorized,
                        Unavailable, WriteFailure, WriteTimeout)
@@ -45,6 +45,42 @@ def _rows_to_list(rows):
     return new_list
 
 
+def _rows_diff(actual_counts, expected_counts, max_shown=10):
+    """
+    @return A readable description of how two multisets of rows differ, showing at most max_shown rows of each kind
+    """
+    lines = []
+    for title, diff in (('missing', expected_counts - actual_counts), ('unexpected', actual_counts - expected_counts)):
+        if not diff:
+            continue
+        lines.append("{} {} row(s):".format(sum(diff.values()), title))
+        for row, count in list(diff.items())[:max_shown]:
+            shown = list(row) if isinstance(row, tuple) else row
+            lines.append("    {}{}".format(shown, " (x{})".format(count) if count > 1 else ""))
+        if len(diff) > max_shown:
+            lines.append("    ... and {} more".format(len(diff) - max_shown))
+    return '\n'.join(lines)
+
+
+def assert_rows_equal_ignoring_order(actual, expected, message=''):
+    """
+    Assert two collections of rows hold the same rows, the same number of times each, in any order.
+    Rows are compared by value once canonicalized (see tools.misc.canonical_row), so driver
+    types such as OrderedMapSerializedKey, SortedSet or UDTs compare equal to plain lists,
+    sets and tuples. Both arguments are only iterated once, so a ResultSet is streamed.
+    @param actual Rows, e.g. a ResultSet
+    @param expected Expected rows
+    @param message Optional text to prefix the difference with
+
+    Examples:
+    assert_rows_equal_ignoring_order(session.execute("SELECT k, v FROM test"), [[1, 1], [0, 0]])
+    """
+    actual_counts = row_counts(actual)
+    expected_counts = row_counts(expected)
+    if actual_counts != expected_counts:
+        raise AssertionError("{}{}".format(message + "\n" if message else "", _rows_diff(actual_counts, expected_counts)))
+
+
 def _assert_exception(fun, *args, **kwargs):
     matching = kwargs.pop('matching', None)
     expected = kwargs['expected']
@@ -180,10 +216,10 @@ def assert_all(session, query, expected, cl=None, ignore_order=False, timeout=No
     """
     simple_query = SimpleStatement(query, consistency_level=cl)
     res = session.execute(simple_query) if timeout is None else session.execute(simple_query, timeout=timeout)
-    list_res = _rows_to_list(res)
     if ignore_order:
-        expected = list_to_hashed_dict(expected)
-        list_res = list_to_hashed_dict(list_res)
+        assert_rows_equal_ignoring_order(res, expected, "Unexpected results from {}".format(query))
+        return
+    list_res = _rows_to_list(res)
     assert list_res == expected, "Expected {} from {}, but got {}".format(expected, query, list_res)
 
 
@@ -332,41 +368,15 @@ def assert_bootstrap_state(tester, node, expected_bootstrap_state, user=None, pa
     session.shutdown()
 
 
-def assert_lists_equal_ignoring_order(list1, list2, sort_key=None):
+def assert_lists_equal_ignoring_order(list1, list2):
     """
     asserts that the contents of the two provided lists are equal
-    but ignoring the order that the items of the lists are actually in
+    but ignoring the order that the items of the lists are actually in.
+    items, including dicts, are compared as multisets so no sort key is needed
     :param list1: list to check if it's contents are equal to list2
     :param list2: list to check if it's contents are equal to list1
-    :param sort_key: if the contents of the list are of type dict, the
-    key to use of each object to sort the overall object with
     """
-    normalized_list1 = []
-    for obj in list1:
-        normalized_list1.append(obj)
-
-    normalized_list2 = []
-    for obj in list2:
-        normalized_list2.append(obj)
-
-    if not sort_key:
-        sorted_list1 = sorted(normalized_list1, key=lambda elm: elm[0])
-        sorted_list2 = sorted(normalized_list2, key=lambda elm: elm[0])
-    else:
-        # first always sort by "id"
-        # that way we get a two factor sort which will increase the chance of ordering lists exactly the same
-        if not sort_key == 'id' and 'id' in list1[0].keys():
-            sorted_list1 = sorted(sorted(normalized_list1, key=lambda elm: elm["id"]), key=lambda elm: elm[sort_key])
-            sorted_list2 = sorted(sorted(normalized_list2, key=lambda elm: elm["id"]), key=lambda elm: elm[sort_key])
-        else:
-            if isinstance(list1[0]['id'], (int, float)):
-                sorted_list1 = sorted(normalized_list1, key=lambda elm: elm[sort_key])
-                sorted_list2 = sorted(normalized_list2, key=lambda elm: elm[sort_key])
-            else:
-                sorted_list1 = sorted(normalized_list1, key=lambda elm: str(elm[sort_key]))
-                sorted_list2 = sorted(normalized_list2, key=lambda elm: str(elm[sort_key]))
-
-    assert sorted_list1 == sorted_list2
+    assert_rows_equal_ignoring_order(list1, list2)
 
 
 def assert_lists_of_dicts_equal(list1, list2):
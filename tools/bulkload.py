@@ -0,0 +1,175 @@
+"""
+Fast loading of generated data into a cluster.
+
+Key and value columns are generated in bulk from a seed (with numpy when it is installed,
+array buffers otherwise), bound to a prepared statement and written with a bounded window
+of asynchronous requests in flight per replica. The window gives backpressure: a slow
+node only slows down the writes it owns instead of piling up timeouts.
+
+Example usage:
+
+    from tools.bulkload import BulkLoader, formatted, sequence, random_ints
+
+    insert = session.prepare("INSERT INTO ks.cf (key, c1, c2) VALUES (?, ?, ?)")
+    keys = sequence(0, 1000000)
+    stats = BulkLoader(session).load(insert, zip(formatted('k{}', keys),
+                                                 formatted('value{}', random_ints(42, len(keys))),
+                                                 formatted('value{}', keys)))
+    logger.debug("loaded {} rows at {:.0f} rows/s".format(stats.rows, stats.rows_per_second))
+"""
+import logging
+import random
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# requests in flight per replica; enough to keep a node busy without queueing up timeouts
+DEFAULT_IN_FLIGHT_PER_HOST = 64
+
+
+def sequence(start, count):
+    """
+    @return The integers start, start + 1, ..., start + count - 1 as a numpy array or an array('q')
+    """
+    if numpy is not None:
+        return numpy.arange(start, start + count, dtype=numpy.int64)
+    return array('q', range(start, start + count))
+
+
+def random_ints(seed, count, low=0, high=2 ** 31):
+    """
+    @return count integers in [low, high), always the same ones for the same seed, as a numpy array or an array('q')
+    """
+    if numpy is not None:
+        return numpy.random.default_rng(seed).integers(low, high, size=count, dtype=numpy.int64)
+    rng = random.Random(seed)
+    return array('q', (rng.randrange(low, high) for _ in range(count)))
+
+
+def formatted(fmt, values):
+    """
+    @return A generator of fmt.format(value) for every value, e.g. formatted('k{}', keys) for text keys
+    """
+    return (fmt.format(v) for v in (values.tolist() if hasattr(values, 'tolist') else values))
+
+
+class LoadStats(namedtuple('LoadStats', ['rows', 'seconds'])):
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else float(self.rows)
+
+
+class BulkLoader(object):
+    """
+    Writes statements asynchronously, with at most in_flight_per_host of them waiting on
+    the same replica at any time.
+
+    @param session The driver session to write with
+    @param in_flight_per_host The size of the window of pending requests of each replica
+    @param consistency_level Consistency level of the statements which don't set their own
+    """
+
+    def __init__(self, session, in_flight_per_host=DEFAULT_IN_FLIGHT_PER_HOST, consistency_level=None):
+        self.session = session
+        self.in_flight_per_host = in_flight_per_host
+        self.consistency_level = consistency_level
+        self._windows = {}
+        self._windows_lock = threading.Lock()
+
+    def load(self, statement, rows):
+        """
+        Bind every row to a prepared statement and write it.
+
+        @param statement A PreparedStatement
+        @param rows An iterable of sequences of values, one per bind marker
+        @return The LoadStats of the load
+        """
+        return self.execute_all(statement.bind(row) for row in rows)
+
+    def execute_all(self, statements):
+        """
+        Write statements (e.g. bound statements or batches of them), returning once all of
+        them completed. No more statements are sent after one failed.
+
+        @return The LoadStats of the writes
+        @throws The first error a statement failed with
+        """
+        state = _LoadState()
+        start = time.time()
+        for statement in statements:
+            if state.error is not None:
+                break
+            if statement.consistency_level is None and self.consistency_level is not None:
+                statement.consistency_level = self.consistency_level
+
+            window = self._window(statement)
+            window.acquire()
+            state.started()
+            future = self.session.execute_async(statement)
+            future.add_callbacks(callback=state.succeeded, callback_args=(window,),
+                                 errback=state.failed, errback_args=(window,))
+
+        rows = state.wait()
+        stats = LoadStats(rows=rows, seconds=time.time() - start)
+        if state.error is not None:
+            raise state.error
+        logger.debug("wrote {} statements in {:.1f}s ({:.0f}/s)"
+                     .format(stats.rows, stats.seconds, stats.rows_per_second))
+        return stats
+
+    def _window(self, statement):
+        host = None
+        routing_key = statement.routing_key
+        keyspace = statement.keyspace
+        if routing_key is not None and keyspace is not None:
+            replicas = self.session.cluster.metadata.get_replicas(keyspace, routing_key)
+            if replicas:
+                host = replicas[0]
+        with self._windows_lock:
+            window = self._windows.get(host)
+            if window is None:
+                window = self._windows[host] = threading.BoundedSemaphore(self.in_flight_per_host)
+            return window
+
+
+class _LoadState(object):
+
+    def __init__(self):
+        self.error = None
+        self.completed = 0
+        self._pending = 0
+        self._condition = threading.Condition()
+
+    def started(self):
+        with self._condition:
+            self._pending += 1
+
+    def succeeded(self, _, window):
+        window.release()
+        with self._condition:
+            self.completed += 1
+            self._pending -= 1
+            self._condition.notify_all()
+
+    def failed(self, error, window):
+        window.release()
+        with self._condition:
+            if self.error is None:
+                self.error = error
+            self._pending -= 1
+            self._condition.notify_all()
+
+    def wait(self):
+        with self._condition:
+            while self._pending > 0:
+                self._condition.wait()
+            return self.completed
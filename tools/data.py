@@ -2,11 +2,11 @@ import time
 import logging
 
 from cassandra import ConsistencyLevel
-from cassandra.concurrent import execute_concurrent_with_args
-from cassandra.query import SimpleStatement
+from cassandra.query import BatchStatement, SimpleStatement
 
 from . import assertions
 from dtest import create_cf, DtestTimeoutError
+from tools.bulkload import BulkLoader
 from tools.funcutils import get_rate_limited_function
 from tools.flaky import retry
 
@@ -33,7 +33,7 @@ def insert_c1c2(session, ks=None, keys=None, n=None, consistency=ConsistencyLeve
     statement = session.prepare("INSERT INTO {fully_qualified_cf} (key, c1, c2) VALUES (?, 'value1', 'value2')".format(fully_qualified_cf=fully_qualified_cf))
     statement.consistency_level = consistency
 
-    execute_concurrent_with_args(session, statement, [['k{}'.format(k)] for k in keys])
+    BulkLoader(session).load(statement, (['k{}'.format(k)] for k in keys))
 
 
 def query_c1c2(session, key, consistency=ConsistencyLevel.QUORUM, tolerate_missing=False, must_be_missing=False, max_attempts=1):
@@ -48,10 +48,11 @@ def query_c1c2(session, key, consistency=ConsistencyLevel.QUORUM, tolerate_missi
 
 
 def insert_columns(tester, session, key, columns_count, consistency=ConsistencyLevel.QUORUM, offset=0):
-    upds = ["UPDATE cf SET v=\'value%d\' WHERE key=\'k%s\' AND c=\'c%06d\'" % (i, key, i) for i in range(offset * columns_count, columns_count * (offset + 1))]
-    query = 'BEGIN BATCH %s; APPLY BATCH' % '; '.join(upds)
-    simple_query = SimpleStatement(query, consistency_level=consistency)
-    session.execute(simple_query)
+    update = session.prepare("UPDATE cf SET v=? WHERE key=? AND c=?")
+    batch = BatchStatement(consistency_level=consistency)
+    for i in range(offset * columns_count, columns_count * (offset + 1)):
+        batch.add(update, ('value%d' % i, 'k%s' % key, 'c%06d' % i))
+    session.execute(batch)
 
 
 def query_columns(tester, session, key, columns_count, consistency=ConsistencyLevel.QUORUM, offset=0):
@@ -83,23 +84,21 @@ def putget(cluster, session, cl=ConsistencyLevel.QUORUM):
 
 
 def _put_with_overwrite(cluster, session, nb_keys, cl=ConsistencyLevel.QUORUM):
-    for k in range(0, nb_keys):
-        kvs = ["UPDATE cf SET v=\'value%d\' WHERE key=\'k%s\' AND c=\'c%02d\'" % (i, k, i) for i in range(0, 100)]
-        query = SimpleStatement('BEGIN BATCH %s APPLY BATCH' % '; '.join(kvs), consistency_level=cl)
-        session.execute(query)
-        time.sleep(.01)
+    update = session.prepare("UPDATE cf SET v=? WHERE key=? AND c=?")
+    loader = BulkLoader(session)
+
+    def batches(columns):
+        for k in range(0, nb_keys):
+            batch = BatchStatement(consistency_level=cl)
+            for value, column in columns:
+                batch.add(update, ('value%d' % value, 'k%s' % k, 'c%02d' % column))
+            yield batch
+
+    loader.execute_all(batches([(i, i) for i in range(0, 100)]))
     cluster.flush()
-    for k in range(0, nb_keys):
-        kvs = ["UPDATE cf SET v=\'value%d\' WHERE key=\'k%s\' AND c=\'c%02d\'" % (i * 4, k, i * 2) for i in range(0, 50)]
-        query = SimpleStatement('BEGIN BATCH %s APPLY BATCH' % '; '.join(kvs), consistency_level=cl)
-        session.execute(query)
-        time.sleep(.01)
+    loader.execute_all(batches([(i * 4, i * 2) for i in range(0, 50)]))
     cluster.flush()
-    for k in range(0, nb_keys):
-        kvs = ["UPDATE cf SET v=\'value%d\' WHERE key=\'k%s\' AND c=\'c%02d\'" % (i * 20, k, i * 5) for i in range(0, 20)]
-        query = SimpleStatement('BEGIN BATCH %s APPLY BATCH' % '; '.join(kvs), consistency_level=cl)
-        session.execute(query)
-        time.sleep(.01)
+    loader.execute_all(batches([(i * 20, i * 5) for i in range(0, 20)]))
     cluster.flush()
 
 
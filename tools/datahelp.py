@@ -165,8 +165,9 @@ def create_rows(data, session, table_name, cl=None, format_funcs=None, prefix=''
 
 
 def flatten_into_set(iterable):
-    # use flatten() then convert to a set for set comparisons
-    return set(flatten(iterable))
+    # same comparison as a set of flatten()'d rows (values compared by their string form),
+    # without building one formatted string per row
+    return set(tuple((k, str(_dict[k])) for k in sorted(_dict)) for _dict in iterable)
 
 
 def flatten(list_of_dicts):
@@ -0,0 +1,222 @@
+"""
+Datasets whose content is a pure function of a seed, and streaming verification of them.
+
+The expected value of every row of a Dataset is computed from (seed, key index, version),
+so a test doesn't have to keep the rows it wrote around to check them later, and the
+verifier can check a table of any size with bounded memory: it scans the table by token
+range with paging, recomputes what each row it reads should hold, and only remembers
+which keys it saw (one bit per key) plus a bounded number of mismatches to report.
+
+Example usage:
+
+    from tools.dataset import Dataset, verify_dataset
+
+    dataset = Dataset(seed=42, count=1000000, key_format='k{}')
+    insert = session.prepare("INSERT INTO ks.cf (key, value) VALUES (?, ?)")
+    BulkLoader(session).load(insert, dataset.rows())
+
+    # overwrite the first 1000 rows with new values
+    dataset = dataset.overwrite(0, 1000)
+    BulkLoader(session).load(insert, dataset.rows(0, 1000))
+
+    result = verify_dataset(session, 'ks.cf', dataset, key_column='key', value_column='value')
+    assert result.ok, result
+"""
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cassandra import ConsistencyLevel
+from cassandra.query import SimpleStatement
+
+logger = logging.getLogger(__name__)
+
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+
+class Dataset(object):
+    """
+    count rows, with keys derived from their index (0 to count - 1) and values derived
+    from (seed, index, version of the row). Datasets are immutable; extend() and
+    overwrite() return new ones.
+
+    @param seed Seed the values are derived from
+    @param count Number of rows
+    @param key_format None for int keys equal to the row index, or a format string with a
+                      single {} for text keys, e.g. 'k{}'
+    @param versions Tuple of (start, stop, version) overwrites, later ones win
+    """
+
+    def __init__(self, seed, count=0, key_format=None, versions=()):
+        self.seed = seed
+        self.count = count
+        self.key_format = key_format
+        self.versions = tuple(versions)
+        if key_format is not None:
+            self._key_prefix, self._key_suffix = key_format.split('{}')
+
+    def key(self, index):
+        return index if self.key_format is None else self.key_format.format(index)
+
+    def index(self, key):
+        """
+        @return The index of the row with this key, or None if the key is not one of this dataset's
+        """
+        if self.key_format is None:
+            index = key
+        else:
+            if not key.startswith(self._key_prefix) or not key.endswith(self._key_suffix):
+                return None
+            try:
+                index = int(key[len(self._key_prefix):len(key) - len(self._key_suffix)])
+            except ValueError:
+                return None
+        return index if 0 <= index < self.count else None
+
+    def version(self, index):
+        for start, stop, version in reversed(self.versions):
+            if start <= index < stop:
+                return version
+        return 0
+
+    def value(self, index):
+        digest = hashlib.blake2b('{}:{}:{}'.format(self.seed, index, self.version(index)).encode('ascii'),
+                                 digest_size=16)
+        return digest.hexdigest()
+
+    def rows(self, start=0, count=None):
+        """
+        @return A generator of the (key, value) of count rows starting at index start, every row by default
+        """
+        stop = self.count if count is None else min(self.count, start + count)
+        return ((self.key(i), self.value(i)) for i in range(start, stop))
+
+    def extend(self, count):
+        """
+        @return A Dataset with count more rows
+        """
+        return Dataset(self.seed, self.count + count, self.key_format, self.versions)
+
+    def overwrite(self, start, stop):
+        """
+        @return A Dataset in which the rows from index start to stop (excluded) have new values
+        """
+        version = max([v for _, _, v in self.versions] + [0]) + 1
+        return Dataset(self.seed, self.count, self.key_format, self.versions + ((start, stop, version),))
+
+    def __repr__(self):
+        return 'Dataset(seed={}, count={}, key_format={!r}, versions={})'.format(
+            self.seed, self.count, self.key_format, self.versions)
+
+
+Mismatch = namedtuple('Mismatch', ['key', 'expected', 'actual'])
+
+
+class VerificationResult(namedtuple('VerificationResult', ['rows_read', 'mismatched', 'missing', 'unexpected',
+                                                           'examples'])):
+    """
+    The outcome of verify_dataset. examples holds up to max_reported Mismatch, with an
+    expected value of None for unexpected keys and an actual value of None for missing ones.
+    """
+
+    @property
+    def ok(self):
+        return self.mismatched == 0 and self.missing == 0 and self.unexpected == 0
+
+    def __str__(self):
+        return ('read {} rows: {} with a wrong value, {} missing, {} unexpected; first ones: {}'
+                .format(self.rows_read, self.mismatched, self.missing, self.unexpected, self.examples))
+
+
+def token_ranges(splits):
+    """
+    @return splits contiguous (start, end] ranges covering the whole Murmur3 token ring
+    """
+    width = (MAX_TOKEN - MIN_TOKEN) // splits
+    bounds = [MIN_TOKEN + i * width for i in range(splits)] + [MAX_TOKEN]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class _Verification(object):
+
+    def __init__(self, dataset, max_reported):
+        self.dataset = dataset
+        self.max_reported = max_reported
+        self.seen = bytearray((dataset.count + 7) // 8)
+        self.rows_read = 0
+        self.mismatched = 0
+        self.unexpected = 0
+        self.examples = []
+        self._lock = threading.Lock()
+
+    def check(self, rows):
+        with self._lock:
+            for key, actual in rows:
+                self.rows_read += 1
+                index = self.dataset.index(key)
+                if index is None:
+                    self.unexpected += 1
+                    self._report(key, None, actual)
+                    continue
+                self.seen[index >> 3] |= 1 << (index & 7)
+                expected = self.dataset.value(index)
+                if actual != expected:
+                    self.mismatched += 1
+                    self._report(key, expected, actual)
+
+    def result(self):
+        missing = 0
+        for index in range(self.dataset.count):
+            if not self.seen[index >> 3] & (1 << (index & 7)):
+                missing += 1
+                key = self.dataset.key(index)
+                self._report(key, self.dataset.value(index), None)
+        return VerificationResult(rows_read=self.rows_read, mismatched=self.mismatched, missing=missing,
+                                  unexpected=self.unexpected, examples=self.examples)
+
+    def _report(self, key, expected, actual):
+        if len(self.examples) < self.max_reported:
+            self.examples.append(Mismatch(key, expected, actual))
+
+
+def verify_dataset(session, table, dataset, key_column='key', value_column='value',
+                   consistency_level=ConsistencyLevel.ALL, splits=16, parallelism=4, page_size=5000,
+                   max_reported=20):
+    """
+    Check that a table holds exactly the rows of a dataset, scanning it by token range
+    with paging. Memory use is one bit per row of the dataset, whatever the table size.
+
+    @param table The table to scan, optionally qualified with its keyspace
+    @param dataset The Dataset the table should hold
+    @param splits Number of token ranges the ring is scanned in
+    @param parallelism Number of token ranges scanned at the same time
+    @param page_size Fetch size of the scans
+    @param max_reported Maximum number of mismatches kept as examples in the result
+    @return A VerificationResult
+    """
+    verification = _Verification(dataset, max_reported)
+    query = ('SELECT {key}, {value} FROM {table} WHERE token({key}) > %s AND token({key}) <= %s'
+             .format(key=key_column, value=value_column, table=table))
+    first_query = query.replace('token({}) > %s'.format(key_column), 'token({}) >= %s'.format(key_column))
+
+    def scan(token_range):
+        start, end = token_range
+        statement = SimpleStatement(first_query if start == MIN_TOKEN else query,
+                                    consistency_level=consistency_level, fetch_size=page_size)
+        result = session.execute(statement, (start, end))
+        while True:
+            verification.check(result.current_rows)
+            if not result.has_more_pages:
+                break
+            result.fetch_next_page()
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='verify-dataset') as executor:
+        # list() so that the first failing scan raises here
+        list(executor.map(scan, token_ranges(splits)))
+
+    result = verification.result()
+    logger.debug("verified {} against {}: {}".format(table, dataset, result))
+    return result
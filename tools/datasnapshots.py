@@ -0,0 +1,200 @@
+"""
+Snapshots of the on-disk state of a stopped ccm cluster, to restore a baseline dataset
+instead of writing it again.
+
+Many tests start by writing the same data (thousands of keys with nodes stopped in between,
+or a cassandra-stress run) before the part they actually test. DataSnapshots keeps, for
+the duration of a test session, a copy of the data directories, commitlog, saved_caches
+and hints of every node of a cluster once such a baseline is written, keyed by the
+Cassandra version, the schema and a hash of the recipe the data was written with. The
+next test asking for the same baseline restores it into its own stopped cluster.
+
+Copies are as cheap as the filesystem allows (see tools.files.link_or_copy): reflinks
+where supported, hardlinks for the sstable components Cassandra never rewrites in place,
+so that a restore costs a few metadata operations per file rather than the size of the
+data. Everything else, commitlog segments and caches included, is modified in place by
+a running node and is copied.
+
+The restored nodes get the whole state of the baseline, system keyspaces included, so a
+baseline only fits a cluster of the same name, partitioner, nodes and configuration
+options, which are part of its key.
+
+Example usage:
+
+    def populate():
+        node1.stress(['write', 'n=100K'])
+        return 100000
+
+    num_records = self.data_snapshots.restore_or_build(cluster, 'keyspace1.standard1', ('stress', 100000),
+                                                       populate)
+"""
+import hashlib
+import json
+import logging
+import os
+import pprint
+import shutil
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from tools.files import link_tree
+from tools.nodeops import run_on_nodes
+
+logger = logging.getLogger(__name__)
+
+# directories of a node, besides its data directories, holding state which must be restored with the data
+NODE_DIRECTORIES = ('commitlogs', 'saved_caches', 'hints')
+
+SNAPSHOT_FILE = 'snapshot.json'
+
+
+class DataSnapshotKey(namedtuple('DataSnapshotKey', ['version', 'schema', 'recipe_hash'])):
+    """
+    Identifies a baseline dataset: the Cassandra version it was written by, a description of
+    its schema, and the hash of the recipe it was written with together with the shape and
+    the configuration options of the cluster it was written to.
+    """
+
+    @staticmethod
+    def for_cluster(cluster, schema, recipe):
+        """
+        @param schema A description of the schema of the data, e.g. the keyspaces and tables created
+        @param recipe Anything describing how the data was written (its repr is hashed), e.g. a
+                      tuple of the write operations and their number of keys
+        """
+        recipe = OrderedDict([
+            ('cluster_name', cluster.name),
+            ('partitioner', cluster.partitioner),
+            ('nodes', [(node.name, len(node.data_directories())) for node in cluster.nodelist()]),
+            ('config_options', sorted(getattr(cluster, '_config_options', {}).items())),
+            ('recipe', recipe),
+        ])
+        recipe_hash = hashlib.sha1(pprint.pformat(recipe).encode('utf-8')).hexdigest()
+        return DataSnapshotKey(version=str(cluster.version()), schema=schema, recipe_hash=recipe_hash)
+
+    @property
+    def digest(self):
+        return hashlib.sha1('\n'.join(self).encode('utf-8')).hexdigest()
+
+
+def _node_directories(node):
+    """
+    @return The paths, relative to the directory of the node, of every directory holding its state
+    """
+    node_path = node.get_path()
+    directories = [os.path.relpath(d, node_path) for d in node.data_directories()]
+    return directories + [d for d in NODE_DIRECTORIES if os.path.isdir(os.path.join(node_path, d))]
+
+
+class DataSnapshots(object):
+    """
+    The baseline datasets saved during a test session, under a root directory which should
+    be on the same filesystem as the test clusters for hardlinks to be possible.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.root, key.digest)
+
+    def has(self, key):
+        return os.path.exists(os.path.join(self._path(key), SNAPSHOT_FILE))
+
+    def save(self, cluster, key, result=None):
+        """
+        Save the state of every node of a stopped cluster as the baseline of key.
+
+        @param result A JSON serializable value returned by restore() along with the data,
+                      e.g. the number of rows written
+        """
+        running = [node.name for node in cluster.nodelist() if node.is_running()]
+        assert not running, "Cannot snapshot the data of running nodes {}".format(running)
+
+        start = time.monotonic()
+        path = self._path(key)
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+
+        def save_node(node):
+            os.makedirs(os.path.join(tmp, node.name))
+            counts = Counter()
+            for directory in _node_directories(node):
+                counts.update(link_tree(os.path.join(node.get_path(), directory),
+                                        os.path.join(tmp, node.name, directory)))
+            return counts
+
+        counts = sum(run_on_nodes(cluster.nodelist(), save_node, description='data snapshot').values(), Counter())
+        with open(os.path.join(tmp, SNAPSHOT_FILE), 'w') as f:
+            json.dump({'key': key._asdict(), 'result': result}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+        logger.debug("Saved data snapshot {} of {} in {:.2f}s: {}"
+                     .format(key.digest, key, time.monotonic() - start, dict(counts)))
+
+    def restore(self, cluster, key):
+        """
+        Replace the state of every node of a stopped cluster by the baseline of key.
+
+        @return The result the baseline was saved with
+        """
+        running = [node.name for node in cluster.nodelist() if node.is_running()]
+        assert not running, "Cannot restore data into running nodes {}".format(running)
+
+        start = time.monotonic()
+        path = self._path(key)
+
+        def restore_node(node):
+            counts = Counter()
+            saved = os.listdir(os.path.join(path, node.name))
+            for directory in OrderedDict.fromkeys(_node_directories(node) + saved):
+                target = os.path.join(node.get_path(), directory)
+                if os.path.isdir(target):
+                    shutil.rmtree(target)
+                source = os.path.join(path, node.name, directory)
+                if os.path.isdir(source):
+                    counts.update(link_tree(source, target))
+                else:
+                    os.makedirs(target)
+            return counts
+
+        counts = sum(run_on_nodes(cluster.nodelist(), restore_node, description='data restore').values(), Counter())
+        with open(os.path.join(path, SNAPSHOT_FILE)) as f:
+            result = json.load(f)['result']
+        logger.debug("Restored data snapshot {} of {} in {:.2f}s: {}"
+                     .format(key.digest, key, time.monotonic() - start, dict(counts)))
+        return result
+
+    def restore_or_build(self, cluster, schema, recipe, build, start=True):
+        """
+        Restore the baseline of (version, schema, recipe) into a populated cluster if it was
+        saved earlier in the session. Otherwise write it by calling build() on the started
+        cluster, then flush, stop and save it.
+
+        Nodes are restarted (or started) either way, so state which doesn't survive a restart,
+        e.g. nodetool disableautocompaction, must be set up after this returns.
+
+        @param build A callable writing the baseline into the cluster, its return value must be JSON serializable
+        @param start Whether to start the cluster before returning, it is left stopped otherwise
+        @return The value build() returned when the baseline was written
+        """
+        key = DataSnapshotKey.for_cluster(cluster, schema, recipe)
+        if self.has(key):
+            self.hits += 1
+            if any(node.is_running() for node in cluster.nodelist()):
+                cluster.stop()
+            result = self.restore(cluster, key)
+        else:
+            self.misses += 1
+            if not all(node.is_running() for node in cluster.nodelist()):
+                cluster.start(wait_for_binary_proto=True)
+            result = build()
+            cluster.flush()
+            cluster.stop()
+            self.save(cluster, key, result)
+
+        if start:
+            cluster.start(wait_for_binary_proto=True)
+        return result
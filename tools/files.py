@@ -1,3 +1,4 @@
+import errno
 import fileinput
 import os
 import re
@@ -5,6 +6,12 @@ import sys
 import tempfile
 import logging
 import shutil
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
@@ -50,3 +57,95 @@ def copytree(src, dst, symlinks=False, ignore=None):
             shutil.copytree(s, d, symlinks, ignore)
         else:
             shutil.copy2(s, d)
+
+
+# ioctl asking the filesystem (btrfs, xfs, ...) to share the extents of two files, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """
+    Copy src to dst as a copy-on-write clone, which costs no I/O regardless of the file size.
+
+    @return True if the filesystem supported the clone, False otherwise (dst is then not created)
+    """
+    if fcntl is None:
+        return False
+    with open(src, 'rb') as s:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        cloned = False
+        try:
+            fcntl.ioctl(fd, FICLONE, s.fileno())
+            cloned = True
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+            # a clone which failed, or was interrupted, may have left some of the extents behind
+            if not cloned:
+                _remove_quietly(dst)
+        return cloned
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def link_or_copy(src, dst, allow_hardlink=True):
+    """
+    Make dst a copy of src as cheaply as the filesystem allows: a reflink if supported, then
+    a hardlink if allowed and both paths are on the same filesystem, and a regular copy otherwise.
+
+    Hardlinks share the inode with src, so they must only be used when src will not be
+    modified in place afterwards (e.g. logs of a removed cluster, or immutable sstable components).
+
+    @return 'reflink', 'hardlink' or 'copy', depending on how dst was made
+    @throws OSError If dst couldn't be made, in which case no partial dst is left behind
+    """
+    if reflink(src, dst):
+        return 'reflink'
+    if allow_hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError as e:
+            # EXDEV = cross-device link, EPERM/EMLINK = not supported here
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+    try:
+        shutil.copyfile(src, dst)
+    except BaseException:
+        _remove_quietly(dst)
+        raise
+    return 'copy'
+
+
+# sstable components which are only ever written once, when the sstable is, and deleted with it
+IMMUTABLE_SSTABLE_COMPONENTS = ('Data.db', 'Index.db', 'Filter.db', 'CompressionInfo.db', 'Digest.crc32',
+                                'Digest.adler32', 'Digest.sha1', 'Digest.crc', 'CRC.db', 'Partitions.db', 'Rows.db')
+
+
+def is_immutable_sstable_component(filename):
+    return filename.endswith(IMMUTABLE_SSTABLE_COMPONENTS)
+
+
+def link_tree(src, dst, allow_hardlink=is_immutable_sstable_component):
+    """
+    Copy every file under src to the same path under dst with link_or_copy.
+
+    @param allow_hardlink A callable telling from the name of a file whether it may be hardlinked,
+                          by default only the sstable components never modified in place may be
+    @return A Counter of the files reflinked, hardlinked and copied, and of their total 'bytes'
+    """
+    counts = Counter()
+    for dirpath, _, filenames in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(target, exist_ok=True)
+        for filename in filenames:
+            source = os.path.join(dirpath, filename)
+            counts[link_or_copy(source, os.path.join(target, filename), allow_hardlink=allow_hardlink(filename))] += 1
+            counts['bytes'] += os.path.getsize(source)
+    return counts
@@ -4,6 +4,8 @@ import logging
 
 from threading import Thread
 
+from tools.logwatch import watch_log_for
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,7 +16,7 @@ class InterruptBootstrap(Thread):
         self.node = node
 
     def run(self):
-        self.node.watch_log_for("Prepare completed")
+        watch_log_for(self.node, "Prepare completed")
         self.node.stop(gently=False)
 
 
@@ -37,7 +39,7 @@ class InterruptCompaction(Thread):
         self.mark = node.mark_log(filename=self.filename)
 
     def run(self):
-        self.node.watch_log_for("Compacting(.*)%s" % (self.tablename,), from_mark=self.mark, filename=self.filename)
+        watch_log_for(self.node, "Compacting(.*)%s" % (self.tablename,), from_mark=self.mark, filename=self.filename)
         if self.delay > 0:
             random_delay = random.uniform(0, self.delay)
             logger.debug("Sleeping for {} seconds".format(random_delay))
@@ -53,7 +55,7 @@ class KillOnBootstrap(Thread):
         self.node = node
 
     def run(self):
-        self.node.watch_log_for("JOINING: Starting to bootstrap")
+        watch_log_for(self.node, "JOINING: Starting to bootstrap")
         self.node.stop(gently=False)
 
 class KillOnReadyToBootstrap(Thread):
@@ -63,5 +65,5 @@ class KillOnReadyToBootstrap(Thread):
         self.node = node
 
     def run(self):
-        self.node.watch_log_for("JOINING: calculation complete, ready to bootstrap")
+        watch_log_for(self.node, "JOINING: calculation complete, ready to bootstrap")
         self.node.stop(gently=False)
@@ -1,10 +1,10 @@
+import http.client
 import json
 import os
 import subprocess
 import socket
+import threading
 import time
-import urllib.request
-import urllib.parse
 import logging
 import random
 
@@ -15,6 +15,14 @@ logger = logging.getLogger(__name__)
 JOLOKIA_JAR = os.path.join(os.path.dirname(__file__), '..', 'lib', 'jolokia-jvm-1.7.1-agent.jar')
 CLASSPATH_SEP = ';' if common.is_win() else ':'
 
+# marks read_attributes() calls without a default value for unregistered mbeans
+NO_DEFAULT = object()
+
+# the JolokiaAgent which attached the agent to a node's JVM, by node pid. An agent stays
+# attached until that JolokiaAgent stops it, so other JolokiaAgents on the same node use
+# its port instead of trying to attach a second time.
+_attached_agents = {}
+
 
 def jolokia_classpath():
     if 'JAVA_HOME' in os.environ:
@@ -176,6 +184,9 @@ class JolokiaAgent(object):
         self.node = node
         random.seed(node.pid)
         self.port = None
+        self.shared = False
+        self._connection = None
+        self._connection_lock = threading.Lock()
 
     # See CASSANDRA-17872 for the reason behind this
     def get_port(self, default=8778):
@@ -200,7 +211,22 @@ class JolokiaAgent(object):
         """
         Starts the Jolokia agent.  The process will fork from the parent
         and continue running until stop() is called.
+
+        If another JolokiaAgent already attached the agent to the node, that agent is
+        shared instead, and stop() leaves it running.
         """
+        owner = _attached_agents.get(self.node.pid)
+        if owner is not None and owner is not self:
+            self.port = owner.port
+            try:
+                self._query({'type': 'version'}, verbose=False)
+                self.shared = True
+                return
+            except Exception:
+                logger.info("Jolokia agent attached to pid {} on port {} no longer answers, attaching again"
+                            .format(self.node.pid, owner.port))
+                _attached_agents.pop(self.node.pid, None)
+
         port = self.get_port()
         if not port:
             raise Exception("Port 8778 still in use on {}, unable to find another available port in range 8000-9000, cannot launch jolokia".format(socket.gethostname()))
@@ -218,6 +244,7 @@ class JolokiaAgent(object):
             try:
                 subprocess.check_output(args, stderr=subprocess.STDOUT)
                 logger.info("Jolokia successful on try %s" % i )
+                _attached_agents[self.node.pid] = self
                 return
             except subprocess.CalledProcessError as exc:
                 if 'Jolokia is already attached'.encode('utf-8') in exc.output:
@@ -235,6 +262,12 @@ class JolokiaAgent(object):
         """
         Stops the Jolokia agent.
         """
+        self._close_connection()
+        if self.shared:
+            self.shared = False
+            return
+        if _attached_agents.get(self.node.pid) is self:
+            del _attached_agents[self.node.pid]
         args = (java_bin(),
                 '-cp', jolokia_classpath(),
                 'org.jolokia.jvmagent.client.AgentLauncher',
@@ -247,16 +280,40 @@ class JolokiaAgent(object):
             logger.error("Output was: %s" % (exc.output,))
             raise
 
-    def _query(self, body, verbose=True):
+    def _post(self, body):
+        """
+        Posts a request, or a list of requests, to the agent over a kept alive connection
+        and returns the decoded response.
+        """
         request_data = json.dumps(body).encode("utf-8")
-        url = 'http://%s:%s/jolokia/' % (self.node.network_interfaces['binary'][0], self.port)
-        req = urllib.request.Request(url)
-        response = urllib.request.urlopen(req, data=request_data, timeout=10.0)
-        if response.code != 200:
-            raise Exception("Failed to query Jolokia agent; HTTP response code: %d; response: %s" % (response.code, response.readlines()))
-
-        raw_response = response.readline()
-        response = json.loads(raw_response.decode(encoding='utf-8'))
+        with self._connection_lock:
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = http.client.HTTPConnection(self.node.network_interfaces['binary'][0],
+                                                                  self.port, timeout=10.0)
+                try:
+                    self._connection.request('POST', '/jolokia/', body=request_data,
+                                             headers={'Content-Type': 'application/json'})
+                    response = self._connection.getresponse()
+                    raw_response = response.read()
+                    break
+                except (http.client.HTTPException, ConnectionError):
+                    # the agent closed the kept alive connection, retry once on a new one
+                    self._connection.close()
+                    self._connection = None
+                    if attempt == 1:
+                        raise
+        if response.status != 200:
+            raise Exception("Failed to query Jolokia agent; HTTP response code: %d; response: %s" % (response.status, raw_response))
+        return json.loads(raw_response.decode(encoding='utf-8'))
+
+    def _close_connection(self):
+        with self._connection_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _check_status(self, response, verbose=True):
         if response['status'] != 200:
             stacktrace = response.get('stacktrace')
             if stacktrace and verbose:
@@ -266,6 +323,89 @@ class JolokiaAgent(object):
             raise Exception("Jolokia agent returned non-200 status: %s" % (response,))
         return response
 
+    def _query(self, body, verbose=True):
+        return self._check_status(self._post(body), verbose=verbose)
+
+    def bulk_query(self, bodies):
+        """
+        Sends several requests in a single round trip.
+
+        `bodies` should be a list of Jolokia request objects, e.g.
+        {'type': 'read', 'mbean': ..., 'attribute': ...}.
+
+        Returns the list of responses, in the same order. Unlike the other methods,
+        failed requests don't raise; their response carries a non-200 'status'.
+        """
+        if not bodies:
+            return []
+        return self._post(list(bodies))
+
+    def read_attributes(self, reads, default=NO_DEFAULT, verbose=True):
+        """
+        Reads several JMX attributes in a single round trip.
+
+        `reads` should be a list of (mbean, attribute) or (mbean, attribute, path) tuples.
+
+        `default` is returned for the attributes of mbeans which are not registered
+        (yet), rather than raising.
+
+        Returns the list of values, in the same order as `reads`.
+        """
+        bodies = []
+        for read in reads:
+            body = {'type': 'read', 'mbean': read[0], 'attribute': read[1]}
+            if len(read) > 2 and read[2]:
+                body['path'] = read[2]
+            bodies.append(body)
+
+        values = []
+        for response in self.bulk_query(bodies):
+            if response['status'] == 404 and default is not NO_DEFAULT:
+                values.append(default)
+            else:
+                values.append(self._check_status(response, verbose=verbose)['value'])
+        return values
+
+    def read_patterns(self, patterns, verbose=True):
+        """
+        Reads every attribute of the mbeans matching any of several patterns, in a single
+        round trip. Patterns which match no mbean are skipped.
+
+        Returns a dict mapping each matching mbean name to a dict of its attributes.
+        """
+        mbeans = {}
+        for response in self.bulk_query([{'type': 'read', 'mbean': pattern} for pattern in patterns]):
+            if response['status'] == 404:
+                continue
+            mbeans.update(self._check_status(response, verbose=verbose)['value'])
+        return mbeans
+
+    def sample(self, reads, interval=1.0, count=None, duration=None, default=NO_DEFAULT):
+        """
+        Polls a set of attributes at a fixed interval, one bulk read per sample.
+
+        `reads` is a list of (mbean, attribute) tuples, as taken by read_attributes().
+
+        Sampling stops after `count` samples or `duration` seconds, whichever comes first.
+
+        Returns the time series as a list of (timestamp, values) tuples, where values is the
+        list returned by read_attributes() at that time.
+        """
+        if count is None and duration is None:
+            raise ValueError("sample() needs a count or a duration")
+        series = []
+        start = time.time()
+        next_sample = start
+        while True:
+            series.append((time.time(), self.read_attributes(reads, default=default)))
+            if count is not None and len(series) >= count:
+                break
+            next_sample += interval
+            if duration is not None and next_sample - start > duration:
+                break
+            time.sleep(max(0, next_sample - time.time()))
+        return series
+
     def has_mbean(self, mbean, verbose=True):
         """
         Check for the existence of an MBean
@@ -298,6 +438,29 @@ class JolokiaAgent(object):
         response = self._query(body, verbose=verbose)
         return response['value']
 
+    def read_pattern(self, pattern, attribute=None, verbose=True):
+        """
+        Reads attributes of every mbean matching a pattern in a single request.
+
+        `pattern` should be an mbean name pattern, for example
+        'org.apache.cassandra.metrics:type=ThreadPools,*'.
+
+        `attribute` is an optional attribute name, or list of names, to read.
+        All attributes are read if it is not given.
+
+        Returns a dict mapping each matching mbean name to a dict of its attributes, which
+        is empty if no mbean matches the pattern (yet), e.g. for the metrics of a table
+        that was never read from or written to.
+        """
+        body = {'type': 'read',
+                'mbean': pattern}
+        if attribute:
+            body['attribute'] = attribute
+        response = self._post(body)
+        if response['status'] == 404:
+            return {}
+        return self._check_status(response, verbose=verbose)['value']
+
     def write_attribute(self, mbean, attribute, value, path=None, verbose=True):
         """
         Writes a values to a single JMX attribute.
@@ -353,3 +516,14 @@ class JolokiaAgent(object):
         """ For contextmanager-style usage. """
         self.stop()
         return exc_type is None
+
+
+def parse_mbean_name(name):
+    """
+    Splits an mbean name into its domain and properties.
+
+    >>> parse_mbean_name('org.apache.cassandra.metrics:type=ThreadPools,path=request,scope=MutationStage,name=ActiveTasks')
+    ('org.apache.cassandra.metrics', {'type': 'ThreadPools', 'path': 'request', 'scope': 'MutationStage', 'name': 'ActiveTasks'})
+    """
+    domain, _, properties = name.partition(':')
+    return domain, dict(p.split('=', 1) for p in properties.split(',') if p)
@@ -0,0 +1,612 @@
+"""
+Continuous read/write load from several processes, with verification of every write.
+
+Writer processes write rows asynchronously with a bounded window of requests in flight,
+and hand each acknowledged (key, value) to checker processes through a ring buffer of
+fixed-size records in shared memory. Checkers read the rows back and hand the ones they
+verified to the writers through a second ring, as candidates for being overwritten.
+Every process reports the count, errors and latency histogram of its operations once
+per second, tagged with the phase of the test (e.g. 'before upgrade', 'upgrading node2')
+the operations completed in, so tests can see how a restart affected the load.
+
+Timeouts are expected while nodes restart and are only counted, as are the failures to
+reprepare a statement of CASSANDRA-15252/17140. Any other error stops the process that got
+it, which fails the test at the next check_alive(). Tests should also bound the error rate
+of each phase.
+
+Example usage:
+
+    from tools.loadharness import ContinuousLoad, VALUES_WORKLOAD
+
+    load = ContinuousLoad(functools.partial(self.patient_cql_connection, node1, keyspace='ks'),
+                          VALUES_WORKLOAD, writers=2, checkers=2, phase='before')
+    load.start()
+    load.wait_for_writes(5000)
+    for node in self.cluster.nodelist():
+        load.phase('restarting ' + node.name)
+        node.stop()
+        node.start(wait_for_binary_proto=True)
+        load.check_alive()
+    load.phase('after')
+    report = load.stop()
+    logger.debug(report)
+    assert not report.mismatches
+    assert all(stats.error_rate < 0.01 for stats in report.summary()), report
+"""
+import ctypes
+import logging
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from queue import Empty
+
+from cassandra import ConsistencyLevel, OperationTimedOut, ReadTimeout, WriteTimeout
+
+logger = logging.getLogger(__name__)
+
+# upper bounds, in seconds, of the latency histogram buckets: 100us doubling up to ~100s
+LATENCY_BUCKETS = tuple(0.0001 * 2 ** i for i in range(21))
+STATS_INTERVAL = 1.0
+
+WRITE = 'write'
+READ = 'read'
+
+TOLERATED_ERRORS = (OperationTimedOut, ReadTimeout, WriteTimeout)
+REPREPARE_MISMATCH = "ID mismatch while trying to reprepare"
+
+IntervalStats = namedtuple('IntervalStats', ['worker', 'operation', 'phase', 'start', 'count', 'errors',
+                                             'latencies', 'max_latency'])
+PhaseStats = namedtuple('PhaseStats', ['phase', 'operation', 'count', 'errors', 'error_rate',
+                                       'operations_per_second', 'p50', 'p99', 'max'])
+Mismatch = namedtuple('Mismatch', ['worker', 'key', 'expected', 'actual'])
+LoadError = namedtuple('LoadError', ['worker', 'error'])
+
+
+class RecordRing(object):
+    """
+    A bounded FIFO of fixed-size byte records in shared memory, usable by any number of
+    producer and consumer processes forked after it was created.
+    """
+
+    def __init__(self, capacity, record_size):
+        self.capacity = capacity
+        self.record_size = record_size
+        self._buffer = multiprocessing.RawArray(ctypes.c_char, capacity * record_size)
+        self._head = multiprocessing.RawValue(ctypes.c_longlong, 0)  # index of the next record to get
+        self._tail = multiprocessing.RawValue(ctypes.c_longlong, 0)  # index of the next record to put
+        self._lock = multiprocessing.Lock()
+        self._not_empty = multiprocessing.Condition(self._lock)
+        self._not_full = multiprocessing.Condition(self._lock)
+
+    def __len__(self):
+        with self._lock:
+            return self._tail.value - self._head.value
+
+    def put(self, record, timeout=None):
+        """
+        Append a record, waiting up to timeout seconds (forever if None) for room.
+
+        @return Whether the record was appended
+        """
+        assert len(record) == self.record_size, "records of this ring are {} bytes".format(self.record_size)
+        with self._lock:
+            if not self._not_full.wait_for(lambda: self._tail.value - self._head.value < self.capacity, timeout):
+                return False
+            offset = (self._tail.value % self.capacity) * self.record_size
+            ctypes.memmove(ctypes.addressof(self._buffer) + offset, record, self.record_size)
+            self._tail.value += 1
+            self._not_empty.notify()
+            return True
+
+    def put_nowait(self, record):
+        return self.put(record, timeout=0)
+
+    def get(self, timeout=None):
+        """
+        Remove the oldest record, waiting up to timeout seconds (forever if None) for one.
+
+        @return The record, or None if there was none
+        """
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self._tail.value > self._head.value, timeout):
+                return None
+            offset = (self._head.value % self.capacity) * self.record_size
+            record = ctypes.string_at(ctypes.addressof(self._buffer) + offset, self.record_size)
+            self._head.value += 1
+            self._not_full.notify()
+            return record
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+
+class Workload(object):
+    """
+    What the load writes and how checkers verify it. Keys are uuids, values are anything
+    encode_value packs in VALUE_SIZE bytes.
+    """
+    VALUE_SIZE = 16
+
+    def __init__(self, write_cql, read_cql):
+        self.write_cql = write_cql
+        self.read_cql = read_cql
+
+    def next_value(self, previous):
+        """
+        @param previous The last verified value of an overwritten row, None for a new row
+        @return The value the row will hold once written
+        """
+        raise NotImplementedError()
+
+    def write_params(self, key, value):
+        raise NotImplementedError()
+
+    def encode_value(self, value):
+        raise NotImplementedError()
+
+    def decode_value(self, data):
+        raise NotImplementedError()
+
+    def encode(self, key, value):
+        return key.bytes + self.encode_value(value)
+
+    def decode(self, record):
+        return uuid.UUID(bytes=record[:16]), self.decode_value(record[16:])
+
+
+class ValuesWorkload(Workload):
+    """
+    Sets the uuid column v of the rows of a table keyed by the uuid k to random uuids.
+    """
+
+    def __init__(self, table='cf'):
+        Workload.__init__(self, "UPDATE {} SET v=? WHERE k=?".format(table), "SELECT v FROM {} WHERE k=?".format(table))
+
+    def next_value(self, previous):
+        return uuid.uuid4()
+
+    def write_params(self, key, value):
+        return (value, key)
+
+    def encode_value(self, value):
+        return value.bytes
+
+    def decode_value(self, data):
+        return uuid.UUID(bytes=data)
+
+
+class CountersWorkload(Workload):
+    """
+    Increments the counter column c of the rows of a table keyed by the uuid k1.
+    """
+
+    def __init__(self, table='countertable'):
+        Workload.__init__(self, "UPDATE {} SET c = c + 1 WHERE k1=?".format(table),
+                          "SELECT c FROM {} WHERE k1=?".format(table))
+
+    def next_value(self, previous):
+        return (previous or 0) + 1
+
+    def write_params(self, key, value):
+        return (key,)
+
+    def encode_value(self, value):
+        return value.to_bytes(self.VALUE_SIZE, 'little')
+
+    def decode_value(self, data):
+        return int.from_bytes(data, 'little')
+
+
+VALUES_WORKLOAD = ValuesWorkload()
+COUNTERS_WORKLOAD = CountersWorkload()
+
+
+def _bucket(latency):
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if latency <= bound:
+            return i
+    return len(LATENCY_BUCKETS) - 1
+
+
+def _quantile(latencies, q):
+    """
+    @return The upper bound of the histogram bucket holding the q quantile, None for an empty histogram
+    """
+    total = sum(latencies)
+    if total == 0:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(latencies):
+        seen += count
+        if seen >= rank:
+            return LATENCY_BUCKETS[i]
+    return LATENCY_BUCKETS[-1]
+
+
+def _check_error(worker, error, stats_queue):
+    """
+    Let a worker go on after a timeout or a failed reprepare (see CASSANDRA-15252/17140),
+    which are counted by the caller.
+
+    @throws error Any other error, after sending a LoadError to the parent
+    """
+    if isinstance(error, TOLERATED_ERRORS) or REPREPARE_MISMATCH in str(error):
+        return
+    stats_queue.put(LoadError(worker, repr(error)))
+    raise error
+
+
+class _Recorder(object):
+    """
+    Aggregates the outcome of a worker's operations into IntervalStats sent to the parent.
+    Only used from the worker's main thread.
+    """
+
+    def __init__(self, worker, stats_queue, phase):
+        self.worker = worker
+        self.stats_queue = stats_queue
+        self.phase = phase
+        self._intervals = {}
+
+    def record(self, operation, latency, error):
+        phase = self.phase.value
+        key = (operation, phase)
+        interval = self._intervals.get(key)
+        if interval is None:
+            interval = self._intervals[key] = [time.time(), 0, 0, [0] * len(LATENCY_BUCKETS), 0.0]
+        interval[1] += 1
+        if error:
+            interval[2] += 1
+        else:
+            interval[3][_bucket(latency)] += 1
+            interval[4] = max(interval[4], latency)
+
+    def flush(self, force=False):
+        now = time.time()
+        for (operation, phase), (start, count, errors, latencies, max_latency) in list(self._intervals.items()):
+            if force or now - start >= STATS_INTERVAL or phase != self.phase.value:
+                self.stats_queue.put(IntervalStats(self.worker, operation, phase, start, count, errors,
+                                                   latencies, max_latency))
+                del self._intervals[(operation, phase)]
+
+
+class _Worker(object):
+    """
+    The state a writer or checker process shares with the driver callbacks of its requests.
+    """
+
+    def __init__(self, name, session_factory, workload, cql, consistency_level, in_flight, stats_queue, phase):
+        self.name = name
+        self.session = session_factory()
+        self.statement = self.session.prepare(cql)
+        self.statement.consistency_level = consistency_level
+        self.workload = workload
+        self.in_flight = in_flight
+        self.window = threading.BoundedSemaphore(in_flight)
+        self.completed = deque()
+        self.recorder = _Recorder(name, stats_queue, phase)
+
+    def execute(self, params, context):
+        self.window.acquire()
+        start = time.time()
+        future = self.session.execute_async(self.statement, params)
+        future.add_callbacks(callback=self._done, callback_args=(context, start),
+                             errback=self._failed, errback_args=(context, start))
+
+    def _done(self, rows, context, start):
+        self.completed.append((context, time.time() - start, rows, None))
+        self.window.release()
+
+    def _failed(self, error, context, start):
+        self.completed.append((context, time.time() - start, None, error))
+        self.window.release()
+
+    def completions(self):
+        while self.completed:
+            yield self.completed.popleft()
+
+    def wait_idle(self, timeout=60):
+        """
+        Wait for every request in flight to complete.
+        """
+        deadline = time.time() + timeout
+        acquired = 0
+        while acquired < self.in_flight and self.window.acquire(timeout=max(0, deadline - time.time())):
+            acquired += 1
+        for _ in range(acquired):
+            self.window.release()
+
+    def close(self):
+        self.recorder.flush(force=True)
+        self.session.cluster.shutdown()
+
+
+def _writer_main(name, session_factory, workload, consistency_level, in_flight, to_verify, rewritable,
+                 rewrite_probability, writes, stop, stats_queue, phase):
+    worker = _Worker(name, session_factory, workload, workload.write_cql, consistency_level, in_flight,
+                     stats_queue, phase)
+
+    def handle_completions():
+        for (key, value), latency, _, error in worker.completions():
+            worker.recorder.record(WRITE, latency, error)
+            if error is not None:
+                _check_error(name, error, stats_queue)
+                # the write may or may not have been applied, so the row can't be checked any more
+                logger.debug("{} failed to write {}: {}".format(name, key, error))
+                continue
+            while not to_verify.put(workload.encode(key, value), timeout=1):
+                if stop.value:
+                    return
+            with writes.get_lock():
+                writes.value += 1
+
+    try:
+        while not stop.value:
+            handle_completions()
+            worker.recorder.flush()
+            record = None
+            if rewrite_probability > 0 and random.random() < rewrite_probability:
+                record = rewritable.get_nowait()
+            key, previous = workload.decode(record) if record is not None else (uuid.uuid4(), None)
+            value = workload.next_value(previous)
+            worker.execute(workload.write_params(key, value), (key, value))
+        worker.wait_idle()
+        handle_completions()
+    finally:
+        worker.close()
+
+
+def _checker_main(name, session_factory, workload, consistency_level, in_flight, to_verify, rewritable,
+                  drained, stats_queue, phase, mismatches):
+    worker = _Worker(name, session_factory, workload, workload.read_cql, consistency_level, in_flight,
+                     stats_queue, phase)
+
+    def handle_completions():
+        for record, latency, rows, error in worker.completions():
+            worker.recorder.record(READ, latency, error)
+            if error is not None:
+                _check_error(name, error, stats_queue)
+                # check it again later
+                to_verify.put_nowait(record)
+                continue
+            key, expected = workload.decode(record)
+            actual = rows[0][0] if rows else None
+            if actual != expected:
+                with mismatches.get_lock():
+                    mismatches.value += 1
+                stats_queue.put(Mismatch(name, key, expected, actual))
+            else:
+                # dropped if full; rewrites don't have to follow the order of the writes
+                rewritable.put_nowait(record)
+
+    try:
+        while True:
+            handle_completions()
+            worker.recorder.flush()
+            record = to_verify.get(timeout=0.1)
+            if record is None:
+                if drained.value:
+                    worker.wait_idle()
+                    handle_completions()
+                    if len(to_verify) == 0:
+                        break
+                continue
+            worker.execute((workload.decode(record)[0],), record)
+    finally:
+        worker.close()
+
+
+class LoadReport(object):
+    """
+    The IntervalStats and Mismatch sent by the processes of a ContinuousLoad.
+
+    @param phases The names of the phases, in the order they started
+    """
+
+    def __init__(self, phases, intervals, mismatches, writes):
+        self.phases = phases
+        self.intervals = intervals
+        self.mismatches = mismatches
+        self.writes = writes
+
+    def series(self, phase, operation, resolution=STATS_INTERVAL):
+        """
+        @return A list of (start time, count, errors, p99 latency) of the operations of a phase, per resolution seconds
+        """
+        index = self.phases.index(phase)
+        buckets = {}
+        for interval in self.intervals:
+            if interval.phase == index and interval.operation == operation:
+                slot = int(interval.start // resolution)
+                count, errors, latencies = buckets.get(slot, (0, 0, [0] * len(LATENCY_BUCKETS)))
+                buckets[slot] = (count + interval.count, errors + interval.errors,
+                                 [a + b for a, b in zip(latencies, interval.latencies)])
+        return [(slot * resolution, count, errors, _quantile(latencies, 0.99))
+                for slot, (count, errors, latencies) in sorted(buckets.items())]
+
+    def summary(self):
+        """
+        @return A PhaseStats per phase and operation, latencies in seconds
+        """
+        stats = []
+        for index, phase in enumerate(self.phases):
+            for operation in (WRITE, READ):
+                intervals = [i for i in self.intervals if i.phase == index and i.operation == operation]
+                if not intervals:
+                    continue
+                count = sum(i.count for i in intervals)
+                errors = sum(i.errors for i in intervals)
+                latencies = [sum(bucket) for bucket in zip(*(i.latencies for i in intervals))]
+                duration = max(max(i.start for i in intervals) + STATS_INTERVAL - min(i.start for i in intervals),
+                               STATS_INTERVAL)
+                stats.append(PhaseStats(phase=phase, operation=operation, count=count, errors=errors,
+                                        error_rate=errors / count if count else 0.0,
+                                        operations_per_second=count / duration,
+                                        p50=_quantile(latencies, 0.5), p99=_quantile(latencies, 0.99),
+                                        max=max(i.max_latency for i in intervals)))
+        return stats
+
+    def __str__(self):
+        lines = ['{} writes, {} mismatches'.format(self.writes, len(self.mismatches))]
+        for s in self.summary():
+            lines.append('{:<40} {:<5} {:>8} ops {:>8.0f}/s {:>6} errors ({:.2%}) p50 {} p99 {} max {:.3f}s'.format(
+                s.phase, s.operation, s.count, s.operations_per_second, s.errors, s.error_rate,
+                _format_latency(s.p50), _format_latency(s.p99), s.max))
+        return '\n'.join(lines)
+
+
+def _format_latency(latency):
+    return '-' if latency is None else '<{:.4f}s'.format(latency)
+
+
+class ContinuousLoad(object):
+    """
+    Runs writers writer processes and checkers checker processes against a cluster until
+    stopped.
+
+    @param session_factory A callable returning a new session, called in each process
+    @param workload The Workload to run, e.g. VALUES_WORKLOAD or COUNTERS_WORKLOAD
+    @param in_flight The window of asynchronous requests in flight of each process
+    @param ring_capacity The number of writes waiting for verification after which writers block
+    @param rewrite_probability The probability a writer overwrites an already verified row instead of writing a new one
+    @param phase The name of the first phase
+    """
+
+    def __init__(self, session_factory, workload, writers=2, checkers=2, in_flight=32, ring_capacity=100000,
+                 rewrite_probability=0.25, consistency_level=ConsistencyLevel.QUORUM, phase='start'):
+        record_size = 16 + workload.VALUE_SIZE
+        self.session_factory = session_factory
+        self.workload = workload
+        self.writers = writers
+        self.checkers = checkers
+        self.in_flight = in_flight
+        self.rewrite_probability = rewrite_probability
+        self.consistency_level = consistency_level
+        self.to_verify = RecordRing(ring_capacity, record_size)
+        self.rewritable = RecordRing(max(1, ring_capacity // 10), record_size)
+        self.processes = []
+        self.phases = []
+        self._writes = multiprocessing.Value(ctypes.c_longlong, 0)
+        self._mismatches = multiprocessing.Value(ctypes.c_longlong, 0)
+        self._stop_writers = multiprocessing.RawValue(ctypes.c_bool, False)
+        self._drained = multiprocessing.RawValue(ctypes.c_bool, False)
+        self._phase = multiprocessing.RawValue(ctypes.c_int, 0)
+        self._stats_queue = multiprocessing.Queue()
+        self._intervals = []
+        self._mismatch_examples = []
+        self._errors = []
+        self.phase(phase)
+
+    @property
+    def writes(self):
+        """
+        The number of acknowledged writes so far.
+        """
+        return self._writes.value
+
+    def phase(self, name):
+        """
+        Tag the operations completing from now on with the phase name.
+        """
+        logger.debug("load phase: {} ({} writes so far)".format(name, self.writes))
+        self.phases.append(name)
+        self._phase.value = len(self.phases) - 1
+
+    def start(self):
+        common = (self.session_factory, self.workload, self.consistency_level, self.in_flight,
+                  self.to_verify, self.rewritable)
+        for i in range(self.writers):
+            self._start_process('load-writer-{}'.format(i), _writer_main,
+                                common + (self.rewrite_probability, self._writes, self._stop_writers,
+                                          self._stats_queue, self._phase))
+        for i in range(self.checkers):
+            self._start_process('load-checker-{}'.format(i), _checker_main,
+                                common + (self._drained, self._stats_queue, self._phase, self._mismatches))
+        return self
+
+    def _start_process(self, name, target, args):
+        process = multiprocessing.Process(target=target, name=name, args=(name,) + args)
+        # daemon subprocesses are killed automagically when the parent process exits
+        process.daemon = True
+        process.start()
+        self.processes.append(process)
+
+    def _collect(self):
+        while True:
+            try:
+                message = self._stats_queue.get_nowait()
+            except Empty:
+                return
+            if isinstance(message, Mismatch):
+                self._mismatch_examples.append(message)
+            elif isinstance(message, LoadError):
+                self._errors.append(message)
+            else:
+                self._intervals.append(message)
+
+    def _check_mismatches(self):
+        self._collect()
+        if self._mismatches.value:
+            self.terminate()
+            raise RuntimeError("{} rows did not match the expected value, e.g. {}".format(
+                self._mismatches.value, self._mismatch_examples[:5]))
+
+    def check_alive(self):
+        """
+        @throws RuntimeError If a process died, e.g. on an error other than a timeout, or a
+                             checker found a wrong value
+        """
+        self._check_mismatches()
+        dead = [p for p in self.processes if not p.is_alive()]
+        if dead:
+            self.terminate()
+            raise RuntimeError("A load process has terminated early: {}{}".format(
+                ', '.join('{} (exit code {})'.format(p.name, p.exitcode) for p in dead),
+                ''.join('\n{}: {}'.format(e.worker, e.error) for e in self._errors)))
+
+    def wait_for_writes(self, count, timeout=600):
+        """
+        Wait until count writes were acknowledged.
+        """
+        deadline = time.time() + timeout
+        while self.writes < count:
+            self.check_alive()
+            if time.time() > deadline:
+                raise RuntimeError("Ran out of time waiting for {} writes, got {}".format(count, self.writes))
+            time.sleep(0.1)
+
+    def stop(self, drain_timeout=1200):
+        """
+        Stop writing, wait for the checkers to verify every pending write and stop them.
+
+        @return The LoadReport of the whole run
+        """
+        self.check_alive()
+        self._stop_writers.value = True
+        self._join([p for p in self.processes if p.name.startswith('load-writer')], 120)
+        self._drained.value = True
+        self._join([p for p in self.processes if p.name.startswith('load-checker')], drain_timeout)
+        self._check_mismatches()
+        if any(p.is_alive() or p.exitcode != 0 for p in self.processes):
+            self.terminate()
+            raise RuntimeError("Load processes did not stop cleanly: {}, {} still pending verification".format(
+                ', '.join('{} (exit code {})'.format(p.name, p.exitcode) for p in self.processes),
+                len(self.to_verify)))
+        return LoadReport(list(self.phases), self._intervals, self._mismatch_examples, self.writes)
+
+    def _join(self, processes, timeout):
+        # keep draining the stats queue, a process doesn't exit until what it put in it was read
+        deadline = time.time() + timeout
+        for process in processes:
+            while process.is_alive() and time.time() < deadline:
+                self._collect()
+                process.join(0.1)
+
+    def terminate(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.kill()
@@ -0,0 +1,172 @@
+"""
+Archiving of the logs of a test's cluster.
+
+Log files are first linked (or reflinked) into the archive directory, which takes no time
+and no I/O. Compressing them and keeping the archive under its size budget then happens
+in background threads, while the next test is already starting its cluster.
+"""
+import gzip
+import logging
+import os
+import shutil
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from ccmlib.common import is_win
+
+from tools.files import link_or_copy
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+def _compress(path):
+    """
+    Compress a file next to itself with zstd (if the zstandard module is installed) or gzip,
+    then remove the uncompressed file.
+    """
+    if zstandard is not None:
+        target = path + '.zst'
+        with open(path, 'rb') as src, open(target, 'wb') as dst:
+            zstandard.ZstdCompressor(level=3, threads=-1).copy_stream(src, dst)
+    else:
+        target = path + '.gz'
+        with open(path, 'rb') as src, gzip.open(target, 'wb', compresslevel=3) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.remove(path)
+    return target
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+class LogArchiver(object):
+    """
+    Archives cluster logs into directory/<timestamp>_<test name>.
+
+    @param directory Where archived logs are kept
+    @param compress Whether to compress archived logs in the background
+    @param max_size_mb Optional size budget of directory; the oldest archives are evicted first when it is exceeded
+    @param workers Number of background compression threads
+    """
+
+    def __init__(self, directory, compress=False, max_size_mb=None, workers=2):
+        self.directory = directory
+        self.compress = compress
+        self.max_size_bytes = max_size_mb * 1024 * 1024 if max_size_mb else None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='log-archiver')
+        self._eviction_lock = threading.Lock()
+        # pending writes (linking, then one per file being compressed) of each archive directory,
+        # which is never evicted until they are done
+        self._writing = Counter()
+        self._writing_lock = threading.Lock()
+
+    def archive(self, files, basedir, last_link=None, allow_hardlink=True, directory=None):
+        """
+        Link or copy files into directory/basedir, then hand compression and eviction to
+        the background threads.
+
+        @param files List of (source path, archived file name)
+        @param basedir Name of the archive directory of this test
+        @param last_link Optional symlink (e.g. logs/last) to point at the new archive
+        @param allow_hardlink False if the source files may still be modified in place later
+        @param directory Optional directory to archive into instead of the archiver's own directory
+        @return The path of the archive directory, or None if there was nothing to archive
+        """
+        if not files:
+            return None
+
+        logdir = os.path.join(directory or self.directory, basedir)
+        self._start_writing(logdir)
+        try:
+            os.makedirs(logdir)
+            archived = []
+            for src, name in files:
+                target = os.path.join(logdir, name)
+                link_or_copy(src, target, allow_hardlink=allow_hardlink)
+                archived.append(target)
+
+            if last_link is not None:
+                if os.path.lexists(last_link):
+                    os.unlink(last_link)
+                if not is_win():
+                    os.symlink(basedir, last_link)
+
+            if self.compress:
+                self._start_writing(logdir, len(archived))
+                for path in archived:
+                    self._executor.submit(self._compress, logdir, path).add_done_callback(_log_failure)
+        finally:
+            self._done_writing(logdir)
+
+        if self.max_size_bytes is not None and directory in (None, self.directory):
+            self._executor.submit(self.evict, keep=basedir).add_done_callback(_log_failure)
+        return logdir
+
+    def _start_writing(self, logdir, count=1):
+        with self._writing_lock:
+            self._writing[logdir] += count
+
+    def _done_writing(self, logdir):
+        with self._writing_lock:
+            self._writing[logdir] -= 1
+            if self._writing[logdir] <= 0:
+                del self._writing[logdir]
+
+    def _compress(self, logdir, path):
+        try:
+            return _compress(path)
+        finally:
+            self._done_writing(logdir)
+
+    def evict(self, keep=None):
+        """
+        Remove the oldest archives until directory fits in its size budget. Archive
+        directories are named after the time they were taken, so name order is age order.
+        Archives still being linked or compressed are left for a later eviction.
+
+        @param keep An archive which is never evicted (usually the one just taken)
+        """
+        if self.max_size_bytes is None:
+            return
+        with self._eviction_lock:
+            paths = (os.path.join(self.directory, d) for d in os.listdir(self.directory))
+            archives = sorted(os.path.basename(p) for p in paths if os.path.isdir(p) and not os.path.islink(p))
+            sizes = {d: _dir_size(os.path.join(self.directory, d)) for d in archives}
+            total = sum(sizes.values())
+            for archive in archives:
+                if total <= self.max_size_bytes:
+                    break
+                if archive == keep:
+                    continue
+                with self._writing_lock:
+                    if os.path.join(self.directory, archive) in self._writing:
+                        continue
+                    logger.debug("evicting archived logs {} to stay under {} bytes"
+                                 .format(archive, self.max_size_bytes))
+                    shutil.rmtree(os.path.join(self.directory, archive), ignore_errors=True)
+                total -= sizes[archive]
+
+    def close(self):
+        """
+        Wait for background compression and eviction to finish.
+        """
+        self._executor.shutdown(wait=True)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error("Error archiving logs: {}".format(future.exception()))
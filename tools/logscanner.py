@@ -0,0 +1,291 @@
+"""
+Incremental scanning of node logs for errors.
+
+ccm's Node.grep_log_for_errors re-reads a whole log file on every call, and active log
+watching polls on top of that. The classes here remember how far each log was read, so
+scanning a log costs only what was appended to it since the last scan, no matter how big
+the log grows over a long test.
+"""
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+LOG_CATEGORY_RE = re.compile(r'(\W|^)(TRACE|DEBUG|INFO|WARN|ERROR)\W')
+
+
+@lru_cache(maxsize=64)
+def _compile_ignore_patterns(patterns):
+    if not patterns:
+        return None
+    try:
+        return re.compile('|'.join('(?:{})'.format(p) for p in patterns))
+    except re.error:
+        # some patterns (e.g. ones with inline flags) can't be combined; fall back to one regex each
+        compiled = [re.compile(p) for p in patterns]
+
+        class _AnyOf(object):
+            @staticmethod
+            def search(string):
+                for regex in compiled:
+                    match = regex.search(string)
+                    if match:
+                        return match
+                return None
+        return _AnyOf
+
+
+def is_ignored_error(error, ignore_log_patterns):
+    """
+    @param error An error (possibly spanning several lines) as found in a node log
+    @param ignore_log_patterns Iterable of regular expressions, any of which makes the error ignorable
+    @return True if any of the patterns matches the error, either as is or with its newlines replaced by spaces
+    """
+    regex = _compile_ignore_patterns(tuple(ignore_log_patterns))
+    if regex is None:
+        return False
+    return regex.search(error) is not None or regex.search(error.replace('\n', ' ')) is not None
+
+
+def filter_errors(errors, ignore_log_patterns):
+    """Filter errors, removing those that match ignore_log_patterns"""
+    for e in errors:
+        if not is_ignored_error(e, ignore_log_patterns):
+            yield e
+
+
+class LogTail(object):
+    """
+    Reads the lines appended to a log file since the previous read.
+
+    The file is kept open between reads, so a log which is rotated or truncated
+    is still read to its very end before switching over to the new file. Each file
+    opened is a new generation, numbered from 1.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.generation = 0
+        self._file = None
+        self._inode = None
+        self._partial = b''
+
+    def read_lines(self, positions=None):
+        """
+        @param positions Optional list the (generation, byte offset) of each line returned is appended to
+        @return The complete lines appended to the log since the previous read
+        """
+        lines = []
+        if self._file is not None:
+            lines.extend(self._read_available(positions))
+            if self._replaced():
+                self.close()
+
+        if self._file is None:
+            if not os.path.exists(self.path):
+                return lines
+            try:
+                self._file = open(self.path, 'rb')
+            except FileNotFoundError:
+                return lines
+            self._inode = os.fstat(self._file.fileno()).st_ino
+            self.generation += 1
+            lines.extend(self._read_available(positions))
+
+        return lines
+
+    @property
+    def position(self):
+        """
+        The offset right after the last complete line returned, comparable to a ccm log mark
+        """
+        if self._file is None:
+            return 0
+        return self._file.tell() - len(self._partial)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._inode = None
+        self._partial = b''
+
+    def _replaced(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        # truncated in place (e.g. by a cluster pool reset) or rotated by logback
+        return stat.st_ino != self._inode or stat.st_size < self._file.tell()
+
+    def _read_available(self, positions):
+        offset = self.position
+        data = self._partial + self._file.read()
+        if not data:
+            return []
+        lines = data.split(b'\n')
+        # the last element is an incomplete line (or empty), keep it for the next read
+        self._partial = lines.pop()
+        if positions is not None:
+            for line in lines:
+                positions.append((self.generation, offset))
+                offset += len(line) + 1
+        return [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines]
+
+
+class LogErrorParser(object):
+    """
+    Groups log lines into errors the same way ccm does: an ERROR line starts a new error,
+    and following lines without a log level (e.g. stack traces) are part of it.
+    The state is kept across calls so an error split between two reads stays whole.
+    """
+
+    def __init__(self):
+        self._in_error = False
+
+    def parse(self, lines, errors, positions=None, error_positions=None):
+        """
+        @param lines New lines read from the log
+        @param errors List of errors, each a list of lines, new errors are appended to.
+                      The last error may be extended if it was still open.
+        @param positions Optional position of each line, e.g. as returned by LogTail.read_lines
+        @param error_positions List the position of the first line of each new error is appended to,
+                               when positions are given
+        @return The number of errors appended
+        """
+        added = 0
+        for i, line in enumerate(lines):
+            match = LOG_CATEGORY_RE.search(line)
+            category = match.group(2) if match else None
+            if category == 'ERROR':
+                errors.append([line])
+                if positions is not None:
+                    error_positions.append(positions[i])
+                self._in_error = True
+                added += 1
+            elif category is None and self._in_error and errors:
+                errors[-1].append(line)
+            else:
+                self._in_error = False
+        return added
+
+
+class ClusterLogScanner(object):
+    """
+    A single log tailing service for every node of a cluster. It remembers the read offset
+    of each node's log and collects the errors seen since the scanner was created. The same
+    scanner feeds both the active log watching callback and the error check at teardown.
+
+    As with ccm's Node.grep_log_for_errors, errors before the error_mark of a node (set by
+    Node.mark_log_for_errors) are left out, as are those of the logs rotated before it.
+    """
+
+    def __init__(self, cluster, filename='system.log'):
+        self.cluster = cluster
+        self.filename = filename
+        self._tails = {}
+        self._parsers = {}
+        self._errors = {}
+        self._positions = {}
+        # node name -> (generation of the log when error_mark was seen to change, error_mark)
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def scan(self):
+        """
+        Read whatever was appended to the node logs since the last scan.
+
+        @return A dict mapping node name to the list of new errors (each a list of lines) of that node
+        """
+        new_errors = {}
+        with self._lock:
+            for node in self.cluster.nodelist():
+                path = os.path.join(node.log_directory(), self.filename)
+                tail = self._tails.get(node.name)
+                if tail is None or tail.path != path:
+                    if tail is not None:
+                        tail.close()
+                    tail = self._tails[node.name] = LogTail(path)
+                    self._parsers[node.name] = LogErrorParser()
+
+                node_errors = self._errors.setdefault(node.name, [])
+                error_positions = self._positions.setdefault(node.name, [])
+                before = len(node_errors)
+                positions = []
+                lines = tail.read_lines(positions)
+                added = self._parsers[node.name].parse(lines, node_errors, positions, error_positions)
+
+                error_mark = getattr(node, 'error_mark', 0) or 0
+                if error_mark != self._marks.get(node.name, (0, 0))[1]:
+                    self._marks[node.name] = (tail.generation, error_mark)
+                if added:
+                    added_errors = self._unmarked(node.name, node_errors[before:], error_positions[before:])
+                    if added_errors:
+                        new_errors[node.name] = added_errors
+        return new_errors
+
+    def _unmarked(self, name, errors, positions):
+        generation, error_mark = self._marks.get(name, (0, 0))
+        return [error for error, position in zip(errors, positions) if position >= (generation, error_mark)]
+
+    def errors(self):
+        """
+        Scan the logs once more and return every error seen since the scanner was created.
+
+        @return A dict mapping node name to the list of errors (each a list of lines) of that node
+        """
+        self.scan()
+        with self._lock:
+            errors = {name: self._unmarked(name, errors, self._positions[name]) for name, errors in self._errors.items()}
+            return {name: node_errors for name, node_errors in errors.items() if node_errors}
+
+    def start(self, on_error_call, interval=0.25):
+        """
+        Start scanning the logs in the background every interval seconds. on_error_call is
+        called with the dict of new errors, in the same format as ccm's
+        Cluster.actively_watch_logs_for_error callbacks.
+
+        @return The watching thread; its join() stops it after a final scan
+        """
+        thread = _LogWatchingThread(self, on_error_call, interval)
+        thread.start()
+        return thread
+
+    def close(self):
+        with self._lock:
+            for tail in self._tails.values():
+                tail.close()
+            self._tails = {}
+
+
+class _LogWatchingThread(threading.Thread):
+
+    def __init__(self, scanner, on_error_call, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.scanner = scanner
+        self.on_error_call = on_error_call
+        self.interval = interval
+        self.req_stop_event = threading.Event()
+        self.done_event = threading.Event()
+
+    def run(self):
+        try:
+            while not self.req_stop_event.wait(self.interval):
+                self._scan_and_report()
+            # do a final scan to make sure we got to the very end of the logs
+            self._scan_and_report()
+        finally:
+            self.done_event.set()
+
+    def _scan_and_report(self):
+        new_errors = self.scanner.scan()
+        if new_errors:
+            self.on_error_call(new_errors)
+
+    def join(self, timeout=None):
+        self.req_stop_event.set()
+        self.done_event.wait(timeout=timeout)
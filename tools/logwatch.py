@@ -0,0 +1,248 @@
+"""
+Event driven replacement for ccm's Node.watch_log_for.
+
+ccm's watch_log_for re-opens and polls the log of a node for every waiter. A NodeLogBus
+instead has a single reader per node log, woken up by inotify (on Linux) as soon as the
+log is written to, which dispatches every new line to all the waiters registered on it.
+
+Example usage:
+
+    from tools.logwatch import watch_log_for
+
+    mark = node.mark_log()
+    node.nodetool('flush')
+    watch_log_for(node, 'Completed flushing', from_mark=mark, timeout=60)
+
+    # several patterns can be waited for concurrently without extra reads of the log
+    bus = get_log_bus(node)
+    started = bus.register("Compacting(.*)ks", from_mark=mark)
+    finished = bus.register("Compacted", from_mark=mark)
+    started.wait(timeout=120)
+    finished.wait(timeout=120)
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import select
+import threading
+import time
+
+from ccmlib.node import TimeoutError
+
+from tools.logscanner import LogTail
+
+logger = logging.getLogger(__name__)
+
+# fallback polling interval when inotify isn't available
+POLL_INTERVAL = 0.1
+# the reader wakes up at least this often, even if inotify didn't report anything
+MAX_IDLE_WAIT = 1.0
+
+# see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class _Inotify(object):
+    """
+    Minimal inotify binding over ctypes, watching a single directory. wait() falls back to
+    sleeping for POLL_INTERVAL when inotify can't be used (e.g. not on Linux).
+    """
+
+    def __init__(self, directory):
+        self.fd = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+            if libc.inotify_add_watch(fd, directory.encode('utf-8'), mask) < 0:
+                os.close(fd)
+                return
+            self.fd = fd
+        except (OSError, AttributeError, TypeError):
+            logger.debug("inotify not available, watching {} by polling".format(directory))
+
+    def wait(self, timeout):
+        if self.fd is None:
+            time.sleep(min(timeout, POLL_INTERVAL))
+            return
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            try:
+                # drain the pending events, we only care that something happened
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class LogWaiter(object):
+    """
+    A set of regular expressions waited for in a node log. Once every expression matched a
+    line, the waiter is done and wait() returns the matches the same way ccm's
+    watch_log_for does.
+    """
+
+    def __init__(self, bus, exprs, on_match=None):
+        self.bus = bus
+        self.single = isinstance(exprs, str) or hasattr(exprs, 'search')
+        exprs = [exprs] if self.single else list(exprs)
+        self.patterns = [re.compile(e) if isinstance(e, str) else e for e in exprs]
+        self.remaining = list(self.patterns)
+        self.matchings = []
+        self.on_match = on_match
+        self.done = threading.Event()
+
+    def feed(self, line):
+        for pattern in list(self.remaining):
+            match = pattern.search(line)
+            if match:
+                self.matchings.append((line, match))
+                self.remaining.remove(pattern)
+                if self.on_match is not None:
+                    self.on_match(line, match)
+        if not self.remaining:
+            self.done.set()
+        return self.done.is_set()
+
+    def wait(self, timeout=600, process=None):
+        """
+        @param process Optional process (e.g. the one starting the node) to give up on if it exits before the match
+        @return The (line, match) tuple if a single expression was registered, otherwise a list of them
+        @throws ccmlib.node.TimeoutError if some expressions were not matched before the timeout
+        """
+        try:
+            deadline = time.time() + timeout
+            while process is not None and not self.done.is_set() and time.time() < deadline:
+                if process.poll() is not None:
+                    raise RuntimeError("The process is dead, returncode={}".format(process.returncode))
+                self.done.wait(min(1, max(0, deadline - time.time())))
+            if not self.done.wait(max(0, deadline - time.time())):
+                raise TimeoutError("{} [{}] Missing: {} not found in {}".format(
+                    time.strftime("%d %b %Y %H:%M:%S", time.gmtime()), self.bus.name,
+                    [p.pattern for p in self.remaining], self.bus.tail.path))
+        finally:
+            self.bus.unregister(self)
+        return self.matchings[0] if self.single else self.matchings
+
+
+class NodeLogBus(object):
+    """
+    A single reader of one node log, dispatching every new line to the registered waiters.
+    """
+
+    def __init__(self, node, filename='system.log'):
+        self.name = node.name
+        self.tail = LogTail(os.path.join(node.log_directory(), filename))
+        self._waiters = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._inotify = _Inotify(node.log_directory())
+        self._reader = threading.Thread(target=self._run, name='log-bus-{}-{}'.format(node.name, filename))
+        self._reader.daemon = True
+        self._reader.start()
+
+    def register(self, exprs, from_mark=None, on_match=None):
+        """
+        Start waiting for exprs in the log. Like ccm, lines are matched from from_mark, or
+        from the beginning of the log if no mark is given.
+
+        @param exprs A regular expression, or a list of them, to wait for
+        @param from_mark A log mark as returned by node.mark_log()
+        @param on_match Optional callback, called with (line, match) as soon as an expression matches
+        @return A LogWaiter
+        """
+        waiter = LogWaiter(self, exprs, on_match=on_match)
+        with self._lock:
+            # catch up with what the reader already went past, then let it feed the rest
+            self._dispatch(self.tail.read_lines())
+            if not self._catch_up(waiter, from_mark or 0):
+                self._waiters.append(waiter)
+        return waiter
+
+    def wait_for(self, exprs, from_mark=None, timeout=600, process=None):
+        return self.register(exprs, from_mark=from_mark).wait(timeout=timeout, process=process)
+
+    def unregister(self, waiter):
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def close(self):
+        self._closed.set()
+        self._reader.join(timeout=10)
+        self._inotify.close()
+        self.tail.close()
+
+    def _catch_up(self, waiter, from_mark):
+        end = self.tail.position
+        if from_mark >= end or not os.path.exists(self.tail.path):
+            return False
+        with open(self.tail.path, 'rb') as f:
+            f.seek(from_mark)
+            data = f.read(end - from_mark)
+        for line in data.decode('utf-8', errors='replace').splitlines():
+            if waiter.feed(line):
+                return True
+        return False
+
+    def _dispatch(self, lines):
+        for line in lines:
+            if not self._waiters:
+                return
+            self._waiters = [w for w in self._waiters if not w.feed(line)]
+
+    def _run(self):
+        while not self._closed.is_set():
+            with self._lock:
+                self._dispatch(self.tail.read_lines())
+            self._inotify.wait(MAX_IDLE_WAIT)
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_log_bus(node, filename='system.log'):
+    """
+    @return The NodeLogBus of a node log, created on first use
+    """
+    key = os.path.join(node.log_directory(), filename)
+    with _buses_lock:
+        bus = _buses.get(key)
+        if bus is None:
+            bus = _buses[key] = NodeLogBus(node, filename=filename)
+        return bus
+
+
+def close_log_buses():
+    """
+    Stop the readers of every node log. Called when a test's cluster is torn down.
+    """
+    with _buses_lock:
+        buses = list(_buses.values())
+        _buses.clear()
+    for bus in buses:
+        bus.close()
+
+
+def watch_log_for(node, exprs, from_mark=None, timeout=600, process=None, verbose=False, filename='system.log'):
+    """
+    Drop-in replacement for ccm's node.watch_log_for(exprs, from_mark=..., timeout=..., process=..., filename=...)
+    """
+    if verbose:
+        logger.info("{} waiting for {} in {}".format(node.name, exprs, filename))
+    return get_log_bus(node, filename=filename).wait_for(exprs, from_mark=from_mark, timeout=timeout, process=process)
@@ -0,0 +1,288 @@
+"""
+A long lived management client for the nodes of a cluster.
+
+Every node.nodetool() call forks a new JVM, which costs about a second before nodetool
+even talks to the node. Tests that poll tpstats, compactionstats or cfstats in a loop pay
+that on every iteration. The ManagementClient instead attaches a Jolokia agent to each
+node once and then answers the same questions with a single HTTP request, returning
+structured results rather than nodetool output to parse.
+
+When the agent can't be attached to a node, when a request fails even through a freshly
+attached agent, or for commands the client doesn't know, it falls back to the nodetool CLI.
+
+Example usage:
+
+    from tools.management import get_management_client
+
+    client = get_management_client(self.cluster)
+    pools = client.tpstats(node1)
+    assert pools['MutationStage'].pending == 0
+    client.nodetool(node1, 'flush ks tbl')
+    size = client.table_metrics(node1, 'ks', 'tbl')['TotalDiskSpaceUsed']
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from tools.jmxutils import JolokiaAgent, make_mbean, parse_mbean_name
+
+logger = logging.getLogger(__name__)
+
+ThreadPoolStats = namedtuple('ThreadPoolStats', ['active', 'pending', 'completed', 'blocked', 'all_time_blocked'])
+CompactionStats = namedtuple('CompactionStats', ['pending_tasks', 'compactions'])
+
+THREAD_POOL_METRICS = {
+    'ActiveTasks': 'active',
+    'PendingTasks': 'pending',
+    'CompletedTasks': 'completed',
+    'CurrentlyBlockedTasks': 'blocked',
+    'TotalBlockedTasks': 'all_time_blocked',
+}
+
+_TPSTATS_LINE_RE = re.compile(r"(?P<name>\S+)\s+(?P<active>\d+)\s+(?P<pending>\d+)\s+(?P<completed>\d+)\s+"
+                              r"(?P<blocked>\d+)\s+(?P<alltimeblocked>\d+)")
+_PENDING_TASKS_RE = re.compile(r"pending tasks:\s*(\d+)")
+
+# cfstats lines, and the table metric each of them reports
+_CFSTATS_METRICS = OrderedDict([
+    ('SSTable count', 'LiveSSTableCount'),
+    ('Space used (live)', 'LiveDiskSpaceUsed'),
+    ('Space used (total)', 'TotalDiskSpaceUsed'),
+    ('Memtable data size', 'MemtableLiveDataSize'),
+    ('Number of partitions (estimate)', 'EstimatedPartitionCount'),
+])
+
+
+def metric_value(attributes):
+    # gauges expose Value, counters, meters and timers expose Count
+    if 'Value' in attributes:
+        return attributes['Value']
+    return attributes.get('Count')
+
+
+class ManagementClient(object):
+    """
+    nodetool equivalent operations over one Jolokia agent per node, attached on first use
+    and reattached when the node is restarted.
+    """
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self._agents = {}
+        # every agent started by this client, including those replaced since, with the pid it was attached to
+        self._attached = []
+        self._cli_only = set()
+        self._lock = threading.Lock()
+
+    def tpstats(self, node):
+        """
+        @return An OrderedDict mapping thread pool name to its ThreadPoolStats
+        """
+        def over_jmx(agent):
+            pools = {}
+            for mbean, attributes in agent.read_pattern('org.apache.cassandra.metrics:type=ThreadPools,*').items():
+                _, properties = parse_mbean_name(mbean)
+                field = THREAD_POOL_METRICS.get(properties.get('name'))
+                if field is not None:
+                    pools.setdefault(properties['scope'], {})[field] = int(metric_value(attributes) or 0)
+            return OrderedDict((name, ThreadPoolStats(**dict(dict.fromkeys(ThreadPoolStats._fields, 0), **stats)))
+                               for name, stats in sorted(pools.items()))
+
+        def over_cli():
+            stdout = node.nodetool('tpstats')[0]
+            pools = OrderedDict()
+            for line in stdout.splitlines():
+                match = _TPSTATS_LINE_RE.match(line)
+                if match is not None:
+                    pools[match.group('name')] = ThreadPoolStats(*(int(match.group(g)) for g in (
+                        'active', 'pending', 'completed', 'blocked', 'alltimeblocked')))
+            return pools
+
+        return self._call(node, over_jmx, over_cli)
+
+    def compactionstats(self, node):
+        """
+        @return A CompactionStats with the number of pending compaction tasks and the list of
+                running compactions, each a dict as returned by CompactionManager.getCompactions.
+                The list is always empty when the stats had to be read through the CLI.
+        """
+        def over_jmx(agent):
+            pending, compactions = agent.read_attributes([
+                (make_mbean('metrics', type='Compaction', name='PendingTasks'), 'Value'),
+                (make_mbean('db', 'CompactionManager'), 'Compactions')])
+            return CompactionStats(pending_tasks=int(pending), compactions=compactions)
+
+        def over_cli():
+            stdout = node.nodetool('compactionstats')[0]
+            match = _PENDING_TASKS_RE.search(stdout)
+            return CompactionStats(pending_tasks=int(match.group(1)) if match else 0, compactions=[])
+
+        return self._call(node, over_jmx, over_cli)
+
+    def table_metrics(self, node, keyspace, table):
+        """
+        @return A dict mapping the name of each metric of the table (e.g. LiveSSTableCount,
+                TotalDiskSpaceUsed) to its value. Only the metrics shown by nodetool cfstats are
+                available when the metrics had to be read through the CLI.
+        """
+        def over_jmx(agent):
+            metric_type = 'Table' if self.cluster.version() >= '3.0' else 'ColumnFamily'
+            pattern = 'org.apache.cassandra.metrics:type={},keyspace={},scope={},*'.format(metric_type, keyspace, table)
+            metrics = {}
+            for mbean, attributes in agent.read_pattern(pattern).items():
+                _, properties = parse_mbean_name(mbean)
+                metrics[properties['name']] = metric_value(attributes)
+            return metrics
+
+        def over_cli():
+            stdout = node.nodetool('cfstats {}.{}'.format(keyspace, table))[0]
+            metrics = {}
+            for line in stdout.splitlines():
+                label, _, value = line.strip().partition(':')
+                if label in _CFSTATS_METRICS:
+                    try:
+                        metrics[_CFSTATS_METRICS[label]] = float(value.split()[0])
+                    except (IndexError, ValueError):
+                        pass
+            return metrics
+
+        return self._call(node, over_jmx, over_cli)
+
+    def flush(self, node, keyspace=None, tables=()):
+        """
+        Flush the given tables of a keyspace, every table of it if none are given, or every
+        keyspace if no keyspace is given.
+        """
+        def over_jmx(agent):
+            mbean = make_mbean('db', 'StorageService')
+            keyspaces = [keyspace] if keyspace else agent.read_attribute(mbean, 'Keyspaces')
+            for ks in keyspaces:
+                agent.execute_method(mbean, 'forceKeyspaceFlush(java.lang.String,[Ljava.lang.String;)',
+                                     [ks, list(tables)])
+
+        def over_cli():
+            node.nodetool(' '.join(['flush'] + ([keyspace] if keyspace else []) + list(tables)))
+
+        return self._call(node, over_jmx, over_cli)
+
+    def replay_batchlog(self, node):
+        def over_jmx(agent):
+            agent.execute_method(make_mbean('db', 'BatchlogManager'), 'forceBatchlogReplay')
+
+        return self._call(node, over_jmx, lambda: node.nodetool('replaybatchlog'))
+
+    def nodetool(self, node, cmd):
+        """
+        Drop-in replacement for node.nodetool(cmd). Commands the client knows how to run
+        without output (flush and replaybatchlog) are run over JMX, everything else is
+        handed to the nodetool CLI.
+
+        @return The (stdout, stderr, rc) of the nodetool CLI, all empty for commands run over JMX
+        """
+        args = cmd.split()
+        if args and args[0] == 'flush' and not any(a.startswith('-') for a in args):
+            self.flush(node, keyspace=args[1] if len(args) > 1 else None, tables=args[2:])
+            return '', '', 0
+        if args == ['replaybatchlog']:
+            self.replay_batchlog(node)
+            return '', '', 0
+        return node.nodetool(cmd)
+
+    def read_patterns(self, node, patterns):
+        """
+        Read every attribute of the mbeans matching any of patterns on a node, in a single
+        request. Unlike the other operations there is no CLI equivalent to fall back to.
+
+        @return A dict mapping each matching mbean name to a dict of its attributes
+        @throws RuntimeError If the mbeans couldn't be read through a jolokia agent
+        """
+        def over_cli():
+            raise RuntimeError("Can't read {} from {} without a jolokia agent".format(patterns, node.name))
+
+        return self._call(node, lambda agent: agent.read_patterns(patterns), over_cli)
+
+    def close(self):
+        """
+        Detach the agents this client attached to nodes which are still running (e.g. those of
+        a cluster kept by the cluster pool), and forget every agent.
+        """
+        with self._lock:
+            attached = self._attached
+            self._agents = {}
+            self._attached = []
+            self._cli_only = set()
+        # shared agents only close their connection, the one which attached the agent detaches it
+        for agent, pid in sorted(attached, key=lambda a: not a[0].shared):
+            if agent.node.is_running() and agent.node.pid == pid:
+                try:
+                    agent.stop()
+                except Exception as e:
+                    logger.warning("Could not detach the jolokia agent from {}: {}".format(agent.node.name, e))
+
+    def _agent(self, node):
+        with self._lock:
+            if node.name in self._cli_only or not node.is_running():
+                return None
+            agent, pid = self._agents.get(node.name, (None, None))
+            if agent is not None and pid == node.pid:
+                return agent
+
+            agent = JolokiaAgent(node)
+            try:
+                agent.start()
+            except Exception as e:
+                logger.info("Could not attach a jolokia agent to {}, using the nodetool CLI instead: {}".format(node.name, e))
+                self._cli_only.add(node.name)
+                return None
+            self._agents[node.name] = (agent, node.pid)
+            self._attached.append((agent, node.pid))
+            return agent
+
+    def _forget(self, node):
+        with self._lock:
+            self._agents.pop(node.name, None)
+
+    def _call(self, node, over_jmx, over_cli):
+        agent = self._agent(node)
+        if agent is not None:
+            try:
+                return over_jmx(agent)
+            except Exception as e:
+                # the agent may have been stopped by a test, try once more with a fresh one
+                logger.debug("jmx request to {} failed, reattaching: {}".format(node.name, e))
+                self._forget(node)
+            agent = self._agent(node)
+            if agent is not None:
+                try:
+                    return over_jmx(agent)
+                except Exception as e:
+                    logger.info("jmx request to {} failed again, using the nodetool CLI instead: {}"
+                                .format(node.name, e))
+        return over_cli()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_management_client(cluster):
+    """
+    @return The ManagementClient of a cluster, created on first use
+    """
+    with _clients_lock:
+        client = _clients.get(id(cluster))
+        if client is None or client.cluster is not cluster:
+            client = _clients[id(cluster)] = ManagementClient(cluster)
+        return client
+
+
+def close_management_clients():
+    """
+    Close every ManagementClient. Called when a test's cluster is torn down.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,115 @@
+"""
+Concurrent execution of test matrices, such as the write consistency level x read
+consistency level x replication factor x alive nodes combinations of consistency_test.
+
+Every case of a matrix runs on a thread pool sized to the cluster under test. Cases
+are independent of each other, so a failing case doesn't stop the others, and failures
+are collected from the futures as the cases complete rather than by polling. The time
+each case took is kept and logged, slowest first, so that the combinations dominating
+the run of a matrix are easy to spot.
+
+Example usage:
+
+    from tools.matrix import concurrency_for, run_matrix
+
+    combinations = [(ConsistencyLevel.ONE, ConsistencyLevel.ALL), (ConsistencyLevel.QUORUM, ConsistencyLevel.QUORUM)]
+    report = run_matrix(combinations, lambda c: check(*c), max_workers=concurrency_for(self.cluster.nodelist()))
+"""
+import logging
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dtest import MultiError
+
+logger = logging.getLogger(__name__)
+
+# cases mostly wait on the nodes, so a few of them per node keep every coordinator busy
+# without the driver threads starving each other of the GIL
+CASES_PER_NODE = 4
+MAX_WORKERS = 32
+
+CaseResult = namedtuple('CaseResult', ['case', 'description', 'seconds', 'error', 'traceback'])
+
+
+class MatrixReport(namedtuple('MatrixReport', ['results', 'seconds'])):
+    """
+    The outcome of run_matrix: a CaseResult per case, in the order the cases were given,
+    and the wall clock time of the whole matrix.
+    """
+
+    @property
+    def failures(self):
+        return [r for r in self.results if r.error is not None]
+
+    def slowest(self, count=None):
+        return sorted(self.results, key=lambda r: r.seconds, reverse=True)[:count]
+
+    def __str__(self):
+        lines = ['{} cases in {:.1f}s, {} failed'.format(len(self.results), self.seconds, len(self.failures))]
+        for result in self.slowest():
+            lines.append('  {:8.2f}s {}{}'.format(result.seconds, result.description,
+                                                  '' if result.error is None else ' FAILED: {!r}'.format(result.error)))
+        return '\n'.join(lines)
+
+
+class MatrixCaseError(Exception):
+    """
+    The failure of one case of a matrix run by run_matrix.
+    """
+
+    def __init__(self, description, cause):
+        Exception.__init__(self, "{} failed: {!r}".format(description, cause))
+        self.description = description
+        self.cause = cause
+
+
+def concurrency_for(nodes, per_node=CASES_PER_NODE, max_workers=MAX_WORKERS):
+    """
+    @param nodes The nodes the cases of a matrix run against
+    @return The number of cases to run at the same time against these nodes
+    """
+    return max(1, min(max_workers, per_node * len(nodes)))
+
+
+def run_matrix(cases, func, max_workers, describe=repr, name='matrix'):
+    """
+    Run func(case) for every case, max_workers cases at a time. Every case is run even if
+    some of them fail.
+
+    @param cases The cases of the matrix, e.g. tuples of consistency levels
+    @param func A callable taking a case, failing by raising
+    @param max_workers The maximum number of cases running at the same time, see concurrency_for
+    @param describe A callable returning the name of a case in logs and errors
+    @param name The name of the matrix, used in logs and thread names
+    @return A MatrixReport
+    @throws MultiError If func raised for any of the cases, with one MatrixCaseError per failing case
+    """
+    cases = list(cases)
+
+    def call(case):
+        start = time.monotonic()
+        try:
+            func(case)
+            return CaseResult(case, describe(case), time.monotonic() - start, None, None)
+        except Exception as e:
+            return CaseResult(case, describe(case), time.monotonic() - start, e, traceback.format_exc())
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(cases))), thread_name_prefix=name) as executor:
+        futures = {executor.submit(call, case): i for i, case in enumerate(cases)}
+        results = [None] * len(cases)
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if result.error is not None:
+                logger.debug("{} {} failed after {:.2f}s: {!r}"
+                             .format(name, result.description, result.seconds, result.error))
+
+    report = MatrixReport(results=results, seconds=time.monotonic() - start)
+    logger.debug("{}: {}".format(name, report))
+    failures = report.failures
+    if failures:
+        raise MultiError([MatrixCaseError(r.description, r.error) for r in failures], [r.traceback for r in failures])
+    return report
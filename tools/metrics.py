@@ -0,0 +1,451 @@
+"""
+Typed snapshots of the metrics of a cluster.
+
+Tests which want to know table sizes, SSTable counts, pending compactions, thread pool
+activity or latencies used to scrape the text of nodetool cfstats, tpstats and
+compactionstats, forking a JVM for each. A MetricsSnapshot reads all of them from the
+nodes' metrics mbeans instead, for every node at once, and returns plain values.
+
+Example usage:
+
+    from tools.metrics import take_snapshot, MetricsCache
+
+    snapshot = take_snapshot(self.cluster, keyspace='ks')
+    assert snapshot.table('node1', 'ks', 'tbl').live_sstable_count == 1
+    assert snapshot.nodes['node2'].thread_pools['MutationStage'].pending == 0
+
+    # polling loops can share one snapshot per ttl instead of reading the metrics every time
+    metrics = MetricsCache(self.cluster, ttl=1)
+    while metrics.get().nodes['node1'].pending_compactions > 0:
+        time.sleep(0.1)
+
+Tests asserting on how specific metrics move (request latencies, failure meters, read
+repair counters) take a FamilySnapshot of a whole metric family instead, every scope,
+name and attribute of e.g. the ClientRequest metrics, with one bulk read per node, and
+compare two of them with diff(). The metrics a test expects are declared as a dict of
+metric name to MetricKind, which validate() checks the values of.
+
+    baseline = snapshot_family(self.cluster, 'ClientRequest', nodes=[node1])
+    session.execute(statement)
+    updated = snapshot_family(self.cluster, 'ClientRequest', nodes=[node1])
+    updated.validate(node1, 'Write', {'Latency': TIMER, 'Failures': METER}, cluster.version())
+    assert updated.diff(baseline, node1, 'Write')['Latency.Count'] == 1
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from functools import partial
+
+from tools import nodeops
+from tools.jmxutils import make_mbean, parse_mbean_name
+from tools.management import THREAD_POOL_METRICS, ThreadPoolStats, get_management_client, metric_value
+
+logger = logging.getLogger(__name__)
+
+LatencyHistogram = namedtuple('LatencyHistogram', ['count', 'mean', 'p50', 'p95', 'p99', 'max'])
+TableMetrics = namedtuple('TableMetrics', ['keyspace', 'table', 'live_sstable_count', 'live_disk_space_used',
+                                           'total_disk_space_used', 'pending_compactions', 'read_latency',
+                                           'write_latency'])
+NodeMetrics = namedtuple('NodeMetrics', ['name', 'taken_at', 'tables', 'thread_pools', 'pending_compactions',
+                                         'read_latency', 'write_latency'])
+
+# table metric name, and the TableMetrics field it fills
+_TABLE_METRICS = OrderedDict([
+    ('LiveSSTableCount', 'live_sstable_count'),
+    ('LiveDiskSpaceUsed', 'live_disk_space_used'),
+    ('TotalDiskSpaceUsed', 'total_disk_space_used'),
+    ('PendingCompactions', 'pending_compactions'),
+    ('ReadLatency', 'read_latency'),
+    ('WriteLatency', 'write_latency'),
+])
+_LATENCY_METRICS = frozenset(['ReadLatency', 'WriteLatency', 'Latency'])
+
+
+def _latency(attributes):
+    """
+    @return A LatencyHistogram of a Timer mbean's attributes, in microseconds
+    """
+    return LatencyHistogram(count=attributes.get('Count'), mean=attributes.get('Mean'),
+                            p50=attributes.get('50thPercentile'), p95=attributes.get('95thPercentile'),
+                            p99=attributes.get('99thPercentile'), max=attributes.get('Max'))
+
+
+def _patterns(cluster, keyspace=None):
+    """
+    @return The mbean patterns a node snapshot is built from
+    """
+    table_type = 'Table' if cluster.version() >= '3.0' else 'ColumnFamily'
+    patterns = ['org.apache.cassandra.metrics:type={},keyspace={},scope=*,name={}'
+                .format(table_type, keyspace or '*', name) for name in _TABLE_METRICS]
+    # the trailing wildcard keeps single mbeans in the nested {mbean: {attribute: value}} shape of pattern reads
+    patterns.append('org.apache.cassandra.metrics:type=ThreadPools,*')
+    patterns.append('org.apache.cassandra.metrics:type=Compaction,name=PendingTasks,*')
+    patterns.append('org.apache.cassandra.metrics:type=ClientRequest,scope=Read,name=Latency,*')
+    patterns.append('org.apache.cassandra.metrics:type=ClientRequest,scope=Write,name=Latency,*')
+    return patterns
+
+
+def _node_metrics(name, taken_at, mbeans):
+    """
+    Build the NodeMetrics of a node from its mbeans.
+
+    @param mbeans A dict mapping mbean names to a dict of their attributes
+    """
+    tables = {}
+    pools = {}
+    pending_compactions = None
+    client_latencies = {}
+    for mbean, attributes in mbeans.items():
+        _, properties = parse_mbean_name(mbean)
+        metric = properties.get('name')
+        metric_type = properties.get('type')
+        value = _latency(attributes) if metric in _LATENCY_METRICS else metric_value(attributes)
+
+        if metric_type in ('Table', 'ColumnFamily') and metric in _TABLE_METRICS:
+            key = (properties['keyspace'], properties['scope'])
+            tables.setdefault(key, {})[_TABLE_METRICS[metric]] = value
+        elif metric_type == 'ThreadPools' and metric in THREAD_POOL_METRICS:
+            pools.setdefault(properties['scope'], {})[THREAD_POOL_METRICS[metric]] = int(value or 0)
+        elif metric_type == 'Compaction' and metric == 'PendingTasks':
+            pending_compactions = int(value)
+        elif metric_type == 'ClientRequest':
+            client_latencies[properties['scope']] = value
+
+    table_metrics = {}
+    for (keyspace, table), fields in tables.items():
+        values = dict.fromkeys(TableMetrics._fields)
+        values.update(fields, keyspace=keyspace, table=table)
+        table_metrics[(keyspace, table)] = TableMetrics(**values)
+    thread_pools = OrderedDict((pool, ThreadPoolStats(**dict(dict.fromkeys(ThreadPoolStats._fields, 0), **stats)))
+                               for pool, stats in sorted(pools.items()))
+    return NodeMetrics(name=name, taken_at=taken_at, tables=table_metrics, thread_pools=thread_pools,
+                       pending_compactions=pending_compactions, read_latency=client_latencies.get('Read'),
+                       write_latency=client_latencies.get('Write'))
+
+
+class MetricsSnapshot(object):
+    """
+    The metrics of several nodes, read at (about) the same time.
+
+    @param nodes An OrderedDict mapping node name to its NodeMetrics
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.taken_at = min(m.taken_at for m in nodes.values()) if nodes else time.time()
+
+    def table(self, node_name, keyspace, table):
+        """
+        @return The TableMetrics of a table on one node
+        @throws KeyError If the node has no metrics for the table
+        """
+        return self.nodes[node_name].tables[(keyspace, table)]
+
+    def table_total(self, keyspace, table, field):
+        """
+        @return The sum of a TableMetrics field (e.g. live_sstable_count) over every node
+        """
+        return sum(getattr(m.tables[(keyspace, table)], field) or 0
+                   for m in self.nodes.values() if (keyspace, table) in m.tables)
+
+
+def take_snapshot(cluster, nodes=None, keyspace=None):
+    """
+    Read the metrics of several nodes concurrently, with a single bulk request per node.
+
+    @param cluster The cluster the nodes belong to
+    @param nodes The nodes to read, every running node of the cluster by default
+    @param keyspace Only read the table metrics of this keyspace, rather than of every keyspace
+    @return A MetricsSnapshot
+    """
+    if nodes is None:
+        nodes = [node for node in cluster.nodelist() if node.is_running()]
+    client = get_management_client(cluster)
+    patterns = _patterns(cluster, keyspace)
+
+    def read_node(node):
+        return _node_metrics(node.name, time.time(), client.read_patterns(node, patterns))
+
+    return MetricsSnapshot(nodeops.run_on_nodes(nodes, read_node, description='metrics snapshot'))
+
+
+class MetricsCache(object):
+    """
+    Hands out the same MetricsSnapshot until it is older than ttl seconds, so that polling
+    loops and helpers asking for metrics in quick succession share one read of the nodes.
+    """
+
+    def __init__(self, cluster, ttl=1.0):
+        self.cluster = cluster
+        self.ttl = ttl
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, nodes=None, keyspace=None):
+        """
+        @return A MetricsSnapshot of nodes (every running node by default) at most ttl seconds old
+        """
+        key = (tuple(sorted(node.name for node in nodes)) if nodes is not None else None, keyspace)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None or time.time() - snapshot.taken_at > self.ttl:
+                snapshot = self._snapshots[key] = take_snapshot(self.cluster, nodes=nodes, keyspace=keyspace)
+            return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshots = {}
+
+
+def is_zero(k, v):
+    assert v == 0, k
+
+
+def is_positive(k, v):
+    assert v > 0, k
+
+
+def is_non_negative(k, v):
+    assert v >= 0, k
+
+
+def is_none(k, v):
+    assert v is None, k
+
+
+def is_microseconds(k, v):
+    assert v == 'microseconds', k
+
+
+def is_zero_list(k, values):
+    assert not any(values), k
+
+
+def is_nonzero_list(k, values):
+    assert any(values), k
+
+
+def is_histo_list(k, values, expected_len):
+    # since these values change on sampling, we can only generally verify it takes the proper form
+    # There are in-tree unit tests around ClearableHistogram and DecayingEstimatedHistogramReservoir
+    assert len(values) == expected_len, k
+    assert all(isinstance(i, int) for i in values), k
+
+
+STAT_ATTRIBUTES = [
+    'Min',
+    'Max',
+    'Mean',
+    'StdDev',
+    '50thPercentile',
+    '75thPercentile',
+    '95thPercentile',
+    '98thPercentile',
+    '99thPercentile',
+    '999thPercentile',
+    'RecentValues']
+
+RATE_ATTRIBUTES = ['Count', 'MeanRate', 'OneMinuteRate', 'FiveMinuteRate', 'FifteenMinuteRate', 'RateUnit']
+
+
+def validate_stat_values(prefix, values, cassandra_version):
+    if values['Count']:
+        validate_sane_histogram_values(prefix, values, cassandra_version)
+    else:
+        validate_zero_histogram_values(prefix, values)
+
+
+def validate_sane_histogram_values(prefix, values, cassandra_version):
+    validators = defaultdict(lambda: is_positive)
+    if 'DurationUnit' in values and cassandra_version >= '4.1':
+        # Timer values (since 4.1) are in micros resolution. The default number of buckets should be 128.
+        # See CASSANDRA-16760, CASSANDRA-17155
+        validators['RecentValues'] = partial(is_histo_list, expected_len=128)
+    else:
+        validators['RecentValues'] = partial(is_histo_list, expected_len=165)
+    validators['StdDev'] = is_non_negative
+    validators['Min'] = is_non_negative
+
+    for k, v in ((k, v) for k, v in values.items() if k in STAT_ATTRIBUTES):
+        validators[k](f"{prefix}.{k}", v)
+    assert values['Min'] <= values['Max'], prefix
+    assert values['Min'] <= values['Mean'], prefix
+    assert values['Mean'] <= values['Max'], prefix
+
+    last_pct = values['50thPercentile']
+    for s in ['75th', '95th', '98th', '99th', '999th']:
+        this_pct = values[f"{s}Percentile"]
+        assert this_pct >= last_pct, prefix + ' ' + s
+        last_pct = this_pct
+
+
+def validate_zero_histogram_values(prefix, values):
+    validators = defaultdict(lambda: is_zero)
+    validators['RecentValues'] = is_zero_list
+    validators['Mean'] = is_none
+    validators['DurationUnit'] = is_microseconds
+    for k, v in values.items():
+        validators[k](f"{prefix}{k}", v)
+
+
+def _validate_counter(prefix, values, cassandra_version):
+    assert isinstance(values['Count'], int), prefix
+    assert values['Count'] >= 0, prefix
+
+
+def _validate_meter(prefix, values, cassandra_version):
+    assert values['RateUnit'] == 'events/second', prefix
+    for k, v in values.items():
+        if k != 'RateUnit':
+            is_non_negative(f"{prefix}.{k}", v)
+
+
+def _validate_histogram(prefix, values, cassandra_version):
+    validate_stat_values(prefix, values, cassandra_version)
+    is_non_negative(prefix, values['Count'])
+
+
+def _validate_timer(prefix, values, cassandra_version):
+    validate_stat_values(prefix, values, cassandra_version)
+    is_microseconds(prefix, values['DurationUnit'])
+
+
+class MetricKind(namedtuple('MetricKind', ['name', 'attributes', 'validate'])):
+    """
+    A kind of codahale metric: the attributes its mbean exposes which validate() and
+    FamilySnapshot.validate() look at, and a function validate(prefix, values, cassandra_version)
+    asserting those values are sane.
+    """
+
+
+COUNTER = MetricKind('counter', ['Count'], _validate_counter)
+METER = MetricKind('meter', RATE_ATTRIBUTES, _validate_meter)
+HISTOGRAM = MetricKind('histogram', STAT_ATTRIBUTES + ['Count'], _validate_histogram)
+TIMER = MetricKind('timer', ['Count'] + STAT_ATTRIBUTES + ['DurationUnit'], _validate_timer)
+
+METRIC_KINDS = {kind.name: kind for kind in (COUNTER, METER, HISTOGRAM, TIMER)}
+
+
+def diff_value(v1, v2):
+    """
+    @return v2 - v1 for numbers, and a description of the change otherwise
+    """
+    if v1 is None or v2 is None or not isinstance(v1, (int, float)) or not isinstance(v2, (int, float)):
+        # before it's set, Mean "null" is returned as None
+        return f"'{v1}' --> '{v2}'"
+    return v2 - v1
+
+
+class MetricDiff(dict):
+    """
+    The attributes which changed between two FamilySnapshots, for one scope on one node,
+    keyed by '<metric name>.<attribute>' (e.g. 'Latency.Count').
+    """
+
+    def __init__(self, node, scope, changes):
+        dict.__init__(self, changes)
+        self.node = node
+        self.scope = scope
+
+
+def _node_name(node):
+    return getattr(node, 'name', node)
+
+
+class FamilySnapshot(object):
+    """
+    Every attribute of every mbean of one metric type (e.g. ClientRequest), on several
+    nodes, read at (about) the same time. Values are keyed by (node name, scope, metric name);
+    the scope of a table or keyspace metric is prefixed with its keyspace ('ks.tbl'), and is
+    None for metrics without one.
+    """
+
+    def __init__(self, metric_type, values, taken_at):
+        self.metric_type = metric_type
+        self.values = values
+        self.taken_at = taken_at
+
+    def attributes(self, node, scope, name):
+        """
+        @return A dict of the attributes of a metric, empty if the node doesn't have it
+        """
+        return self.values.get((_node_name(node), scope, name), {})
+
+    def value(self, node, scope, name, attribute='Count', default=None):
+        return self.attributes(node, scope, name).get(attribute, default)
+
+    def total(self, scope, name, attribute='Count'):
+        """
+        @return The sum of an attribute of a metric over every node
+        """
+        return sum(attributes.get(attribute) or 0 for (_, s, n), attributes in self.values.items()
+                   if s == scope and n == name)
+
+    def scopes(self, node=None):
+        return sorted(set(s for (n, s, _) in self.values if node is None or n == _node_name(node)), key=str)
+
+    def diff(self, baseline, node, scope):
+        """
+        @param baseline An earlier FamilySnapshot of the same metric type
+        @return A MetricDiff of the attributes of scope on node which changed since baseline.
+                RecentValues are left out, they change whenever they are sampled.
+        """
+        node = _node_name(node)
+        changes = {}
+        for (n, s, name), attributes in self.values.items():
+            if n != node or s != scope:
+                continue
+            before = baseline.attributes(node, scope, name)
+            for attribute, value in attributes.items():
+                if attribute == 'RecentValues' or attribute not in before:
+                    continue
+                if before[attribute] != value:
+                    changes[f"{name}.{attribute}"] = diff_value(before[attribute], value)
+        return MetricDiff(node, scope, changes)
+
+    def validate(self, node, scope, metrics, cassandra_version):
+        """
+        Assert that the values of several metrics of a scope are sane for their kind.
+
+        @param metrics A dict mapping metric names to their MetricKind
+        @throws AssertionError If a metric is missing or one of its values isn't sane
+        """
+        for name, kind in metrics.items():
+            attributes = self.attributes(node, scope, name)
+            prefix = make_mbean('metrics', type=self.metric_type, scope=scope, name=name)
+            assert attributes, f"{prefix} not found on {_node_name(node)}"
+            kind.validate(prefix, {a: attributes.get(a) for a in kind.attributes}, cassandra_version)
+
+
+def _family_key(node_name, mbean):
+    _, properties = parse_mbean_name(mbean)
+    scope = '.'.join(p for p in (properties.get('keyspace'), properties.get('scope')) if p) or None
+    return node_name, scope, properties.get('name')
+
+
+def snapshot_family(cluster, metric_type, nodes=None, **properties):
+    """
+    Read every metric of a type on several nodes concurrently, with a single bulk request per node.
+
+    @param cluster The cluster the nodes belong to
+    @param metric_type The type property of the metrics mbeans, e.g. 'ClientRequest' or 'ReadRepair'
+    @param nodes The nodes to read, every running node of the cluster by default
+    @param properties Other mbean properties to narrow the family down, e.g. keyspace='ks'
+    @return A FamilySnapshot
+    """
+    if nodes is None:
+        nodes = [node for node in cluster.nodelist() if node.is_running()]
+    client = get_management_client(cluster)
+    # the trailing wildcard keeps single mbeans in the nested {mbean: {attribute: value}} shape of pattern reads
+    pattern = make_mbean('metrics', type=metric_type, **properties) + ',*'
+    taken_at = time.time()
+
+    def read_node(node):
+        return client.read_patterns(node, [pattern])
+
+    values = {}
+    for name, mbeans in nodeops.run_on_nodes(nodes, read_node, description='{} metrics'.format(metric_type)).items():
+        for mbean, attributes in mbeans.items():
+            values[_family_key(name, mbean)] = attributes
+    return FamilySnapshot(metric_type, values, taken_at)
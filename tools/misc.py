@@ -4,6 +4,7 @@ import time
 import hashlib
 import logging
 import pytest
+from collections import Counter
 
 try:
     from collections.abc import Mapping
@@ -12,6 +13,8 @@ except ImportError:
 
 from ccmlib.node import Node
 
+from dtest_parallel import current_worker_slot
+
 
 logger = logging.getLogger(__name__)
 
@@ -19,16 +22,18 @@ logger = logging.getLogger(__name__)
 # work for cluster started by populate
 def new_node(cluster, bootstrap=True, token=None, remote_debug_port='0', data_center=None, byteman_port='0'):
     i = len(cluster.nodes) + 1
+    worker_slot = current_worker_slot()
+    ip = worker_slot.ipprefix + str(i)
     node = Node('node%s' % i,
                 cluster,
                 bootstrap,
-                ('127.0.0.%s' % i, 9160),
-                ('127.0.0.%s' % i, 7000),
-                str(7000 + i * 100),
-                remote_debug_port,
+                (ip, 9160),
+                (ip, 7000),
+                worker_slot.shift_port(str(7000 + i * 100)),
+                worker_slot.shift_port(remote_debug_port),
                 token,
-                binary_interface=('127.0.0.%s' % i, 9042),
-                                 byteman_port=byteman_port)
+                binary_interface=(ip, 9042),
+                byteman_port=worker_slot.shift_port(byteman_port))
     cluster.add(node, not bootstrap, data_center=data_center)
     return node
 
@@ -109,6 +114,51 @@ def list_to_hashed_dict(list):
     return hashed_dict
 
 
+def canonical_value(value):
+    """
+    Converts a value as returned by the driver, or as written in a test's expected results,
+    into a hashable form which compares equal for both. Like list_to_hashed_dict, maps
+    (e.g. OrderedMapSerializedKey) become the flat sequence of their keys and values, so
+    {10: 11} and [10, 11] are the same; lists, tuples and UDT values become tuples and sets
+    (e.g. SortedSet) become frozensets.
+    """
+    if isinstance(value, (str, bytes, int, float)) or value is None:
+        return value
+    if isinstance(value, Mapping) or hasattr(value, 'items'):
+        flat = []
+        for k, v in value.items():
+            flat.append(canonical_value(k))
+            flat.append(canonical_value(v))
+        return tuple(flat)
+    if isinstance(value, (set, frozenset)) or type(value).__name__ == 'SortedSet':
+        return frozenset(canonical_value(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical_value(v) for v in value)
+    if isinstance(value, bytearray):
+        return bytes(value)
+    return value
+
+
+def canonical_row(row):
+    """
+    @return A hashable form of a row (a sequence of values, or a dict of column name to
+            value), such that rows holding the same values compare equal
+    """
+    if isinstance(row, Mapping):
+        return tuple(sorted(((k, canonical_value(v)) for k, v in row.items()), key=lambda item: item[0]))
+    if isinstance(row, (list, tuple)):
+        return tuple(canonical_value(v) for v in row)
+    return canonical_value(row)
+
+
+def row_counts(rows):
+    """
+    @param rows Any iterable of rows, e.g. a driver ResultSet, consumed (and paged through) only once
+    @return A Counter of the canonical form of each row, i.e. the rows as a multiset
+    """
+    return Counter(canonical_row(row) for row in rows)
+
+
 def get_current_test_name():
     """
     See https://docs.pytest.org/en/latest/example/simple.html#pytest-current-test-environment-variable
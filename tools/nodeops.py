@@ -0,0 +1,152 @@
+"""
+Node lifecycle and maintenance operations run on several nodes at once.
+
+ccm runs cluster.flush(), cluster.nodetool() and friends on one node after the other,
+and tests loop over cluster.nodelist() the same way. Most of that time is spent waiting
+on one JVM at a time (a nodetool invocation, a flush, a node coming up), so running the
+operation on every node concurrently costs about as much as the slowest node instead of
+the sum of all of them.
+
+Example usage:
+
+    from tools import nodeops
+
+    nodeops.flush(self.cluster.nodelist())
+    nodeops.nodetool(self.cluster.nodelist(), 'compact ks tbl')
+    nodeops.restart([node1, node2], wait_other_notice=True, wait_for_binary_proto=True)
+
+    # run any callable on every node, the results are keyed by node name
+    sstables = nodeops.run_on_nodes(self.cluster.nodelist(), lambda node: node.get_sstables('ks', 'tbl'))
+
+    # one node after the other, in the given order, still collecting every error
+    nodeops.stop(self.cluster.nodelist(), ordered=True)
+"""
+import logging
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dtest import MultiError
+
+logger = logging.getLogger(__name__)
+
+# flushes, compactions and nodetool JVMs are mostly I/O and startup bound, so more threads than
+# cores is fine, but a cap keeps a large cluster from forking dozens of JVMs at once
+MAX_WORKERS = 16
+
+
+def run_on_nodes(nodes, func, ordered=False, max_workers=MAX_WORKERS, description=None):
+    """
+    Run func(node) for every node, concurrently unless ordered is True. Every node is
+    attempted even if the operation fails on some of them.
+
+    @param nodes The ccm nodes to run on
+    @param func A callable taking a node
+    @param ordered Run on one node at a time, in the order nodes were given
+    @param max_workers The maximum number of nodes operated on at the same time
+    @param description Optional name of the operation, used in logs and errors
+    @return An OrderedDict mapping node name to the value func returned for it, in the order nodes were given
+    @throws MultiError If func raised for any of the nodes, with one exception per failing node
+    """
+    nodes = list(nodes)
+    description = description or getattr(func, '__name__', 'operation')
+    outcomes = OrderedDict((node.name, None) for node in nodes)
+
+    def call(node):
+        try:
+            return True, func(node)
+        except Exception as e:
+            return False, (node, e, traceback.format_exc())
+
+    if ordered or len(nodes) <= 1:
+        for node in nodes:
+            outcomes[node.name] = call(node)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(nodes)),
+                                thread_name_prefix='nodeops-{}'.format(description)) as executor:
+            futures = [(node, executor.submit(call, node)) for node in nodes]
+            for node, future in futures:
+                outcomes[node.name] = future.result()
+
+    results = OrderedDict()
+    exceptions = []
+    tracebacks = []
+    for name, (succeeded, value) in outcomes.items():
+        if succeeded:
+            results[name] = value
+        else:
+            node, e, tb = value
+            logger.debug("{} failed on {}: {}".format(description, node.name, e))
+            exceptions.append(NodeOperationError(node, description, e))
+            tracebacks.append(tb)
+    if exceptions:
+        raise MultiError(exceptions, tracebacks)
+    return results
+
+
+class NodeOperationError(Exception):
+    """
+    The failure of an operation run by run_on_nodes on one node.
+    """
+
+    def __init__(self, node, description, cause):
+        Exception.__init__(self, "{} failed on {}: {!r}".format(description, node.name, cause))
+        self.node = node
+        self.cause = cause
+
+
+def flush(nodes, *args, ordered=False, **kwargs):
+    """
+    node.flush(*args, **kwargs) on every node
+    """
+    return run_on_nodes(nodes, lambda node: node.flush(*args, **kwargs), ordered=ordered, description='flush')
+
+
+def nodetool(nodes, cmd, ordered=False, **kwargs):
+    """
+    node.nodetool(cmd, **kwargs) on every node
+
+    @return An OrderedDict mapping node name to the (stdout, stderr) of its nodetool invocation
+    """
+    return run_on_nodes(nodes, lambda node: node.nodetool(cmd, **kwargs), ordered=ordered,
+                        description='nodetool {}'.format(cmd.split(' ')[0]))
+
+
+def drain(nodes, ordered=False, **kwargs):
+    """
+    node.drain(**kwargs) on every node
+    """
+    return run_on_nodes(nodes, lambda node: node.drain(**kwargs), ordered=ordered, description='drain')
+
+
+def stop(nodes, ordered=False, **kwargs):
+    """
+    node.stop(**kwargs) on every node, e.g. stop(nodes, gently=False)
+    """
+    return run_on_nodes(nodes, lambda node: node.stop(**kwargs), ordered=ordered, description='stop')
+
+
+def start(nodes, ordered=False, **kwargs):
+    """
+    node.start(**kwargs) on every node, e.g. start(nodes, wait_for_binary_proto=True)
+
+    Nodes which bootstrap or must see each other come up in a specific order should be
+    started with ordered=True.
+    """
+    return run_on_nodes(nodes, lambda node: node.start(**kwargs), ordered=ordered, description='start')
+
+
+def restart(nodes, ordered=False, stop_kwargs=None, **kwargs):
+    """
+    Stop, then start again, every node. Each node is restarted independently of the others,
+    so with ordered=False some nodes may already be back up while others are still stopping.
+
+    @param stop_kwargs Optional keyword arguments to node.stop
+    @param kwargs Keyword arguments to node.start
+    """
+    stop_kwargs = stop_kwargs or {}
+
+    def restart_node(node):
+        node.stop(**stop_kwargs)
+        node.start(**kwargs)
+    return run_on_nodes(nodes, restart_node, ordered=ordered, description='restart')
@@ -1,16 +1,46 @@
+import threading
 import time
+from collections import namedtuple
 
+from tools.assertions import assert_rows_equal_ignoring_order
 from tools.datahelp import flatten_into_set
-from tools.misc import list_to_hashed_dict
+from tools.misc import canonical_row
+
+PageMetrics = namedtuple('PageMetrics', ['rows', 'size_bytes', 'latency'])
+
+
+def _value_size(value):
+    """
+    Approximates the number of bytes a value takes in a result page.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 8
+    if hasattr(value, 'items'):
+        return sum(_value_size(k) + _value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(_value_size(v) for v in value)
+    return len(str(value))
+
 
 class Page(object):
     data = None
+    size_bytes = 0
+    latency = None
 
     def __init__(self):
         self.data = []
 
     def add_row(self, row):
         self.data.append(row)
+        self.size_bytes += _value_size(row)
 
 
 class PageFetcher(object):
@@ -20,6 +50,11 @@ class PageFetcher(object):
 
     The first page is automatically retrieved, so an initial
     call to request_one is actually getting the *second* page!
+
+    With prefetch, the next page is requested as soon as one arrives, so that it is
+    fetched while the test checks the current one. The driver only allows one page
+    of a result in flight at a time, so at most one page is fetched ahead. Don't use
+    it in tests which change the data between pages.
     """
     pages = None
     error = None
@@ -28,8 +63,10 @@ class PageFetcher(object):
     retrieved_pages = None
     retrieved_empty_pages = None
 
-    def __init__(self, future):
+    def __init__(self, future, prefetch=False):
         self.pages = []
+        self.prefetch = prefetch
+        self._condition = threading.Condition()
 
         # the first page is automagically returned (eventually)
         # so we'll count this as a request, but the retrieved count
@@ -37,6 +74,7 @@ class PageFetcher(object):
         self.requested_pages = 1
         self.retrieved_pages = 0
         self.retrieved_empty_pages = 0
+        self._requested_at = time.time()
 
         self.future = future
         self.future.add_callbacks(
@@ -47,37 +85,69 @@ class PageFetcher(object):
         # wait for the first page to arrive, otherwise we may call
         # future.has_more_pages too early, since it should only be
         # called after the first page is returned
-        self.wait(seconds=30)
+        with self._condition:
+            self._wait_for(lambda: self._received_pages() > 0, 30)
 
     def handle_page(self, rows):
-        # occasionally get a final blank page that is useless
-        if rows == []:
-            self.retrieved_empty_pages += 1
-            return
+        with self._condition:
+            latency = time.time() - self._requested_at
+
+            # occasionally get a final blank page that is useless
+            if rows == []:
+                self.retrieved_empty_pages += 1
+            else:
+                page = Page()
+                for row in rows:
+                    page.add_row(row)
+                page.latency = latency
+                self.pages.append(page)
+                self.retrieved_pages += 1
+
+            if self.prefetch and self.future.has_more_pages:
+                self._fetch_next_page()
+            self._condition.notify_all()
 
-        page = Page()
-        self.pages.append(page)
+    def handle_error(self, exc):
+        with self._condition:
+            self.error = exc
+            self._condition.notify_all()
 
-        for row in rows:
-            page.add_row(row)
+    def _received_pages(self):
+        return self.retrieved_pages + self.retrieved_empty_pages
 
-        self.retrieved_pages += 1
+    def _in_flight(self):
+        return self.requested_pages > self._received_pages()
 
-    def handle_error(self, exc):
-        self.error = exc
-        raise exc
+    def _fetch_next_page(self):
+        self.requested_pages += 1
+        self._requested_at = time.time()
+        self.future.start_fetching_next_page()
+
+    def _wait_for(self, predicate, seconds):
+        """
+        Blocks until predicate() is true, the query failed or seconds are exceeded.
+        Must be called holding self._condition.
+        """
+        if not self._condition.wait_for(lambda: self.error is not None or predicate(), timeout=seconds):
+            raise RuntimeError(
+                "Requested pages were not delivered before timeout. "
+                "Requested: {}; retrieved: {}; empty retrieved: {}".format(self.requested_pages, self.retrieved_pages, self.retrieved_empty_pages))
+        if self.error is not None:
+            raise self.error
 
     def request_one(self, timeout=None):
         """
         Requests the next page if there is one.
 
         If the future is exhausted, this is a no-op.
-        @param timeout Time, in seconds, to wait for all pages.
+        @param timeout Time, in seconds, to wait for the page.
         """
-        if self.future.has_more_pages:
-            self.future.start_fetching_next_page()
-            self.requested_pages += 1
-            self.wait(seconds=timeout)
+        seconds = 5 if timeout is None else timeout
+        with self._condition:
+            received = self._received_pages()
+            if not self._in_flight() and self.future.has_more_pages:
+                self._fetch_next_page()
+            self._wait_for(lambda: self._received_pages() > received or not self._in_flight(), seconds)
 
         return self
 
@@ -86,12 +156,17 @@ class PageFetcher(object):
         Requests any remaining pages.
 
         If the future is exhausted, this is a no-op.
-        @param timeout Time, in seconds, to wait for all pages.
-        """
-        while self.future.has_more_pages:
-            self.future.start_fetching_next_page()
-            self.requested_pages += 1
-            self.wait(seconds=timeout)
+        @param timeout Time, in seconds, to wait for each page.
+        """
+        seconds = 5 if timeout is None else timeout
+        with self._condition:
+            while True:
+                if not self._in_flight():
+                    if not self.future.has_more_pages:
+                        break
+                    self._fetch_next_page()
+                received = self._received_pages()
+                self._wait_for(lambda: self._received_pages() > received, seconds)
 
         return self
 
@@ -101,20 +176,12 @@ class PageFetcher(object):
 
         Requests are made by calling request_one and/or request_all.
 
-        Raises RuntimeError if seconds is exceeded.
+        Raises RuntimeError if seconds is exceeded, or the error the query failed with.
         """
         seconds = 5 if seconds is None else seconds
-        expiry = time.time() + seconds
-
-        while time.time() < expiry:
-            if self.requested_pages == (self.retrieved_pages + self.retrieved_empty_pages):
-                return self
-            # small wait so we don't need excess cpu to keep checking
-            time.sleep(0.1)
-
-        raise RuntimeError(
-            "Requested pages were not delivered before timeout. " +
-            "Requested: {}; retrieved: {}; empty retrieved: {}".format(self.requested_pages, self.retrieved_pages, self.retrieved_empty_pages))
+        with self._condition:
+            self._wait_for(lambda: not self._in_flight(), seconds)
+        return self
 
     def pagecount(self):
         """
@@ -153,6 +220,13 @@ class PageFetcher(object):
 
         return all_pages_combined
 
+    def page_metrics(self):
+        """
+        Returns a PageMetrics (rows, approximate size in bytes and seconds between the
+        request and the receipt of the page) for each *retrieved* page which was not empty.
+        """
+        return [PageMetrics(len(page.data), page.size_bytes, page.latency) for page in self.pages]
+
     @property  # make property to match python driver api
     def has_more_pages(self):
         """
@@ -161,24 +235,19 @@ class PageFetcher(object):
         return self.future.has_more_pages
 
 
+def _distinct_rows(rows):
+    return set(canonical_row(list(row)) for row in rows)
+
+
 class PageAssertionMixin(object):
     """Can be added to subclasses of unittest.Tester"""
 
     def assertEqualIgnoreOrder(self, actual, expected):
-        hashed_expected = list_to_hashed_dict(expected)
-        hashed_actual = list_to_hashed_dict(actual)
-        for key, expected in hashed_expected.items():
-            assert key in hashed_actual, "expected %s not in actual" % str(expected)
-            actual = hashed_actual[key]
-            assert actual == expected, "actual %s not same as expected %s" % (str(actual), str(expected))
-
-        for key, actual in hashed_actual.items():
-            assert key in hashed_expected, "actual %s not in expected" % str(actual)
-            expected = hashed_expected[key]
-            assert expected == actual, "expected %s not same as actual %s" % (str(expected), str(actual))
-
-        assert hashed_expected == hashed_actual
-
+        """
+        Compares the distinct rows of actual and expected, ignoring order. Each row is
+        iterated over, so only the column names of dict rows are compared.
+        """
+        assert_rows_equal_ignoring_order(_distinct_rows(actual), _distinct_rows(expected))
 
     def assertIsSubsetOf(self, subset, superset):
         assert flatten_into_set(subset) <= flatten_into_set(superset)
@@ -0,0 +1,174 @@
+"""
+Comparison of the data held by each replica of a table, without stopping any node.
+
+The ring is split into the token ranges between the tokens of the nodes (each replicated
+by a fixed set of nodes), and each of those into smaller sub-ranges. Every replica of a
+sub-range is read in parallel at CL.ONE through a session whitelisting that replica only,
+and its partitions are digested. Sub-ranges whose digests differ are then reported down to
+the partitions which differ.
+
+A whitelisted node is only the coordinator of a read, which it serves from its own data
+only if the snitch sorts it first among the replicas. Snitches aware of the topology (e.g.
+GossipingPropertyFileSnitch) do, SimpleSnitch and a dynamic snitch don't, so clusters
+compared this way should use the former with dynamic_snitch: False. Every read is traced,
+and the comparison fails rather than compare a replica with another one's data if a read
+involved any node but its coordinator.
+
+Example usage:
+
+    from tools.replicas import compare_replicas
+
+    sessions = {node: self.patient_exclusive_cql_connection(node) for node in self.cluster.nodelist()}
+    comparison = compare_replicas(sessions, 'ks', 'cf')
+    assert comparison.consistent, comparison
+"""
+import hashlib
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cassandra import ConsistencyLevel
+from cassandra.query import SimpleStatement
+
+from dtest import get_ip_from_node
+
+logger = logging.getLogger(__name__)
+
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+PartitionMismatch = namedtuple('PartitionMismatch', ['key', 'digests'])
+RangeMismatch = namedtuple('RangeMismatch', ['start', 'end', 'replicas', 'partitions'])
+
+
+class ReplicaComparison(namedtuple('ReplicaComparison', ['ranges_compared', 'mismatches'])):
+    """
+    The outcome of compare_replicas. Each RangeMismatch lists the names of the replicas of
+    its range and the differing partitions, each with the digest every replica has for it
+    (None if the replica doesn't have the partition).
+    """
+
+    @property
+    def consistent(self):
+        return not self.mismatches
+
+    def mismatching_partitions(self):
+        """
+        @return The keys of every partition which differs between its replicas
+        """
+        return [p.key for m in self.mismatches for p in m.partitions]
+
+    def __str__(self):
+        if self.consistent:
+            return 'all replicas agree on {} ranges'.format(self.ranges_compared)
+        return '{} of {} ranges differ: {}'.format(len(self.mismatches), self.ranges_compared, self.mismatches)
+
+
+def _split(start, end, pieces):
+    width = max(1, (end - start) // pieces)
+    bounds = list(range(start, end, width))[:pieces] + [end]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _replicated_ranges(session, keyspace, nodes, splits_per_range):
+    """
+    @return A list of (start, end, nodes replicating (start, end]) covering the whole ring
+    """
+    metadata = session.cluster.metadata
+    token_map = metadata.token_map
+    if token_map is None or 'Murmur3Partitioner' not in metadata.partitioner:
+        # no way to restrict scans by integer tokens, compare whole tables across every node given
+        return [(None, None, list(nodes))]
+
+    nodes_by_address = {get_ip_from_node(node): node for node in nodes}
+    ring = [t.value for t in token_map.ring]
+    ranges = []
+    for i, end in enumerate(ring):
+        replicas = [nodes_by_address[h.address] for h in token_map.get_replicas(keyspace, token_map.ring[i])
+                    if h.address in nodes_by_address]
+        if i == 0:
+            # the range wrapping around the ring, split in two at its end
+            pieces = [(MIN_TOKEN, end)]
+            if ring[-1] < MAX_TOKEN:
+                pieces.append((ring[-1], MAX_TOKEN))
+        else:
+            pieces = [(ring[i - 1], end)]
+        for start, stop in pieces:
+            ranges.extend((a, b, replicas) for a, b in _split(start, stop, splits_per_range))
+    return ranges
+
+
+def _digest_range(session, keyspace, table, partition_key, start, end, fetch_size):
+    """
+    @return A dict mapping each partition key (a tuple) in (start, end] to the digest of its rows
+    """
+    columns = ', '.join(partition_key)
+    query = 'SELECT * FROM {}.{}'.format(keyspace, table)
+    params = None
+    if start is not None:
+        lower = '>=' if start == MIN_TOKEN else '>'
+        query += ' WHERE token({c}) {lower} %s AND token({c}) <= %s'.format(c=columns, lower=lower)
+        params = (start, end)
+    statement = SimpleStatement(query, consistency_level=ConsistencyLevel.ONE, fetch_size=fetch_size)
+
+    digests = {}
+    result = session.execute(statement, params, trace=True)
+    for row in result:
+        key = tuple(getattr(row, c) for c in partition_key)
+        digest = digests.get(key)
+        if digest is None:
+            digest = digests[key] = hashlib.sha256()
+        digest.update(repr(tuple(row)).encode('utf-8'))
+    _check_served_locally(result)
+    return {key: digest.hexdigest() for key, digest in digests.items()}
+
+
+def _check_served_locally(result):
+    """
+    @throws RuntimeError If a page of a traced read involved any node but its coordinator
+    """
+    for trace in result.get_all_query_traces():
+        others = sorted(set(str(event.source) for event in trace.events) - {str(trace.coordinator)})
+        if others:
+            raise RuntimeError("A read through {} involved {} too, the replicas of this cluster can't be "
+                               "compared with its snitch".format(trace.coordinator, others))
+
+
+def compare_replicas(sessions, keyspace, table, splits_per_range=4, parallelism=8, fetch_size=5000,
+                     max_reported=20):
+    """
+    Compare the content of a table on every replica.
+
+    @param sessions A dict mapping each node to compare to a session whitelisting that node
+                    only, e.g. from patient_exclusive_cql_connection
+    @param splits_per_range Number of sub-ranges each range between two node tokens is read in
+    @param parallelism Number of sub-range reads running at the same time
+    @param max_reported Maximum number of differing partitions reported per range
+    @return A ReplicaComparison
+    @throws RuntimeError If a replica didn't serve a read of its own data, see the module documentation
+    """
+    any_session = next(iter(sessions.values()))
+    table_metadata = any_session.cluster.metadata.keyspaces[keyspace].tables[table]
+    partition_key = [c.name for c in table_metadata.partition_key]
+    ranges = [r for r in _replicated_ranges(any_session, keyspace, list(sessions), splits_per_range) if len(r[2]) > 1]
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='compare-replicas') as executor:
+        reads = [[executor.submit(_digest_range, sessions[node], keyspace, table, partition_key, start, end, fetch_size)
+                  for node in replicas]
+                 for start, end, replicas in ranges]
+
+        mismatches = []
+        for (start, end, replicas), futures in zip(ranges, reads):
+            digests = [f.result() for f in futures]
+            if all(d == digests[0] for d in digests[1:]):
+                continue
+            partitions = []
+            for key in sorted(set().union(*digests), key=repr):
+                per_replica = [d.get(key) for d in digests]
+                if any(p != per_replica[0] for p in per_replica[1:]) and len(partitions) < max_reported:
+                    partitions.append(PartitionMismatch(key, {n.name: p for n, p in zip(replicas, per_replica)}))
+            mismatches.append(RangeMismatch(start, end, [n.name for n in replicas], partitions))
+
+    comparison = ReplicaComparison(ranges_compared=len(ranges), mismatches=mismatches)
+    logger.debug("compared replicas of {}.{}: {}".format(keyspace, table, comparison))
+    return comparison
@@ -0,0 +1,224 @@
+"""
+Offline SSTable tools run against several nodes and data directories at once, with their
+output parsed into structured results.
+
+node.run_sstablemetadata() and friends start one tool JVM per call, and tests call them
+node after node, table after table, then regex-scrape the text output for the one field
+they need. Here the sstables of each data directory are handed to a single sstablemetadata
+invocation, the invocations for every data directory of every node run concurrently, and
+the output is parsed once into an SSTableMetadata per sstable.
+
+The tools can't share a warm JVM: each is a main() entry point which initialises static
+state for the keyspaces it reads and exits the JVM when done, so every invocation still
+pays for a JVM start. Those starts overlap instead of adding up, and are made cheaper with
+JVM options suited to a short single threaded run (FAST_START_JVM_OPTS).
+
+Example usage:
+
+    from tools import sstabletools
+
+    metadata = sstabletools.sstable_metadata(self.cluster.nodelist(), 'keyspace1', ['standard1'])
+    assert all(m.repaired_at > 0 for m in metadata['node1'])
+    assert max(sstabletools.levels(metadata['node1'])) > 1
+"""
+import glob
+import logging
+import os
+import re
+import subprocess
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+
+from ccmlib.node import handle_external_tool_process
+
+from tools.matrix import run_matrix
+from tools.nodeops import run_on_nodes
+
+logger = logging.getLogger(__name__)
+
+# each invocation is a JVM reading sstables, more at once than this just thrashes the machine
+MAX_WORKERS = 8
+
+# the tools only run for a few seconds, JIT compiling past C1 and a parallel collector cost more than they save
+FAST_START_JVM_OPTS = '-XX:TieredStopAtLevel=1 -XX:+UseSerialGC'
+
+_SSTABLE = re.compile(r'SSTable: (.+)')
+_LEADING_INT = re.compile(r'-?\d+')
+
+
+class SSTableMetadata(namedtuple('SSTableMetadata', ['path', 'level', 'repaired_at', 'pending_repair',
+                                                     'min_timestamp', 'max_timestamp', 'size', 'properties'])):
+    """
+    The sstablemetadata output for one sstable. path is the sstable descriptor (the path of
+    its components without the -<Component>.db suffix), size the total size in bytes of its
+    components on disk, pending_repair a UUID or None, and properties every "name: value"
+    line of the output as strings, for the fields without an attribute of their own. The
+    fields a Cassandra version doesn't print are None.
+    """
+
+
+def _leading_int(value):
+    if value is None:
+        return None
+    m = _LEADING_INT.match(value)
+    return int(m.group(0)) if m else None
+
+
+def _pending_repair(value):
+    if value is None or value in ('--', 'null'):
+        return None
+    return uuid.UUID(value.split(' ')[0])
+
+
+def _size_on_disk(path):
+    return sum(os.path.getsize(f) for f in glob.glob(path + '-*') if os.path.isfile(f))
+
+
+def parse_sstablemetadata(output):
+    """
+    @param output The stdout of sstablemetadata, for one or more sstables
+    @return A list of SSTableMetadata, in the order of the output
+    """
+    if isinstance(output, bytes):
+        output = output.decode('utf-8')
+
+    parsed = []
+    path = None
+    properties = None
+    for line in output.splitlines():
+        m = _SSTABLE.match(line)
+        if m:
+            if path is not None:
+                parsed.append((path, properties))
+            path = m.group(1).strip()
+            if path.endswith('-Data.db'):
+                path = path[:-len('-Data.db')]
+            properties = OrderedDict()
+        elif path is not None and ':' in line:
+            name, value = line.split(':', 1)
+            # later sections may repeat a name, e.g. in histograms, the header is the one wanted
+            properties.setdefault(name.strip(), value.strip())
+    if path is not None:
+        parsed.append((path, properties))
+
+    return [SSTableMetadata(path=path,
+                            level=_leading_int(properties.get('SSTable Level')),
+                            repaired_at=_leading_int(properties.get('Repaired at')),
+                            pending_repair=_pending_repair(properties.get('Pending repair')),
+                            min_timestamp=_leading_int(properties.get('Minimum timestamp')),
+                            max_timestamp=_leading_int(properties.get('Maximum timestamp')),
+                            size=_size_on_disk(path),
+                            properties=properties)
+            for path, properties in parsed]
+
+
+def run_tool(node, tool, args, fast_start=True):
+    """
+    Run an offline tool from the install directory of a node.
+
+    @param tool The name of the tool, e.g. 'sstablemetadata'
+    @param args The arguments of the tool
+    @param fast_start Whether to add FAST_START_JVM_OPTS to the JVM options of the tool
+    @return The ToolResult of the tool
+    @throws ToolError If the tool exited with an error
+    """
+    env = node.get_env()
+    if fast_start:
+        env['JVM_OPTS'] = ' '.join(filter(None, [env.get('JVM_OPTS'), FAST_START_JVM_OPTS]))
+    cmd = [node.get_tool(tool)] + list(args)
+    p = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    return handle_external_tool_process(p, cmd)
+
+
+def sstable_files(node, keyspace, column_families=None):
+    """
+    @param column_families The tables whose sstables to list, every table of the keyspace by default
+    @return An OrderedDict mapping each data directory of the node to the Data.db files of
+            the sstables it holds, for the data directories holding any
+    """
+    files = OrderedDict()
+    for data_dir in node.data_directories():
+        patterns = [os.path.join(data_dir, keyspace, '*', '*-Data.db')] if not column_families else \
+            [os.path.join(data_dir, keyspace, '{}-*'.format(cf), '*-Data.db') for cf in column_families]
+        found = sorted(f for pattern in patterns for f in glob.glob(pattern))
+        if found:
+            files[data_dir] = found
+    return files
+
+
+def sstable_metadata(nodes, keyspace, column_families=None, max_workers=MAX_WORKERS):
+    """
+    Run sstablemetadata once per data directory of every node, all at the same time.
+
+    @param nodes The ccm nodes to inspect, usually stopped so that their sstables don't change underneath
+    @param column_families The tables to inspect, every table of the keyspace by default
+    @param max_workers The maximum number of sstablemetadata invocations running at the same time
+    @return An OrderedDict mapping node name to the list of SSTableMetadata of its sstables, sorted by path
+    @throws MultiError If sstablemetadata failed for any data directory
+    """
+    nodes = list(nodes)
+    cases = [(node, data_dir, files) for node in nodes
+             for data_dir, files in sstable_files(node, keyspace, column_families).items()]
+    parsed = OrderedDict((node.name, []) for node in nodes)
+    lock = threading.Lock()
+
+    def inspect(case):
+        node, _, files = case
+        metadata = parse_sstablemetadata(run_tool(node, 'sstablemetadata', files).stdout)
+        with lock:
+            parsed[node.name].extend(metadata)
+
+    if cases:
+        run_matrix(cases, inspect, max_workers=max_workers, name='sstablemetadata',
+                   describe=lambda case: 'sstablemetadata of {} in {}'.format(case[0].name, case[1]))
+    for metadata in parsed.values():
+        metadata.sort(key=lambda m: m.path)
+    return parsed
+
+
+def levels(metadata):
+    """
+    @param metadata A list of SSTableMetadata
+    @return The level of each sstable
+    """
+    return [m.level for m in metadata]
+
+
+def sstable_dump(node, keyspace, column_families=None, enumerate_keys=False, max_workers=MAX_WORKERS):
+    """
+    Run sstabledump on every sstable of a node at the same time (sstabledump reads one sstable per invocation).
+
+    @return An OrderedDict mapping each sstable Data.db file to the ToolResult of its sstabledump
+    @throws MultiError If sstabledump failed for any sstable
+    """
+    files = [f for found in sstable_files(node, keyspace, column_families).values() for f in found]
+    results = OrderedDict((f, None) for f in files)
+
+    def dump(datafile):
+        results[datafile] = run_tool(node, 'sstabledump', [datafile] + (['-e'] if enumerate_keys else []))
+
+    if files:
+        run_matrix(files, dump, max_workers=max_workers, name='sstabledump',
+                   describe=lambda datafile: 'sstabledump of {}'.format(datafile))
+    return results
+
+
+def sstable_verify(nodes, keyspace, column_family, options=None):
+    """
+    node.run_sstableverify(keyspace, column_family, options) on every node at the same time
+
+    @return An OrderedDict mapping node name to the ToolResult of its sstableverify
+    """
+    return run_on_nodes(nodes, lambda node: node.run_sstableverify(keyspace, column_family, options=options),
+                        max_workers=MAX_WORKERS, description='sstableverify')
+
+
+def sstablelevelreset(nodes, keyspace, column_family):
+    """
+    node.run_sstablelevelreset(keyspace, column_family) on every node at the same time
+
+    @return An OrderedDict mapping node name to the ToolResult of its sstablelevelreset
+    """
+    return run_on_nodes(nodes, lambda node: node.run_sstablelevelreset(keyspace, column_family),
+                        max_workers=MAX_WORKERS, description='sstablelevelreset')
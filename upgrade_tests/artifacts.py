@@ -0,0 +1,301 @@
+"""
+Pre-staging of the Cassandra versions an upgrade matrix needs.
+
+Left to themselves, upgrade tests call set_install_dir(version=...) and ccm fetches and
+builds each version lazily, one after the other, in the middle of a test. stage_versions()
+instead resolves every version of the matrix up front, fetches and builds the missing ones
+in parallel, and validates them, so that the tests only ever switch between install
+directories which are already built.
+
+Staged versions live in a content-addressed cache: a git branch is resolved to the commit
+at its tip and built into a directory named after that commit, a release (immutable) is
+downloaded by ccm and linked into the cache under its version. A branch whose tip didn't
+move since an earlier run is therefore not fetched or built again, and one which moved is
+built next to the previous build instead of over it while other test workers may use it.
+
+Example usage:
+
+    from upgrade_tests.artifacts import set_install_dir, stage_versions
+
+    stage_versions(['3.11.14', 'github:apache/cassandra-4.0'])
+    set_install_dir(self.cluster, 'github:apache/cassandra-4.0')
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import ccmlib.repository
+from ccmlib.common import get_default_path, get_version_from_build, validate_install_dir
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# each staging is a git checkout and an ant build, more at once than this starves the builds of cores
+STAGING_WORKERS = 4
+
+CACHE_DIR = 'dtest-artifacts'
+STAGED_FILE = 'dtest-staged.json'
+
+APACHE_GIT_REPO = 'https://gitbox.apache.org/repos/asf/cassandra.git'
+GITHUB_REPO = 'https://github.com/{}/cassandra.git'
+
+# versions which are built locally by whoever runs the tests, not fetched
+_LOCAL_PREFIXES = ('clone:', 'local:', 'binary:', 'alias:')
+
+
+class StagedVersion(namedtuple('StagedVersion', ['version', 'address', 'install_dir', 'commit', 'version_from_build'])):
+    """
+    A version of the upgrade matrix ready to be installed: its content address in the
+    cache, the directory to install it from and, for git versions, the commit it was built
+    from.
+    """
+
+
+class StagingError(Exception):
+    """
+    A version of the upgrade matrix which couldn't be fetched, built or validated.
+    """
+
+
+_staged = {}
+_staged_lock = threading.Lock()
+
+
+def cache_root():
+    return os.path.join(get_default_path(), CACHE_DIR)
+
+
+def is_staged_version(version):
+    return bool(version) and not version.startswith(_LOCAL_PREFIXES)
+
+
+def _git_source(version):
+    """
+    @return The repository url, the name of its local mirror and the ref of a git version,
+            None for a release
+    """
+    if version.startswith('github:'):
+        user, ref = version[len('github:'):].split('/', 1)
+        return GITHUB_REPO.format(user), 'github-' + user, ref
+    if version.startswith('git:'):
+        return APACHE_GIT_REPO, 'apache', version[len('git:'):]
+    return None
+
+
+def _git(args, cwd=None):
+    return subprocess.check_output(['git'] + list(args), cwd=cwd, stderr=subprocess.STDOUT,
+                                   universal_newlines=True).strip()
+
+
+class _FileLock(object):
+    """
+    An exclusive lock shared with the other test workers and sessions staging into the same cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'w')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+
+def resolve_commit(version):
+    """
+    @return The commit at the tip of the ref of a git version, read from its remote
+    @throws StagingError If the ref doesn't exist
+    """
+    url, _, ref = _git_source(version)
+    refs = _git(['ls-remote', url, ref, ref + '^{}'])
+    commits = OrderedDict()
+    for line in refs.splitlines():
+        commit, name = line.split('\t', 1)
+        commits[name] = commit
+    # annotated tags list the tag object first and the commit it points to with ^{} after it
+    peeled = [c for name, c in commits.items() if name.endswith('^{}')]
+    if peeled:
+        return peeled[0]
+    if commits:
+        return next(iter(commits.values()))
+    if len(ref) == 40 and all(c in '0123456789abcdef' for c in ref):
+        return ref
+    raise StagingError("{} does not name a ref of {}".format(version, url))
+
+
+def content_address(version, commit=None):
+    """
+    @return The name of the cache directory of a version
+    """
+    source = _git_source(version)
+    if source is None:
+        return 'release-' + version
+    return '{}-{}'.format(source[1], commit)
+
+
+def _read_staged(install_dir):
+    try:
+        with open(os.path.join(install_dir, STAGED_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _validate(version, install_dir, commit):
+    """
+    @return The version from build of a staged install directory
+    @throws StagingError If the directory isn't a complete build of the version
+    """
+    try:
+        validate_install_dir(install_dir)
+        version_from_build = get_version_from_build(install_dir)
+    except Exception as e:
+        raise StagingError("{} staged in {} is not a valid install directory: {}".format(version, install_dir, e))
+    if commit is not None:
+        head = _git(['rev-parse', 'HEAD'], cwd=install_dir)
+        if head != commit:
+            raise StagingError("{} staged in {} is at commit {} instead of {}"
+                               .format(version, install_dir, head, commit))
+    if not os.path.exists(os.path.join(install_dir, 'bin', 'cassandra')):
+        raise StagingError("{} staged in {} has no bin/cassandra".format(version, install_dir))
+    build_dir = os.path.join(install_dir, 'build')
+    if commit is not None and not (os.path.isdir(build_dir) and any(f.endswith('.jar') for f in os.listdir(build_dir))):
+        raise StagingError("{} staged in {} has no built jar".format(version, install_dir))
+    return version_from_build
+
+
+def _build_git_version(version, commit, target_dir, root):
+    url, mirror_name, _ = _git_source(version)
+    mirror = os.path.join(root, '_mirror_' + mirror_name)
+    with _FileLock(mirror + '.lock'):
+        if not os.path.exists(mirror):
+            _git(['clone', '--mirror', url, mirror])
+        elif subprocess.call(['git', 'cat-file', '-e', commit + '^{commit}'], cwd=mirror,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) != 0:
+            _git(['fetch', '--prune', 'origin'], cwd=mirror)
+
+    _git(['clone', '--no-checkout', mirror, target_dir])
+    _git(['checkout', '--detach', commit], cwd=target_dir)
+    # the same build ccm runs for set_install_dir(version=...), with the JDK it picks for the version
+    ccmlib.repository.compile_version(version, target_dir)
+
+
+def _stage(version, root):
+    """
+    Fetch, build and validate one version into the cache, unless an earlier run already did.
+
+    @return A StagedVersion
+    @throws StagingError If the version couldn't be staged
+    """
+    commit = resolve_commit(version) if _git_source(version) else None
+    address = content_address(version, commit)
+    install_dir = os.path.join(root, address)
+
+    with _FileLock(install_dir + '.lock'):
+        if _read_staged(install_dir) is None:
+            start = time.monotonic()
+            if commit is None:
+                # releases are immutable, link to ccm's own download of them
+                ccm_dir, _ = ccmlib.repository.setup(version)
+                if os.path.lexists(install_dir):
+                    os.remove(install_dir)
+                os.symlink(ccm_dir, install_dir)
+            else:
+                tmp = '{}.tmp-{}'.format(install_dir, os.getpid())
+                shutil.rmtree(tmp, ignore_errors=True)
+                try:
+                    _build_git_version(version, commit, tmp, root)
+                    _validate(version, tmp, commit)
+                except Exception:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    raise
+                shutil.rmtree(install_dir, ignore_errors=True)
+                os.rename(tmp, install_dir)
+            version_from_build = _validate(version, install_dir, commit)
+            with open(os.path.join(install_dir, STAGED_FILE), 'w') as f:
+                json.dump({'version': version, 'commit': commit, 'version_from_build': version_from_build.vstring,
+                           'staged_at': time.time()}, f)
+            logger.info("Staged {} ({}) in {:.0f}s".format(version, address, time.monotonic() - start))
+        else:
+            version_from_build = _validate(version, install_dir, commit)
+
+    return StagedVersion(version=version, address=address, install_dir=install_dir, commit=commit,
+                         version_from_build=version_from_build)
+
+
+def stage_versions(versions, max_workers=STAGING_WORKERS):
+    """
+    Make every version ready to be installed, fetching and building those which aren't yet,
+    at the same time. Versions built from a local directory (clone:, local:...) are left to ccm.
+
+    @param versions The ccm version slugs the tests will install, e.g. '4.0.8' or 'github:apache/cassandra-4.1'
+    @param max_workers The maximum number of versions staged at the same time
+    @return An OrderedDict mapping each staged version to its StagedVersion
+    @throws StagingError If any version couldn't be staged, once every other version is staged
+    """
+    versions = [v for v in OrderedDict.fromkeys(versions) if is_staged_version(v)]
+
+    with _staged_lock:
+        missing = [v for v in versions if v not in _staged]
+        if missing:
+            root = cache_root()
+            os.makedirs(root, exist_ok=True)
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing))),
+                                    thread_name_prefix='upgrade-staging') as executor:
+                futures = OrderedDict((v, executor.submit(_stage, v, root)) for v in missing)
+            failures = []
+            for version, future in futures.items():
+                try:
+                    _staged[version] = future.result()
+                except Exception as e:
+                    failures.append("{}: {!r}".format(version, e))
+            logger.info("Staged {} upgrade versions in {:.0f}s"
+                        .format(len(missing) - len(failures), time.monotonic() - start))
+            if failures:
+                raise StagingError("Failed to stage upgrade versions:\n" + "\n".join(failures))
+        return OrderedDict((v, _staged[v]) for v in versions)
+
+
+def staged_install_dir(version):
+    """
+    @return The install directory a version was staged into by this process, None if it wasn't staged
+    """
+    staged = _staged.get(version)
+    return staged.install_dir if staged is not None else None
+
+
+def staged_version_from_build(version):
+    """
+    @return The version from build of a version staged by this process, None if it wasn't staged
+    """
+    staged = _staged.get(version)
+    return staged.version_from_build if staged is not None else None
+
+
+def set_install_dir(target, version):
+    """
+    target.set_install_dir(...) to a version, from the cache if it was staged and through ccm otherwise.
+
+    @param target A ccm cluster or node
+    """
+    install_dir = staged_install_dir(version)
+    if install_dir is None:
+        target.set_install_dir(version=version)
+    else:
+        target.set_install_dir(install_dir=install_dir)
@@ -123,7 +123,7 @@ class TestPagingSize(BasePagingTester, PageAssertionMixin):
             assert pf.num_results_all() == [5, 4]
 
             # make sure expected and actual have same data elements (ignoring order)
-            assert_lists_equal_ignoring_order(pf.all_data(), expected_data, sort_key='value')
+            assert_lists_equal_ignoring_order(pf.all_data(), expected_data)
 
     def test_with_equal_results_to_page_size(self):
         cursor = self.prepare()
@@ -153,7 +153,7 @@ class TestPagingSize(BasePagingTester, PageAssertionMixin):
             assert pf.pagecount() == 1
 
             # make sure expected and actual have same data elements (ignoring order)
-            assert_lists_equal_ignoring_order(pf.all_data(), expected_data, sort_key='value')
+            assert_lists_equal_ignoring_order(pf.all_data(), expected_data)
 
     def test_undefined_page_size_default(self):
         """
@@ -185,7 +185,7 @@ class TestPagingSize(BasePagingTester, PageAssertionMixin):
 
             self.maxDiff = None
             # make sure expected and actual have same data elements (ignoring order)
-            assert_lists_equal_ignoring_order(pf.all_data(), expected_data, sort_key='value')
+            assert_lists_equal_ignoring_order(pf.all_data(), expected_data)
 
 
 class TestPagingWithModifiers(BasePagingTester, PageAssertionMixin):
@@ -437,8 +437,7 @@ class TestPagingWithModifiers(BasePagingTester, PageAssertionMixin):
                     |8 |and more testing|
                     |9 |and more testing|
                     """, format_funcs={'id': int, 'value': str}
-                ),
-                sort_key='value'
+                )
             )
 
 
@@ -576,7 +575,7 @@ class TestPagingData(BasePagingTester, PageAssertionMixin):
             all_results = pf.all_data()
             assert len(expected_data) == len(all_results)
             self.maxDiff = None
-            assert_lists_equal_ignoring_order(expected_data, all_results, sort_key='value')
+            assert_lists_equal_ignoring_order(expected_data, all_results)
 
     def test_paging_across_multi_wide_rows(self):
         cursor = self.prepare()
@@ -645,7 +644,7 @@ class TestPagingData(BasePagingTester, PageAssertionMixin):
 
             assert pf.pagecount() == 2
             assert pf.num_results_all() == [400, 200]
-            assert_lists_equal_ignoring_order(expected_data, pf.all_data(), sort_key='sometext')
+            assert_lists_equal_ignoring_order(expected_data, pf.all_data())
 
     @since('2.0.6')
     def test_static_columns_paging(self):
@@ -912,7 +911,7 @@ class TestPagingData(BasePagingTester, PageAssertionMixin):
 
             assert pf.pagecount() == 2
             assert pf.num_results_all() == [400, 200]
-            assert_lists_equal_ignoring_order(expected_data, pf.all_data(), sort_key='sometext')
+            assert_lists_equal_ignoring_order(expected_data, pf.all_data())
 
 
 class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
@@ -954,7 +953,7 @@ class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
             assert pf.pagecount() == 2
             assert pf.num_results_all(), [501 == 499]
 
-            assert_lists_equal_ignoring_order(pf.all_data(), expected_data, sort_key='mytext')
+            assert_lists_equal_ignoring_order(pf.all_data(), expected_data)
 
     def test_data_change_impacting_later_page(self):
         cursor = self.prepare()
@@ -991,7 +990,7 @@ class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
 
             # add the new row to the expected data and then do a compare
             expected_data.append({'id': 2, 'mytext': 'foo'})
-            assert_lists_equal_ignoring_order(pf.all_data(), expected_data, sort_key='mytext')
+            assert_lists_equal_ignoring_order(pf.all_data(), expected_data)
 
     def test_row_TTL_expiry_during_paging(self):
         cursor = self.prepare()
@@ -1074,7 +1073,7 @@ class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
 
             # no need to request page here, because the first page is automatically retrieved
             page1 = pf.page_data(1)
-            assert_lists_equal_ignoring_order(page1, data[:500], sort_key="mytext")
+            assert_lists_equal_ignoring_order(page1, data[:500])
 
             # set some TTLs for data on page 3
             for row in data[1000:1500]:
@@ -1090,7 +1089,7 @@ class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
             # check page two
             pf.request_one()
             page2 = pf.page_data(2)
-            assert_lists_equal_ignoring_order(page2, data[500:1000], sort_key="mytext")
+            assert_lists_equal_ignoring_order(page2, data[500:1000])
 
             page3expected = []
             for row in data[1000:1500]:
@@ -1103,7 +1102,7 @@ class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
 
             pf.request_one()
             page3 = pf.page_data(3)
-            assert_lists_equal_ignoring_order(page3, page3expected, sort_key="mytext")
+            assert_lists_equal_ignoring_order(page3, page3expected)
 
 
 class TestPagingQueryIsolation(BasePagingTester, PageAssertionMixin):
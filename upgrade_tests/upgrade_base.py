@@ -10,6 +10,7 @@ from abc import ABCMeta
 
 from ccmlib.common import get_version_from_build, is_win
 
+from .artifacts import set_install_dir
 from .upgrade_manifest import CASSANDRA_4_0
 
 from dtest import Tester, create_ks
@@ -85,7 +86,7 @@ class UpgradeTester(Tester, metaclass=ABCMeta):
 
         cluster = self.cluster
 
-        cluster.set_install_dir(version=self.UPGRADE_PATH.starting_version)
+        set_install_dir(cluster, self.UPGRADE_PATH.starting_version)
         self.install_nodetool_legacy_parsing()
         self.fixture_dtest_setup.reinitialize_cluster_for_different_version()
 
@@ -151,7 +152,7 @@ class UpgradeTester(Tester, metaclass=ABCMeta):
 
         logger.debug('upgrading node1 to {}'.format(self.UPGRADE_PATH.upgrade_version))
 
-        node1.set_install_dir(version=self.UPGRADE_PATH.upgrade_version)
+        set_install_dir(node1, self.UPGRADE_PATH.upgrade_version)
         self.install_legacy_parsing(node1)
 
         # this is a bandaid; after refactoring, upgrades should account for protocol version
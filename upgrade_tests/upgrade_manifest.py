@@ -4,8 +4,8 @@ import os
 
 from collections import namedtuple
 
-import ccmlib.repository
-from ccmlib.common import get_version_from_build
+from dtest_config import get_dtest_config
+from .artifacts import stage_versions
 
 from enum import Enum
 
@@ -77,16 +77,9 @@ def set_version_family():
     # get the version from build.xml in the C* repository specified by
     # CASSANDRA_VERSION or CASSANDRA_DIR. This should use the same resolution
     # strategy as the actual checkout code in Tester.setUp; if it does not, that is
-    # a bug.
-    cassandra_version_slug = CONFIG.getoption("--cassandra-version")
-    cassandra_dir = CONFIG.getoption("--cassandra-dir") or CONFIG.getini("cassandra_dir")
-    # Prefer CASSANDRA_VERSION if it's set in the environment. If not, use CASSANDRA_DIR
-    if cassandra_version_slug:
-        # fetch but don't build the specified C* version
-        ccm_repo_cache_dir, _ = ccmlib.repository.setup(cassandra_version_slug)
-        current_version = get_version_from_build(ccm_repo_cache_dir)
-    else:
-        current_version = get_version_from_build(cassandra_dir)
+    # a bug. The version is the one the session's DTestConfig already resolved, preferring
+    # CASSANDRA_VERSION if it's set and using CASSANDRA_DIR otherwise.
+    current_version = get_dtest_config(CONFIG).cassandra_version_from_build
 
     # TODO add a new item whenever Cassandra is branched
     if current_version.vstring.startswith('2.0'):
@@ -258,4 +251,20 @@ def build_upgrade_pairs():
                 )
             )
 
+    stage_upgrade_versions([meta for path in valid_upgrade_pairs for meta in (path.starting_meta, path.upgrade_meta)])
     return valid_upgrade_pairs
+
+
+def stage_upgrade_versions(version_metas):
+    """
+    Fetch and build the versions of the given VersionMeta's in parallel, before any upgrade test starts,
+    when upgrade tests are to be executed. Versions already staged by this process are not staged again.
+    """
+    if CONFIG is None:
+        return
+    dtest_config = get_dtest_config(CONFIG)
+    if dtest_config.metatests or not (dtest_config.execute_upgrade_tests or dtest_config.execute_upgrade_tests_only):
+        return
+    workers = int(CONFIG.getoption("--upgrade-staging-workers"))
+    if workers > 0:
+        stage_versions([meta.version for meta in version_metas], max_workers=workers)
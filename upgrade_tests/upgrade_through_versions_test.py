@@ -1,10 +1,9 @@
 from distutils.version import LooseVersion
 
-import operator
+import functools
 import os
 import pprint
 import random
-import signal
 import time
 import uuid
 import logging
@@ -12,15 +11,17 @@ import pytest
 import psutil
 
 from collections import defaultdict, namedtuple
-from multiprocessing import Process, Queue
-from queue import Empty, Full
 
-from cassandra import ConsistencyLevel, WriteTimeout, DriverException
+from cassandra import ConsistencyLevel, WriteTimeout
 from cassandra.query import SimpleStatement
 
 from dtest import Tester
+from tools.bulkload import BulkLoader
+from tools.dataset import Dataset, verify_dataset
+from tools.loadharness import COUNTERS_WORKLOAD, VALUES_WORKLOAD, ContinuousLoad
 from tools.misc import generate_ssl_stores, new_node
-from .upgrade_manifest import (build_upgrade_pairs,
+from .artifacts import set_install_dir
+from .upgrade_manifest import (build_upgrade_pairs, stage_upgrade_versions,
                                current_2_2_x,
                                current_3_0_x, indev_3_11_x, current_3_11_x,
                                current_4_0_x, indev_4_1_x, current_4_1_x,
@@ -31,270 +32,6 @@ from .upgrade_manifest import (build_upgrade_pairs,
 logger = logging.getLogger(__name__)
 
 
-def data_writer(tester, to_verify_queue, verification_done_queue, rewrite_probability=0):
-    """
-    Process for writing/rewriting data continuously.
-
-    Pushes to a queue to be consumed by data_checker.
-
-    Pulls from a queue of already-verified rows written by data_checker that it can overwrite.
-
-    Intended to be run using multiprocessing.
-    """
-    # 'tester' is a cloned object so we shouldn't be inappropriately sharing anything with another process
-    session = tester.patient_cql_connection(tester.node1, keyspace="upgrade", protocol_version=tester.protocol_version)
-
-    running = True
-
-    prepared = session.prepare("UPDATE cf SET v=? WHERE k=?")
-    prepared.consistency_level = ConsistencyLevel.QUORUM
-
-    def handle_sigterm(signum, frame):
-        nonlocal running
-        running = False
-
-    def shutdown_gently():
-        logger.info("Data writer process terminating, closing queues")
-        to_verify_queue.close()
-        verification_done_queue.close()
-        session.shutdown()
-
-    signal.signal(signal.SIGTERM, handle_sigterm)
-
-    while running:
-        try:
-            key = None
-
-            if (rewrite_probability > 0) and (random.randint(0, 100) <= rewrite_probability):
-                try:
-                    key = verification_done_queue.get_nowait()
-                except Empty:
-                    # we wanted a re-write but the re-writable queue was empty. oh well.
-                    pass
-
-            key = key or uuid.uuid4()
-
-            val = uuid.uuid4()
-
-            session.execute(prepared, (val, key))
-
-            to_verify_queue.put((key, val,))
-        except DriverException as dex:
-            if "ID mismatch while trying to reprepare" in str(dex):
-                time.sleep(1)  # Pstmnt id mismatch, retry. See CASSANDRA-15252/17140
-                continue
-            else:
-                logger.error("Error in data writer process!", dex)
-                shutdown_gently()
-                raise
-        except Exception as ex:
-            logger.error("Error in data writer process!", ex)
-            shutdown_gently()
-            raise
-
-    shutdown_gently()
-
-
-def data_checker(tester, to_verify_queue, verification_done_queue):
-    """
-    Process for checking data continuously.
-
-    Pulls from a queue written to by data_writer to know what to verify.
-
-    Pushes to a queue to tell data_writer what's been verified and could be a candidate for re-writing.
-
-    Intended to be run using multiprocessing.
-    """
-    # 'tester' is a cloned object so we shouldn't be inappropriately sharing anything with another process
-    session = tester.patient_cql_connection(tester.node1, keyspace="upgrade", protocol_version=tester.protocol_version)
-
-    running = True
-
-    prepared = session.prepare("SELECT v FROM cf WHERE k=?")
-    prepared.consistency_level = ConsistencyLevel.QUORUM
-
-    def handle_sigterm(signum, frame):
-        nonlocal running
-        running = False
-
-    def shutdown_gently():
-        logger.info("Data checker process terminating, closing queues")
-        to_verify_queue.close()
-        verification_done_queue.close()
-        session.shutdown()
-
-    signal.signal(signal.SIGTERM, handle_sigterm)
-
-    while running:
-        try:
-            # here we could block, but if the writer process terminates early with an empty queue
-            # we would end up blocking indefinitely
-            (key, expected_val) = to_verify_queue.get_nowait()
-
-            actual_val = session.execute(prepared, (key,))[0][0]
-        except Empty:
-            time.sleep(1)  # let's not eat CPU if the queue is empty
-            logger.info("to_verify_queue is empty: %d" % to_verify_queue.qsize())
-            continue
-        except DriverException as dex:
-            if "ID mismatch while trying to reprepare" in str(dex):
-                time.sleep(1)  # Pstmnt id mismatch, retry. See CASSANDRA-15252/17140
-                continue
-            else:
-                logger.error("Error in data checker process!", dex)
-                shutdown_gently()
-                raise
-        except Exception as ex:
-            logger.error("Error in data checker process!", ex)
-            shutdown_gently()
-            raise
-        else:
-            try:
-                verification_done_queue.put_nowait(key)
-            except Full:
-                # the rewritable queue is full, not a big deal. drop this one.
-                # we keep the rewritable queue held to a modest max size
-                # and allow dropping some rewritables because we don't want to
-                # rewrite rows in the same sequence as originally written
-                pass
-            except Exception as ex:
-                logger.error("Failed to put into verification_done_queue", ex)
-
-        assert expected_val == actual_val, "Data did not match expected value!"
-
-    shutdown_gently()
-
-
-def counter_incrementer(tester, to_verify_queue, verification_done_queue, rewrite_probability=0):
-    """
-    Process for incrementing counters continuously.
-
-    Pushes to a queue to be consumed by counter_checker.
-
-    Pulls from a queue of already-verified rows written by data_checker that it can increment again.
-
-    Intended to be run using multiprocessing.
-    """
-    # 'tester' is a cloned object so we shouldn't be inappropriately sharing anything with another process
-    session = tester.patient_cql_connection(tester.node1, keyspace="upgrade", protocol_version=tester.protocol_version)
-
-    running = True
-
-    prepared = session.prepare("UPDATE countertable SET c = c + 1 WHERE k1=?")
-    prepared.consistency_level = ConsistencyLevel.QUORUM
-
-    def handle_sigterm(signum, frame):
-        nonlocal running
-        running = False
-
-    def shutdown_gently():
-        logger.info("Counter incrementer process terminating, closing queues")
-        to_verify_queue.close()
-        verification_done_queue.close()
-        session.shutdown()
-
-    signal.signal(signal.SIGTERM, handle_sigterm)
-
-    while running:
-        try:
-            key = None
-            count = 0  # this will get set to actual last known count if we do a re-write
-
-            if (rewrite_probability > 0) and (random.randint(0, 100) <= rewrite_probability):
-                try:
-                    key, count = verification_done_queue.get_nowait()
-                except Empty:
-                    # we wanted a re-write but the re-writable queue was empty. oh well.
-                    pass
-
-            key = key or uuid.uuid4()
-
-            session.execute(prepared, (key))
-
-            to_verify_queue.put_nowait((key, count + 1,))
-        except DriverException as dex:
-            if "ID mismatch while trying to reprepare" in str(dex):
-                time.sleep(1)  # Pstmnt id mismatch, retry. See CASSANDRA-15252/17140
-                continue
-            else:
-                logger.error("Error in counter incrementer process!", dex)
-                shutdown_gently()
-                raise
-        except Exception as ex:
-            logger.error("Error in counter incrementer process!", ex)
-            shutdown_gently()
-            raise
-
-    shutdown_gently()
-
-
-def counter_checker(tester, to_verify_queue, verification_done_queue):
-    """
-    Process for checking counters continuously.
-
-    Pulls from a queue written to by counter_incrementer to know what to verify.
-
-    Pushes to a queue to tell counter_incrementer what's been verified and could be a candidate for incrementing again.
-
-    Intended to be run using multiprocessing.
-    """
-    # 'tester' is a cloned object so we shouldn't be inappropriately sharing anything with another process
-    session = tester.patient_cql_connection(tester.node1, keyspace="upgrade", protocol_version=tester.protocol_version)
-
-    running = True
-
-    prepared = session.prepare("SELECT c FROM countertable WHERE k1=?")
-    prepared.consistency_level = ConsistencyLevel.QUORUM
-
-    def handle_sigterm(signum, frame):
-        nonlocal running
-        running = False
-
-    def shutdown_gently():
-        logger.info("Counter checker process terminating, closing queues")
-        to_verify_queue.close()
-        verification_done_queue.close()
-        session.shutdown()
-
-    signal.signal(signal.SIGTERM, handle_sigterm)
-
-    while running:
-        try:
-            # here we could block, but if the writer process terminates early with an empty queue
-            # we would end up blocking indefinitely
-            (key, expected_count) = to_verify_queue.get_nowait()
-
-            actual_count = session.execute(prepared, (key,))[0][0]
-        except Empty:
-            time.sleep(0.1)  # let's not eat CPU if the queue is empty
-            continue
-        except DriverException as dex:
-            if "ID mismatch while trying to reprepare" in str(dex):
-                time.sleep(1)  # Pstmnt id mismatch, retry. See CASSANDRA-15252/17140
-                continue
-            else:
-                logger.error("Error in counter verifier process!", dex)
-                shutdown_gently()
-                raise
-        except Exception as ex:
-            logger.error("Error in counter verifier process!", ex)
-            shutdown_gently()
-            raise
-        else:
-            tester.assertEqual(expected_count, actual_count, "Data did not match expected value!")
-
-            try:
-                verification_done_queue.put_nowait((key, actual_count))
-            except Full:
-                # the rewritable queue is full, not a big deal. drop this one.
-                # we keep the rewritable queue held to a modest max size
-                # and allow dropping some rewritables because we don't want to
-                # rewrite rows in the same sequence as originally written
-                pass
-
-    shutdown_gently()
-
-
 @pytest.mark.upgrade_test
 @pytest.mark.resource_intensive
 @pytest.mark.skip("Fake skip so that this isn't run outside of a generated class that removes this annotation")
@@ -305,6 +42,10 @@ class TestUpgrade(Tester):
     test_version_metas = None  # set on init to know which versions to use
     subprocs = None  # holds any subprocesses, for status checking and cleanup
     extra_config = None  # holds a non-mutable structure that can be cast as dict()
+    load_writers = 2  # writer processes of the continuous load of rolling upgrades
+    load_checkers = 2  # checker processes of the continuous load of rolling upgrades
+    load_in_flight = 32  # asynchronous requests in flight per load process
+    load_max_error_rate = 0.01  # highest rate of timed out operations in any phase of the continuous load
 
     @pytest.fixture(autouse=True)
     def fixture_add_additional_log_patterns(self, fixture_dtest_setup):
@@ -328,7 +69,7 @@ class TestUpgrade(Tester):
         logger.debug("Upgrade test beginning, setting CASSANDRA_VERSION to {}, and jdk to {}. (Prior values will be restored after test)."
               .format(self.test_version_metas[0].version, self.test_version_metas[0].java_version))
         cluster = self.cluster
-        cluster.set_install_dir(version=self.test_version_metas[0].version)
+        set_install_dir(cluster, self.test_version_metas[0].version)
         self.install_nodetool_legacy_parsing()
         self.fixture_dtest_setup.reinitialize_cluster_for_different_version()
         logger.debug("Versions to test (%s): %s" % (type(self), str([v.version for v in self.test_version_metas])))
@@ -374,7 +115,7 @@ class TestUpgrade(Tester):
         # Record the rows we write as we go:
         if populate:
             self.prepare()
-        self.row_values = set()
+        self.dataset = Dataset(seed=0)
         cluster = self.cluster
         if cluster.version() >= '3.0':
             cluster.set_configuration_options({'enable_user_defined_functions': 'true',
@@ -412,7 +153,7 @@ class TestUpgrade(Tester):
 
         if rolling:
             # start up processes to write and verify data
-            write_proc, verify_proc, verification_queue = self._start_continuous_write_and_verify(wait_for_rowcount=5000)
+            load = self._start_continuous_write_and_verify(wait_for_rowcount=5000)
 
             # upgrade through versions
             for version_meta in self.test_version_metas[1:]:
@@ -430,21 +171,24 @@ class TestUpgrade(Tester):
                     # possibly "speed past" in an overly fast upgrade test
                     time.sleep(60)
 
+                    load.phase('upgrading {} to {}'.format(node.name, version_meta.version))
                     self.upgrade_to_version(version_meta, partial=True, nodes=(node,), internode_ssl=internode_ssl)
+                    load.phase('upgraded {} to {}'.format(node.name, version_meta.version))
 
-                    self._check_on_subprocs(self.fixture_dtest_setup.subprocs)
+                    load.check_alive()
                     logger.debug('Successfully upgraded %d of %d nodes to %s' %
                           (num + 1, len(self.cluster.nodelist()), version_meta.version))
-                self.cluster.set_install_dir(version=version_meta.version)
+                set_install_dir(self.cluster, version_meta.version)
                 self.install_nodetool_legacy_parsing()
                 self.fixture_dtest_setup.reinitialize_cluster_for_different_version()
 
-            # Stop write processes
-            write_proc.terminate()
-            # wait for the verification queue's to empty (and check all rows) before continuing
-            self._check_on_subprocs([verify_proc])  # make sure the verification processes are running still
-            self._wait_until_queue_condition('writes pending verification', verification_queue, operator.le, 0, max_wait_s=1200)
-            self._check_on_subprocs([verify_proc])  # make sure the verification processes are running still
+            # stop writing and wait for every pending write to be checked before continuing
+            load.phase('after upgrade')
+            report = load.stop(drain_timeout=1200)
+            logger.info("Load during the rolling upgrade:\n{}".format(report))
+            for stats in report.summary():
+                assert stats.error_rate <= self.load_max_error_rate, \
+                    "{} of {} {}s failed in phase '{}':\n{}".format(stats.errors, stats.count, stats.operation, stats.phase, report)
 
             self._terminate_subprocs()
         # not a rolling upgrade, do everything in parallel:
@@ -455,7 +199,7 @@ class TestUpgrade(Tester):
                 self._increment_counters()
 
                 self.upgrade_to_version(version_meta, internode_ssl=internode_ssl)
-                self.cluster.set_install_dir(version=version_meta.version)
+                set_install_dir(self.cluster, version_meta.version)
                 self.install_nodetool_legacy_parsing()
                 self.fixture_dtest_setup.reinitialize_cluster_for_different_version()
 
@@ -478,21 +222,6 @@ class TestUpgrade(Tester):
 
         super(TestUpgrade, self).tearDown()
 
-    def _check_on_subprocs(self, subprocs):
-        """
-        Check on given subprocesses.
-
-        If any are not alive, we'll go ahead and terminate any remaining alive subprocesses since this test is going to fail.
-        """
-        subproc_statuses = [s.is_alive() for s in subprocs]
-        if not all(subproc_statuses):
-            message = "A subprocess has terminated early. Subprocess statuses: "
-            for s in subprocs:
-                message += "{name} (is_alive: {aliveness}), ".format(name=s.name, aliveness=s.is_alive())
-            message += "attempting to terminate remaining subprocesses now."
-            self._terminate_subprocs()
-            raise RuntimeError(message)
-
     def _terminate_subprocs(self):
         for s in self.fixture_dtest_setup.subprocs:
             if s.is_alive():
@@ -521,7 +250,7 @@ class TestUpgrade(Tester):
             node.stop(wait_other_notice=False)
 
         for node in nodes:
-            node.set_install_dir(version=version_meta.version)
+            set_install_dir(node, version_meta.version)
             self.install_legacy_parsing(node)
             logger.debug("Set new cassandra dir for %s: %s" % (node.name, node.get_install_dir()))
             if internode_ssl and (LooseVersion(version_meta.family) >= CASSANDRA_4_0):
@@ -594,111 +323,51 @@ class TestUpgrade(Tester):
     def _write_values(self, num=100):
         session = self.patient_cql_connection(self.node2, protocol_version=self.protocol_version)
         session.execute("use upgrade")
-        for i in range(num):
-            x = len(self.row_values) + 1
-            session.execute("UPDATE cf SET v='%d' WHERE k=%d" % (x, x))
-            self.row_values.add(x)
+        start = self.dataset.count
+        self.dataset = self.dataset.extend(num)
+        insert = session.prepare("UPDATE cf SET v=? WHERE k=?")
+        BulkLoader(session).load(insert, ((v, k) for k, v in self.dataset.rows(start, num)))
 
     def _check_values(self, consistency_level=ConsistencyLevel.ALL):
         for node in self.cluster.nodelist():
             session = self.patient_cql_connection(node, protocol_version=self.protocol_version)
             session.execute("use upgrade")
-            for x in self.row_values:
-                query = SimpleStatement("SELECT k,v FROM cf WHERE k=%d" % x, consistency_level=consistency_level)
-                result = session.execute(query)
-                k, v = result[0]
-                assert x == k
-                assert str(x) == v
-
-    def _wait_until_queue_condition(self, label, queue, opfunc, required_len, max_wait_s=600):
-        """
-        Waits up to max_wait_s for queue size to return True when evaluated against a condition function from the operator module.
-
-        Label is just a string identifier for easier debugging.
+            result = verify_dataset(session, 'cf', self.dataset, key_column='k', value_column='v',
+                                    consistency_level=consistency_level)
+            assert result.ok, str(result)
 
-        On Mac OS X may not be able to check queue size, in which case it will not block.
-
-        If time runs out, raises RuntimeError.
+    def _start_load(self, workload, wait_for_rowcount=0, max_wait_s=600):
         """
-        wait_end_time = time.time() + max_wait_s
-
-        while time.time() < wait_end_time:
-            try:
-                qsize = queue.qsize()
-            except NotImplementedError:
-                logger.debug("Queue size may not be checkable on Mac OS X. Test will continue without waiting.")
-                break
-            if opfunc(qsize, required_len):
-                logger.debug("{} queue size ({}) is '{}' to {}. Continuing.".format(label, qsize, opfunc.__name__, required_len))
-                break
-
-            if divmod(round(time.time()), 30)[1] == 0:
-                logger.debug("{} queue size is at {}, target is to reach '{}' {}".format(label, qsize, opfunc.__name__, required_len))
+        Starts load_writers writer processes and load_checkers checker processes running workload
+        through node1, and waits for wait_for_rowcount acknowledged writes before returning the
+        ContinuousLoad.
+        """
+        session_factory = functools.partial(self.patient_cql_connection, self.node1, keyspace="upgrade",
+                                            protocol_version=self.protocol_version)
+        load = ContinuousLoad(session_factory, workload, writers=self.load_writers, checkers=self.load_checkers,
+                              in_flight=self.load_in_flight, rewrite_probability=0.25, phase='before upgrade')
+        load.start()
+        self.fixture_dtest_setup.subprocs.extend(load.processes)
 
-            time.sleep(0.1)
-            continue
-        else:
-            raise RuntimeError("Ran out of time waiting for queue size ({}) to be '{}' to {}. Aborting.".format(qsize, opfunc.__name__, required_len))
+        if wait_for_rowcount > 0:
+            load.wait_for_writes(wait_for_rowcount, timeout=max_wait_s)
+        return load
 
     def _start_continuous_write_and_verify(self, wait_for_rowcount=0, max_wait_s=600):
         """
-        Starts a writer process, a verifier process, a queue to track writes,
-        and a queue to track successful verifications (which are rewrite candidates).
+        Starts processes writing values continuously and processes checking every write.
 
-        wait_for_rowcount provides a number of rows to write before unblocking and continuing.
-
-        Returns the writer process, verifier process, and the to_verify_queue.
+        @return The ContinuousLoad
         """
-        # queue of writes to be verified
-        to_verify_queue = Queue(10000)
-        # queue of verified writes, which are update candidates
-        verification_done_queue = Queue(maxsize=500)
-
-        writer = Process(target=data_writer, args=(self, to_verify_queue, verification_done_queue, 25))
-        # daemon subprocesses are killed automagically when the parent process exits
-        writer.daemon = True
-        self.fixture_dtest_setup.subprocs.append(writer)
-        writer.start()
-
-        if wait_for_rowcount > 0:
-            self._wait_until_queue_condition('rows written (but not verified)', to_verify_queue, operator.ge, wait_for_rowcount, max_wait_s=max_wait_s)
-
-        verifier = Process(target=data_checker, args=(self, to_verify_queue, verification_done_queue))
-        # daemon subprocesses are killed automagically when the parent process exits
-        verifier.daemon = True
-        self.fixture_dtest_setup.subprocs.append(verifier)
-        verifier.start()
-
-        return writer, verifier, to_verify_queue
+        return self._start_load(VALUES_WORKLOAD, wait_for_rowcount, max_wait_s)
 
     def _start_continuous_counter_increment_and_verify(self, wait_for_rowcount=0, max_wait_s=600):
         """
-        Starts a counter incrementer process, a verifier process, a queue to track writes,
-        and a queue to track successful verifications (which are re-increment candidates).
+        Starts processes incrementing counters continuously and processes checking every increment.
 
-        Returns the writer process, verifier process, and the to_verify_queue.
+        @return The ContinuousLoad
         """
-        # queue of writes to be verified
-        to_verify_queue = Queue()
-        # queue of verified writes, which are update candidates
-        verification_done_queue = Queue(maxsize=500)
-
-        incrementer = Process(target=data_writer, args=(self, to_verify_queue, verification_done_queue, 25))
-        # daemon subprocesses are killed automagically when the parent process exits
-        incrementer.daemon = True
-        self.fixture_dtest_setup.subprocs.append(incrementer)
-        incrementer.start()
-
-        if wait_for_rowcount > 0:
-            self._wait_until_queue_condition('counters incremented (but not verified)', to_verify_queue, operator.ge, wait_for_rowcount, max_wait_s=max_wait_s)
-
-        count_verifier = Process(target=data_checker, args=(self, to_verify_queue, verification_done_queue))
-        # daemon subprocesses are killed automagically when the parent process exits
-        count_verifier.daemon = True
-        self.fixture_dtest_setup.subprocs.append(count_verifier)
-        count_verifier.start()
-
-        return incrementer, count_verifier, to_verify_queue
+        return self._start_load(COUNTERS_WORKLOAD, wait_for_rowcount, max_wait_s)
 
     def _increment_counters(self, opcount=25000):
         logger.debug("performing {opcount} counter increments".format(opcount=opcount))
@@ -754,7 +423,7 @@ class TestUpgrade(Tester):
         session = self.patient_cql_connection(self.node2, protocol_version=self.protocol_version)
         session.execute("use upgrade;")
 
-        expected_num_rows = len(self.row_values)
+        expected_num_rows = self.dataset.count
 
         countquery = SimpleStatement("SELECT COUNT(*) FROM cf;", consistency_level=consistency_level)
         result = session.execute(countquery)
@@ -938,6 +607,7 @@ MULTI_UPGRADES = (
     #              )),
 )
 
+multi_upgrade_metas = []
 for upgrade in MULTI_UPGRADES:
     # if any version_metas are None, this means they are versions not to be tested currently
     if all(upgrade.version_metas):
@@ -951,8 +621,11 @@ for upgrade in MULTI_UPGRADES:
                 logger.debug("{} appears applicable to current env. Overriding final test version from {} to {}".format(upgrade.name, oldmeta.version, newmeta.version))
                 metas[-1] = newmeta
                 create_upgrade_class(upgrade.name, [m for m in metas], protocol_version=upgrade.protocol_version, extra_config=upgrade.extra_config)
+                multi_upgrade_metas.extend(metas)
         else:
             create_upgrade_class(upgrade.name, [m for m in metas], protocol_version=upgrade.protocol_version, extra_config=upgrade.extra_config)
+            multi_upgrade_metas.extend(metas)
+stage_upgrade_versions(multi_upgrade_metas)
 
 
 for pair in build_upgrade_pairs():